@@ -0,0 +1,349 @@
+"""
+Incrementally maintained watchlist aggregates.
+
+Totals are kept per user. The crud write functions call the ``record_*``
+helpers inside their own transaction, so the totals commit (or roll back)
+together with the watchlist entry. ``rebuild`` recomputes everything from the
+watchlist entries and ``verify`` reports drift between the two, for every user:
+
+    python -m app.aggregates verify
+    python -m app.aggregates rebuild
+"""
+import logging
+import sys
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, case, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import models
+
+logger = logging.getLogger(__name__)
+
+def genre_order(db: Session, column):
+    # Break count ties by codepoint order, like pandas Series.mode() does;
+    # PostgreSQL would otherwise sort with the database's locale collation
+    if db.get_bind().dialect.name == "postgresql":
+        return column.collate("C")
+    return column
+
+
+def _upsert_insert(db: Session):
+    # Dialect insert() with ON CONFLICT DO UPDATE, or None when unsupported
+    return {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(db.get_bind().dialect.name)
+
+
+def _update_or_insert(db: Session, update: Callable[[], int], table, values: Dict[str, Any]) -> None:
+    # UPDATE-then-INSERT for dialects without ON CONFLICT; a concurrent
+    # writer may insert the row first, in which case the UPDATE is retried
+    if update():
+        return
+    try:
+        # Savepoint so losing the race keeps the outer transaction
+        with db.begin_nested():
+            db.execute(insert(table).values(**values))
+    except IntegrityError:
+        update()
+
+
+def _bump_stats(
+    db: Session, user_id: str, total: int = 0, watched: int = 0, rating_sum: float = 0.0, rating_count: int = 0
+) -> None:
+    Stats = models.WatchlistStats
+    changes = {
+        Stats.total_movies: Stats.total_movies + total,
+        Stats.number_watched: Stats.number_watched + watched,
+        Stats.rating_sum: Stats.rating_sum + rating_sum,
+        Stats.rating_count: Stats.rating_count + rating_count,
+        Stats.version: Stats.version + 1,
+    }
+    first = {
+        "user_id": user_id,
+        "total_movies": total,
+        "number_watched": watched,
+        "rating_sum": rating_sum,
+        "rating_count": rating_count,
+        "version": 1,
+    }
+    upsert = _upsert_insert(db)
+    if upsert is not None:
+        stmt = upsert(Stats).values(**first)
+        db.execute(stmt.on_conflict_do_update(index_elements=[Stats.user_id], set_=changes))
+        return
+    _update_or_insert(
+        db,
+        lambda: db.query(Stats).filter(Stats.user_id == user_id).update(changes, synchronize_session=False),
+        Stats,
+        first,
+    )
+
+
+def _bump_genre(db: Session, user_id: str, genre: Optional[str], delta: int) -> None:
+    if genre is None:
+        return
+    Genre = models.GenreCount
+    mine = (Genre.user_id == user_id, Genre.genre == genre)
+    changes = {Genre.movie_count: Genre.movie_count + delta}
+    if delta < 0:
+        db.query(Genre).filter(*mine).update(changes, synchronize_session=False)
+        db.query(Genre).filter(*mine, Genre.movie_count <= 0).delete(synchronize_session=False)
+        return
+    upsert = _upsert_insert(db)
+    if upsert is not None:
+        stmt = upsert(Genre).values(user_id=user_id, genre=genre, movie_count=delta)
+        db.execute(stmt.on_conflict_do_update(index_elements=[Genre.user_id, Genre.genre], set_=changes))
+        return
+    _update_or_insert(
+        db,
+        lambda: db.query(Genre).filter(*mine).update(changes, synchronize_session=False),
+        Genre,
+        {"user_id": user_id, "genre": genre, "movie_count": delta},
+    )
+
+
+def record_added(db: Session, entry: models.WatchlistEntry) -> None:
+    has_rating = entry.rating is not None
+    _bump_stats(
+        db,
+        entry.user_id,
+        total=1,
+        watched=1 if entry.watched else 0,
+        rating_sum=entry.rating if has_rating else 0.0,
+        rating_count=1 if has_rating else 0,
+    )
+    _bump_genre(db, entry.user_id, entry.genre, 1)
+
+
+def record_added_many(db: Session, entries: List[models.WatchlistEntry]) -> None:
+    """Batched record_added: per user, one stats update plus one update per distinct genre."""
+    by_user: Dict[str, List[models.WatchlistEntry]] = {}
+    for entry in entries:
+        by_user.setdefault(entry.user_id, []).append(entry)
+    for user_id, mine in by_user.items():
+        ratings = [e.rating for e in mine if e.rating is not None]
+        _bump_stats(
+            db,
+            user_id,
+            total=len(mine),
+            watched=sum(1 for e in mine if e.watched),
+            rating_sum=sum(ratings),
+            rating_count=len(ratings),
+        )
+        for genre, count in Counter(e.genre for e in mine if e.genre is not None).items():
+            _bump_genre(db, user_id, genre, count)
+
+
+def record_removed(db: Session, entry: models.WatchlistEntry) -> None:
+    has_rating = entry.rating is not None
+    _bump_stats(
+        db,
+        entry.user_id,
+        total=-1,
+        watched=-1 if entry.watched else 0,
+        rating_sum=-entry.rating if has_rating else 0.0,
+        rating_count=-1 if has_rating else 0,
+    )
+    _bump_genre(db, entry.user_id, entry.genre, -1)
+
+
+def record_watched_changed(db: Session, user_id: str, watched: bool) -> None:
+    _bump_stats(db, user_id, watched=1 if watched else -1)
+
+
+def record_movies_changed(db: Session, ratings: Dict[int, Tuple[Optional[float], Optional[float]]]) -> None:
+    """
+    Catalog movies changed (``{movie_id: (old rating, new rating)}``): move the
+    rating totals and bump the version of every user who saved one of them.
+    """
+    if not ratings:
+        return
+    Entry = models.WatchlistEntry
+    deltas: Dict[str, List[float]] = {}
+    holders = db.query(Entry.user_id, Entry.movie_id).filter(Entry.movie_id.in_(list(ratings)))
+    for user_id, movie_id in holders:
+        old, new = ratings[movie_id]
+        delta = deltas.setdefault(user_id, [0.0, 0])
+        delta[0] += (new or 0.0) - (old or 0.0)
+        delta[1] += (new is not None) - (old is not None)
+    for user_id, (rating_sum, rating_count) in deltas.items():
+        _bump_stats(db, user_id, rating_sum=rating_sum, rating_count=rating_count)
+
+
+def record_changed(db: Session, user_id: Optional[str] = None) -> None:
+    """
+    Bump the watchlist version for a write that leaves the totals as they are.
+
+    Without a ``user_id`` (a catalog-wide change) every user's version moves.
+    """
+    if user_id is not None:
+        _bump_stats(db, user_id)
+        return
+    Stats = models.WatchlistStats
+    db.query(Stats).update({Stats.version: Stats.version + 1}, synchronize_session=False)
+
+
+def read_version(db: Session, user_id: str) -> int:
+    """The user's watchlist version: one primary-key lookup, no movies are read."""
+    Stats = models.WatchlistStats
+    version = db.query(Stats.version).filter(Stats.user_id == user_id).scalar()
+    return version or 0
+
+
+def read_totals(db: Session, user_id: str) -> Dict[str, Any]:
+    """Read the user's stored totals: two primary-key/indexed lookups, independent of table size."""
+    stats = db.get(models.WatchlistStats, user_id)
+    Genre = models.GenreCount
+    top = (
+        db.query(Genre.genre)
+        .filter(Genre.user_id == user_id, Genre.movie_count > 0)
+        .order_by(Genre.movie_count.desc(), genre_order(db, Genre.genre))
+        .first()
+    )
+    return {
+        "total_movies": stats.total_movies if stats else 0,
+        "number_watched": stats.number_watched if stats else 0,
+        "rating_sum": stats.rating_sum if stats else 0.0,
+        "rating_count": stats.rating_count if stats else 0,
+        "most_frequent_genre": top[0] if top else None,
+    }
+
+
+def _recompute(db: Session, user_id: str) -> Dict[str, Any]:
+    Entry, Movie = models.WatchlistEntry, models.Movie
+    total, watched, rating_sum, rating_count = (
+        db.query(
+            func.count(Entry.movie_id),
+            func.coalesce(func.sum(case((Entry.watched.is_(True), 1), else_=0)), 0),
+            func.coalesce(func.sum(Movie.rating), 0.0),
+            func.count(Movie.rating),
+        )
+        .select_from(Entry)
+        .join(Movie, Movie.id == Entry.movie_id)
+        .filter(Entry.user_id == user_id)
+        .one()
+    )
+    genres = dict(
+        db.query(Movie.genre, func.count(Entry.movie_id))
+        .select_from(Entry)
+        .join(Movie, Movie.id == Entry.movie_id)
+        .filter(Entry.user_id == user_id, Movie.genre.isnot(None))
+        .group_by(Movie.genre)
+        .all()
+    )
+    return {
+        "total_movies": total,
+        "number_watched": int(watched),
+        "rating_sum": float(rating_sum),
+        "rating_count": rating_count,
+        "genres": genres,
+    }
+
+
+def _stored(db: Session, user_id: str) -> Dict[str, Any]:
+    stats = db.get(models.WatchlistStats, user_id)
+    Genre = models.GenreCount
+    genres = dict(
+        db.query(Genre.genre, Genre.movie_count)
+        .filter(Genre.user_id == user_id, Genre.movie_count > 0)
+        .all()
+    )
+    return {
+        "total_movies": stats.total_movies if stats else 0,
+        "number_watched": stats.number_watched if stats else 0,
+        "rating_sum": stats.rating_sum if stats else 0.0,
+        "rating_count": stats.rating_count if stats else 0,
+        "genres": genres,
+    }
+
+
+def user_ids(db: Session) -> List[str]:
+    """Every user with watchlist entries or stored aggregates."""
+    entries = db.query(models.WatchlistEntry.user_id).distinct()
+    stored = db.query(models.WatchlistStats.user_id)
+    return sorted({user_id for (user_id,) in entries.union(stored).all()})
+
+
+def verify(db: Session, user_id: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Compare the user's stored aggregates with a fresh recompute.
+
+    Returns a mapping of field name to ``{"stored": ..., "actual": ...}`` for
+    every field that differs; an empty dict means no drift.
+    """
+    stored, actual = _stored(db, user_id), _recompute(db, user_id)
+    drift = {}
+    for field in ("total_movies", "number_watched", "rating_count", "genres"):
+        if stored[field] != actual[field]:
+            drift[field] = {"stored": stored[field], "actual": actual[field]}
+    # Incremental float sums pick up rounding error; only report meaningful drift
+    if abs(stored["rating_sum"] - actual["rating_sum"]) > 1e-6:
+        drift["rating_sum"] = {"stored": stored["rating_sum"], "actual": actual["rating_sum"]}
+    return drift
+
+
+def verify_all(db: Session) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """``verify`` for every user; only users whose aggregates drifted are listed."""
+    drifts = {user_id: verify(db, user_id) for user_id in user_ids(db)}
+    return {user_id: drift for user_id, drift in drifts.items() if drift}
+
+
+def rebuild(db: Session, user_id: str) -> Dict[str, Dict[str, Any]]:
+    """Recompute the user's aggregates from their watchlist, replacing what is stored."""
+    drift = verify(db, user_id)
+    actual = _recompute(db, user_id)
+    # Keep the version moving forward so ETags handed out before the rebuild stop matching
+    version = read_version(db, user_id) + 1
+
+    db.query(models.GenreCount).filter(models.GenreCount.user_id == user_id).delete(synchronize_session=False)
+    db.query(models.WatchlistStats).filter(models.WatchlistStats.user_id == user_id).delete(synchronize_session=False)
+    db.add(models.WatchlistStats(
+        user_id=user_id,
+        total_movies=actual["total_movies"],
+        number_watched=actual["number_watched"],
+        rating_sum=actual["rating_sum"],
+        rating_count=actual["rating_count"],
+        version=version,
+    ))
+    db.add_all(models.GenreCount(user_id=user_id, genre=g, movie_count=c) for g, c in actual["genres"].items())
+    db.commit()
+
+    if drift:
+        logger.warning(f"Watchlist aggregates of user {user_id!r} drifted and were rebuilt: {drift}")
+    return drift
+
+
+def rebuild_all(db: Session) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """``rebuild`` for every user; returns the drift corrected, by user."""
+    drifts = {user_id: rebuild(db, user_id) for user_id in user_ids(db)}
+    return {user_id: drift for user_id, drift in drifts.items() if drift}
+
+
+def main(argv) -> int:
+    from app.database import SessionLocal
+
+    if len(argv) != 1 or argv[0] not in ("rebuild", "verify"):
+        print("usage: python -m app.aggregates [rebuild|verify]")
+        return 2
+    if SessionLocal is None:
+        print("Database is not configured. DB_CONNECTION_STRING is missing.")
+        return 2
+
+    db = SessionLocal()
+    try:
+        if argv[0] == "rebuild":
+            drifts = rebuild_all(db)
+            print(f"Aggregates rebuilt ({len(drifts)} user(s) with drift corrected)")
+            return 0
+        drifts = verify_all(db)
+        for user_id, drift in drifts.items():
+            for field, values in drift.items():
+                print(f"{user_id}: {field}: stored={values['stored']} actual={values['actual']}")
+        print("Aggregates OK" if not drifts else "Aggregates drifted; run 'python -m app.aggregates rebuild'")
+        return 1 if drifts else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
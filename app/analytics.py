@@ -1,19 +1,41 @@
 # app/analytics.py
 from sqlalchemy.orm import Session
-import pandas as pd
+from sqlalchemy import func
+from collections import Counter
+import importlib
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from app.schemas import AnalyticsResponse
-from . import crud
+from app import config
+from . import crud, aggregates, models, genres
 
 logger = logging.getLogger(__name__)
 
-def compute_movie_stats(db: Session) -> Dict[str, Optional[float | str | int]]:
+# pandas (and numpy under it) costs hundreds of ms and tens of MB at import, so it
+# is only loaded the first time the pandas backend actually runs
+_pandas = None
+
+def _load_pandas():
+    """The pandas module, or None when it is not installed."""
+    global _pandas
+    if _pandas is None:
+        try:
+            _pandas = importlib.import_module("pandas")
+        except ImportError:
+            logger.warning("pandas is not installed; analytics falls back to the pure-Python backend")
+            _pandas = False
+    return _pandas or None
+
+def compute_movie_stats(db: Session, user_id: str) -> Dict[str, Optional[float | str | int]]:
     """
-    Compute movie insights for analytics endpoint.
+    Compute movie insights of one user's watchlist for analytics endpoint.
+    
+    The backend is chosen by the ANALYTICS_BACKEND setting; every backend
+    returns the same values.
     
     Args:
         db: Database session
+        user_id: Owner of the watchlist
         
     Returns:
         Dictionary with analytics data:
@@ -22,8 +44,73 @@ def compute_movie_stats(db: Session) -> Dict[str, Optional[float | str | int]]:
         - number_watched (int): Count of movies marked as watched
         - total_movies (int): Total number of movies in watchlist
     """
+    if config.ANALYTICS_BACKEND == "incremental":
+        return _compute_from_aggregates(db, user_id)
+    if config.ANALYTICS_BACKEND == "sql":
+        return _compute_with_sql(db, user_id)
+    if config.ANALYTICS_BACKEND == "python":
+        return _compute_with_python(db, user_id)
+    return _compute_with_pandas(db, user_id)
+
+def round_rating(value: float) -> float:
+    # Same arithmetic as numpy's round (scale, round half to even, unscale), so
+    # every backend rounds exactly like the pandas path
+    return round(value * 100) / 100
+
+def _compute_from_aggregates(db: Session, user_id: str) -> Dict[str, Optional[float | str | int]]:
+    """Read the incrementally maintained totals (O(1) in the number of movies)."""
+    totals = aggregates.read_totals(db, user_id)
+    rating_count = totals["rating_count"]
+    return {
+        "average_rating": round_rating(totals["rating_sum"] / rating_count) if rating_count else None,
+        "most_frequent_genre": totals["most_frequent_genre"],
+        "number_watched": totals["number_watched"],
+        "total_movies": totals["total_movies"]
+    }
+
+def _compute_with_sql(db: Session, user_id: str) -> Dict[str, Optional[float | str | int]]:
+    """Push the aggregation down to the database; no Movie rows are loaded."""
+    Entry, Movie = models.WatchlistEntry, models.Movie
+    total_movies, number_watched, average = (
+        db.query(
+            func.count(Entry.movie_id),
+            func.count(Entry.movie_id).filter(Entry.watched.is_(True)),
+            func.avg(Movie.rating),
+        )
+        .select_from(Entry)
+        .join(Movie, Movie.id == Entry.movie_id)
+        .filter(Entry.user_id == user_id)
+        .one()
+    )
+
+    top_genre = (
+        db.query(Movie.genre)
+        .select_from(Entry)
+        .join(Movie, Movie.id == Entry.movie_id)
+        .filter(Entry.user_id == user_id, Movie.genre.isnot(None))
+        .group_by(Movie.genre)
+        .order_by(func.count(Entry.movie_id).desc(), aggregates.genre_order(db, Movie.genre))
+        .limit(1)
+        .scalar()
+    )
+
+    return {
+        "average_rating": round_rating(float(average)) if average is not None else None,
+        "most_frequent_genre": top_genre,
+        "number_watched": number_watched,
+        "total_movies": total_movies
+    }
+
+def _compute_with_pandas(db: Session, user_id: str) -> Dict[str, Optional[float | str | int]]:
+    """Load every movie into a DataFrame and compute the stats from it."""
+    pd = _load_pandas()
+    if pd is None:
+        return _compute_with_python(db, user_id)
+    # Needs numpy, so only imported once pandas has loaded it
+    from app import ranking
+
     # Fetch all movies from DB
-    movies = crud.get_all_movies(db)
+    movies = crud.get_all_movies(db, user_id)
     
     # Handle empty database early
     if not movies:
@@ -47,10 +134,9 @@ def compute_movie_stats(db: Session) -> Dict[str, Optional[float | str | int]]:
     ratings = df["rating"].dropna()
     average_rating = round(ratings.mean(), 2) if not ratings.empty else None
     
-    # Calculate most frequent genre (excluding None/NaN values)
-    genres = df["genre"].dropna()
-    genre_mode = genres.mode()
-    most_frequent_genre = genre_mode[0] if len(genre_mode) > 0 else None
+    # Calculate most frequent genre (excluding None/NaN values); one hash
+    # count, ties to the alphabetically first genre like Series.mode()
+    most_frequent_genre = ranking.most_frequent(df["genre"])
     
     # Count watched movies (convert to int to ensure JSON serialization)
     number_watched = int(df["watched"].sum())
@@ -69,3 +155,40 @@ def compute_movie_stats(db: Session) -> Dict[str, Optional[float | str | int]]:
         "number_watched": number_watched,
         "total_movies": total_movies
     }
+
+def _compute_with_python(db: Session, user_id: str) -> Dict[str, Optional[float | str | int]]:
+    """The pandas computation in plain Python, for installs without pandas."""
+    movies = crud.get_all_movies(db, user_id)
+
+    ratings = [m.rating for m in movies if m.rating is not None]
+    genre_counts = Counter(m.genre for m in movies if m.genre is not None)
+    most_frequent_genre = None
+    if genre_counts:
+        # Series.mode() lists tied values sorted, and the pandas path takes the first
+        top = max(genre_counts.values())
+        most_frequent_genre = min(genre for genre, count in genre_counts.items() if count == top)
+
+    return {
+        "average_rating": round_rating(sum(ratings) / len(ratings)) if ratings else None,
+        "most_frequent_genre": most_frequent_genre,
+        "number_watched": sum(1 for m in movies if m.watched),
+        "total_movies": len(movies)
+    }
+
+def compute_genre_stats(db: Session, user_id: str) -> List[Dict[str, Optional[float | str | int]]]:
+    """
+    Per-genre insights of one user's watchlist from the normalized genre tables.
+    
+    A movie tagged "Action, Crime" counts towards both genres.
+    
+    Returns:
+        List of dictionaries, most common genre first:
+        - genre (str): Genre name
+        - movie_count (int): Number of movies tagged with the genre
+        - average_rating (float | None): Mean rating of those movies, rounded to 2 decimals
+    """
+    stats = genres.genre_stats(db, user_id)
+    for row in stats:
+        if row["average_rating"] is not None:
+            row["average_rating"] = round_rating(row["average_rating"])
+    return stats
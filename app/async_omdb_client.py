@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import httpx
+from typing import List, Dict, Any, Optional
+from app import omdb_cache, omdb_client, omdb_guard, omdb_latency, http_pool, singleflight
+from app.config import (
+    OMDB_POOL_MAXSIZE,
+    OMDB_HTTP_KEEPALIVE,
+    OMDB_ASYNC_MAX_CONNECTIONS,
+    OMDB_KEEPALIVE_EXPIRY,
+    OMDB_TIMEOUT_MAX,
+)
+
+logger = logging.getLogger(__name__)
+
+# Non-blocking counterpart of omdb_client. Shares its response cache and payload
+# handling; only the transport differs, so one worker can keep many calls in flight.
+# The cache's memory tier is read inline, its SQLite tier in a worker thread.
+http_stats = http_pool.ConnectionStats()
+flight = singleflight.AsyncSingleFlight()
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def _trace(event_name: str, info: Dict[str, Any]) -> None:
+    if event_name == "connection.connect_tcp.complete":
+        http_stats.record_connection()
+
+
+def open_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        limits = httpx.Limits(
+            max_connections=OMDB_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=OMDB_POOL_MAXSIZE if OMDB_HTTP_KEEPALIVE else 0,
+            keepalive_expiry=OMDB_KEEPALIVE_EXPIRY,
+        )
+        _client = httpx.AsyncClient(limits=limits, timeout=OMDB_TIMEOUT_MAX, transport=transport)
+        logger.debug(f"Opened async OMDb client (max_connections={OMDB_ASYNC_MAX_CONNECTIONS})")
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+async def _send(params: Dict[str, Any]) -> httpx.Response:
+    """One request. Same limits as the sync client (shared per process); waiting for a token does not block the loop."""
+    if omdb_latency.deadline_passed():
+        raise httpx.TimeoutException("Request deadline passed before OMDb was called")
+    wait = await omdb_guard.admit_async()
+    attempt = omdb_latency.Attempt()
+    try:
+        if wait:
+            await asyncio.sleep(wait)
+        client = _client or open_client()
+        http_stats.record_request()
+        response = await client.get(
+            omdb_client.OMDB_API_URL,
+            params=params,
+            timeout=attempt.start(),
+            extensions={"trace": _trace},
+        )
+    except httpx.HTTPError as e:
+        attempt.failed(timed_out=isinstance(e, httpx.TimeoutException))
+        raise
+    except asyncio.CancelledError:
+        attempt.cancelled()
+        raise
+    attempt.answered()
+    await omdb_guard.record_response_async(response)
+    return response
+
+
+async def _attempt(params: Dict[str, Any]) -> httpx.Response:
+    """_send, hedged when enabled: past the observed p95 a second request goes out and the first answer wins."""
+    delay = omdb_latency.hedge_delay()
+    if delay is None:
+        return await _send(params)
+    primary = asyncio.ensure_future(_send(params))
+    hedge: Optional[asyncio.Future] = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if not done:
+            hedge = asyncio.ensure_future(_send(params))
+            done, _ = await asyncio.wait({primary, hedge}, return_when=asyncio.FIRST_COMPLETED)
+            if all(task.exception() is not None for task in done):
+                # The first to finish failed (the hedge may only have been refused by omdb_guard)
+                await asyncio.wait({primary, hedge})
+            winner = next((task for task in (primary, hedge) if task.done() and task.exception() is None), None)
+            if winner is not None:
+                omdb_latency.call_stats.record_hedge(won=winner is hedge)
+                return winner.result()
+        return primary.result()
+    finally:
+        for task in (primary, hedge):
+            if task is None:
+                continue
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Mark a loser's error as retrieved
+                task.exception()
+
+
+async def _get(params: Dict[str, Any]) -> httpx.Response:
+    """omdb_client._get over _attempt: the same retries, sleeping without blocking the loop."""
+    retries = omdb_latency.Retries()
+    while True:
+        try:
+            delay = retries.backoff(response=await _attempt(params))
+        except omdb_guard.OMDbUnavailable as e:
+            retries.refused(e)
+            break
+        except httpx.TransportError as e:
+            delay = retries.backoff(error=e)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+    return retries.result()
+
+
+async def search_movies(title: str, page: int = 1) -> List[Dict[str, Any]]:
+    key = omdb_cache.search_key(title, page)
+    cached = await omdb_client.cache.get_async(key)
+    if cached is not omdb_cache.MISS:
+        logger.debug(f"Cache hit for search '{title}'")
+        return cached
+
+    return await flight.do(key, lambda: _search_upstream(title, page, key))
+
+
+async def _search_upstream(title: str, page: int, key: str) -> List[Dict[str, Any]]:
+    with omdb_client.observe_lookup("search", title, httpx.TimeoutException, httpx.HTTPError) as lookup:
+        response = await _get(omdb_client.search_params(title, page))
+        response.raise_for_status()
+        results, ttl = omdb_client.search_result(title, response.json())
+        await omdb_client.cache.set_async(key, results, ttl)
+        lookup.outcome = "ok" if results else "not_found"
+        return results
+
+
+async def fetch_movie_by_id(imdb_id: str) -> Optional[Dict[str, Any]]:
+    key = omdb_cache.detail_key(imdb_id)
+    cached = await omdb_client.cache.get_async(key)
+    if cached is not omdb_cache.MISS:
+        logger.debug(f"Cache hit for movie '{imdb_id}'")
+        return cached
+
+    return await flight.do(key, lambda: _fetch_upstream(imdb_id, key))
+
+
+async def refetch_movie_by_id(imdb_id: str) -> Optional[Dict[str, Any]]:
+    """fetch_movie_by_id without reading the cache; the fresh payload replaces the cached one."""
+    key = omdb_cache.detail_key(imdb_id)
+    return await flight.do(key, lambda: _fetch_upstream(imdb_id, key))
+
+
+async def _fetch_upstream(imdb_id: str, key: str) -> Optional[Dict[str, Any]]:
+    with omdb_client.observe_lookup("detail", imdb_id, httpx.TimeoutException, httpx.HTTPError) as lookup:
+        response = await _get(omdb_client.detail_params(imdb_id))
+        response.raise_for_status()
+        movie, ttl = omdb_client.detail_result(imdb_id, response.json())
+        await omdb_client.cache.set_async(key, movie, ttl)
+        lookup.outcome = "ok" if movie else "not_found"
+        return movie
+
+
+def connection_stats() -> Dict[str, float]:
+    return http_stats.snapshot()
+
+
+def coalescing_stats() -> Dict[str, int]:
+    return flight.stats()
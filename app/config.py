@@ -4,4 +4,91 @@ import os
 load_dotenv()
 
 DB_CONNECTION_STRING = os.getenv("DB_CONNECTION_STRING")
-OMDB_API_KEY = os.getenv("OMDB_API_KEY")
\ No newline at end of file
+OMDB_API_KEY = os.getenv("OMDB_API_KEY")
+# Point at a local stand-in (benchmarks/fake_omdb.py) for load tests
+OMDB_API_URL = os.getenv("OMDB_API_URL", "https://www.omdbapi.com/")
+
+# OMDb response cache (in-process LRU backed by a shared SQLite file).
+# Set OMDB_CACHE_PATH to an empty string to disable the on-disk tier.
+OMDB_CACHE_ENABLED = os.getenv("OMDB_CACHE_ENABLED", "true").lower() == "true"
+OMDB_CACHE_PATH = os.getenv("OMDB_CACHE_PATH", ".cache/omdb_cache.sqlite3")
+OMDB_CACHE_MAX_ENTRIES = int(os.getenv("OMDB_CACHE_MAX_ENTRIES", "1024"))
+OMDB_CACHE_DISK_MAX_ENTRIES = int(os.getenv("OMDB_CACHE_DISK_MAX_ENTRIES", "100000"))
+OMDB_CACHE_SEARCH_TTL = int(os.getenv("OMDB_CACHE_SEARCH_TTL", "3600"))  # 1 hour
+OMDB_CACHE_DETAIL_TTL = int(os.getenv("OMDB_CACHE_DETAIL_TTL", "86400"))  # 1 day
+OMDB_CACHE_NEGATIVE_TTL = int(os.getenv("OMDB_CACHE_NEGATIVE_TTL", "600"))  # 10 min
+
+# Pooled keep-alive HTTP connections to OMDb
+OMDB_POOL_CONNECTIONS = int(os.getenv("OMDB_POOL_CONNECTIONS", "10"))  # hosts kept in the pool
+OMDB_POOL_MAXSIZE = int(os.getenv("OMDB_POOL_MAXSIZE", "20"))  # connections kept per host
+OMDB_POOL_BLOCK = os.getenv("OMDB_POOL_BLOCK", "false").lower() == "true"  # wait instead of exceeding maxsize
+OMDB_HTTP_KEEPALIVE = os.getenv("OMDB_HTTP_KEEPALIVE", "true").lower() == "true"
+
+# Client-side limits on upstream OMDb calls (app/omdb_guard.py)
+OMDB_RATE_LIMIT = float(os.getenv("OMDB_RATE_LIMIT", "10"))  # calls per second per process; 0 disables
+OMDB_RATE_BURST = float(os.getenv("OMDB_RATE_BURST", "20"))  # calls allowed back to back
+OMDB_RATE_MAX_WAIT = float(os.getenv("OMDB_RATE_MAX_WAIT", "2"))  # seconds a call may queue for a token before it is refused
+OMDB_DAILY_QUOTA = int(os.getenv("OMDB_DAILY_QUOTA", "1000"))  # calls per UTC day (the free key's limit); 0 disables
+OMDB_QUOTA_PATH = os.getenv("OMDB_QUOTA_PATH", ".cache/omdb_quota.sqlite3")  # shared by worker processes; empty keeps it in memory
+OMDB_BREAKER_FAILURES = int(os.getenv("OMDB_BREAKER_FAILURES", "5"))  # consecutive failures that open the circuit; 0 disables
+OMDB_BREAKER_RESET_TIMEOUT = float(os.getenv("OMDB_BREAKER_RESET_TIMEOUT", "30"))  # seconds open before a trial call
+
+# Timeouts, retries and hedging of upstream OMDb calls (app/omdb_latency.py)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "15"))  # seconds an API request may spend on upstream calls; 0 disables
+OMDB_TIMEOUT_MIN = float(os.getenv("OMDB_TIMEOUT_MIN", "1"))  # bounds of the adaptive per-attempt timeout
+OMDB_TIMEOUT_MAX = float(os.getenv("OMDB_TIMEOUT_MAX", "10"))  # also used until enough latencies are measured
+OMDB_TIMEOUT_MULTIPLIER = float(os.getenv("OMDB_TIMEOUT_MULTIPLIER", "3"))  # timeout = observed p99 x this
+OMDB_LATENCY_WINDOW = int(os.getenv("OMDB_LATENCY_WINDOW", "500"))  # recent attempts the quantiles are taken over
+OMDB_LATENCY_MIN_SAMPLES = int(os.getenv("OMDB_LATENCY_MIN_SAMPLES", "20"))  # attempts measured before timeouts adapt
+OMDB_RETRIES = int(os.getenv("OMDB_RETRIES", "2"))  # extra attempts after a timeout, connection error, 5xx or 429
+OMDB_RETRY_BASE_DELAY = float(os.getenv("OMDB_RETRY_BASE_DELAY", "0.1"))  # seconds; doubled per retry, fully jittered
+OMDB_RETRY_MAX_DELAY = float(os.getenv("OMDB_RETRY_MAX_DELAY", "2"))  # cap on a single backoff
+OMDB_HEDGE_ENABLED = os.getenv("OMDB_HEDGE_ENABLED", "false").lower() == "true"  # second request after the observed p95
+
+# Async OMDb client (httpx) used by the request handlers
+OMDB_ASYNC_MAX_CONNECTIONS = int(os.getenv("OMDB_ASYNC_MAX_CONNECTIONS", "1000"))  # in-flight upstream calls
+OMDB_KEEPALIVE_EXPIRY = float(os.getenv("OMDB_KEEPALIVE_EXPIRY", "30"))  # seconds an idle connection is kept
+
+# Backend for /api/v1/analytics: "pandas" recomputes from every row (falling back to
+# "python", the same computation without pandas, when pandas is not installed), "sql"
+# pushes the aggregation down to the database, "incremental" reads the totals
+# maintained by crud (run `python -m app.aggregates rebuild` first)
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "pandas").lower()
+
+# Encoding of GET /api/v1/movies/ lists: "off" goes through the response_model, "validated"
+# fetches plain rows and validates them in one pass, "trusted" also skips validation and
+# encodes with orjson. All three produce the same bytes
+WATCHLIST_SERIALIZATION = os.getenv("WATCHLIST_SERIALIZATION", "off").lower()
+
+# Watchlist owner for requests without an X-User-Id header (set by the authenticating
+# proxy in front of the API); databases from before multi-user support migrate to it
+DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID", "default")
+
+# Background refresh of catalog metadata (rating, plot, poster) from OMDb (app/refresher.py).
+# Off by default; run it in the API process or as `python -m app.refresher run`
+REFRESH_ENABLED = os.getenv("REFRESH_ENABLED", "false").lower() == "true"
+REFRESH_MAX_AGE = int(os.getenv("REFRESH_MAX_AGE", "604800"))  # seconds before a movie is due again (7 days)
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "50"))  # movies re-fetched per batch
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", "60"))  # seconds between batches; caps the OMDb call rate
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "5"))  # parallel OMDb lookups per batch
+REFRESH_QUOTA_RESERVE = int(os.getenv("REFRESH_QUOTA_RESERVE", "100"))  # daily OMDb calls the refresher leaves for requests
+
+# POST /api/v1/movies/bulk limits
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
+BULK_FETCH_CONCURRENCY = int(os.getenv("BULK_FETCH_CONCURRENCY", "10"))  # parallel OMDb lookups per request
+
+# Database engine and connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # 0 disables pooling (e.g. behind a transaction-mode pooler)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; -1 never recycles
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"  # log every statement and its parameters
+DB_LOG_LEVEL = os.getenv("DB_LOG_LEVEL", "WARNING").upper()
+
+# Prometheus metrics on GET /metrics (request, OMDb and per-request DB timings)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Cache-Control max-age (seconds) for watchlist and analytics reads; responses also
+# carry an ETag, so clients and proxies can revalidate cheaply once it expires
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "5"))
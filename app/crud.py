@@ -1,13 +1,17 @@
-from sqlalchemy.orm import Session
-from typing import Tuple, List, Optional
-from app import models, schemas
-
-def add_movie(db: Session, movie_data: dict) -> Tuple[str, Optional[models.Movie]]:
-    existing_movie = db.query(models.Movie).filter_by(imdb_id=movie_data["imdbID"]).first()
-    if existing_movie:
-        return "already_exists", existing_movie
-    
-    movie_dict = {
+from sqlalchemy import select, update, delete, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager
+from datetime import datetime
+from typing import Tuple, List, Optional, Iterator, Iterable, Set, Dict, Union
+from app import models, schemas, aggregates, genres, search, serialization
+
+# An OMDb detail payload, or a movie already in the catalog
+MovieData = Union[dict, models.Movie]
+
+def _movie_fields(movie_data: dict) -> dict:
+    # Map an OMDb detail payload onto Movie columns
+    return {
         "imdb_id": movie_data["imdbID"],
         "title": movie_data["Title"],
         "year": movie_data["Year"],
@@ -17,40 +21,408 @@ def add_movie(db: Session, movie_data: dict) -> Tuple[str, Optional[models.Movie
         "poster_url": movie_data.get("Poster")
     }
 
-    movie = models.Movie(**movie_dict)
-    db.add(movie)
+def _conflict_insert(db: Session):
+    # Dialect insert() with ON CONFLICT DO NOTHING and RETURNING, or None when unsupported
+    dialect = db.get_bind().dialect
+    if not dialect.insert_returning:
+        return None
+    return {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(dialect.name)
+
+def imdb_id_of(movie_data: MovieData) -> str:
+    return movie_data.imdb_id if isinstance(movie_data, models.Movie) else movie_data["imdbID"]
+
+def get_catalog_movies(db: Session, imdb_ids: Iterable[str]) -> Dict[str, models.Movie]:
+    """Catalog movies by IMDb ID; saving one of these needs no OMDb lookup."""
+    imdb_ids = list(imdb_ids)
+    if not imdb_ids:
+        return {}
+    movies = db.scalars(select(models.Movie).where(models.Movie.imdb_id.in_(imdb_ids)))
+    return {movie.imdb_id: movie for movie in movies}
+
+def get_catalog_movie(db: Session, imdb_id: str) -> Optional[models.Movie]:
+    return get_catalog_movies(db, [imdb_id]).get(imdb_id)
+
+def _catalog_movies(db: Session, movies_data: List[MovieData]) -> List[models.Movie]:
+    """
+    The catalog movie for every item, inserting the missing ones (with their
+    genre links and search index rows). Each movie is stored once, whoever saves it.
+    """
+    known = {m.imdb_id: m for m in movies_data if isinstance(m, models.Movie)}
+    rows = {}
+    for data in movies_data:
+        if not isinstance(data, models.Movie) and data["imdbID"] not in known:
+            rows.setdefault(data["imdbID"], _movie_fields(data))
+    if rows:
+        known.update(get_catalog_movies(db, rows))
+        rows = [fields for imdb_id, fields in rows.items() if imdb_id not in known]
+    if rows:
+        insert = _conflict_insert(db)
+        if insert is not None:
+            # A movie another writer added since the lookup comes back missing instead of failing
+            stmt = insert(models.Movie).on_conflict_do_nothing(index_elements=[models.Movie.imdb_id]).returning(models.Movie)
+            created = list(db.scalars(stmt, rows))
+        else:
+            created = [models.Movie(**fields) for fields in rows]
+            db.add_all(created)
+            db.flush()
+        if created:
+            genres.attach(db, created)
+            search.index_movies(db, created)
+        known.update((movie.imdb_id, movie) for movie in created)
+        known.update(get_catalog_movies(db, (fields["imdb_id"] for fields in rows if fields["imdb_id"] not in known)))
+    # One movie per IMDb ID, even if the same movie was passed twice
+    return list({known[imdb_id_of(data)].id: known[imdb_id_of(data)] for data in movies_data}.values())
+
+def _entries(user_id: str):
+    # The user's entries with their catalog movie loaded through the same join
+    Entry = models.WatchlistEntry
+    return select(Entry).join(Entry.movie).options(contains_eager(Entry.movie)).where(Entry.user_id == user_id)
+
+def _get_entry(db: Session, user_id: str, imdb_id: str) -> Optional[models.WatchlistEntry]:
+    return db.scalars(_entries(user_id).where(models.Movie.imdb_id == imdb_id)).first()
+
+def add_movie(db: Session, user_id: str, movie_data: MovieData) -> Tuple[str, Optional[models.WatchlistEntry]]:
+    insert = _conflict_insert(db)
+    if insert is None:
+        return _add_movie_checked(db, user_id, movie_data)
+
+    movie = _catalog_movies(db, [movie_data])[0]
+    # One statement claims the (user, movie) pair; a concurrent duplicate gets no row back instead of a unique violation
+    Entry = models.WatchlistEntry
+    stmt = (
+        insert(Entry)
+        .values(user_id=user_id, movie_id=movie.id)
+        .on_conflict_do_nothing(index_elements=[Entry.user_id, Entry.movie_id])
+        .returning(Entry)
+    )
+    entry = db.scalars(stmt).first()
+    if entry is None:
+        # A catalog movie inserted above still stays for the next user who saves it
+        db.commit()
+        return "already_exists", _get_entry(db, user_id, movie.imdb_id)
+
+    aggregates.record_added(db, entry)
     db.commit()
-    db.refresh(movie)
-    return "created", movie
+    return "created", entry
 
-def get_movie_watchlist(db: Session) -> List[models.Movie]:
-    return db.query(models.Movie).filter(models.Movie.watched.is_(False)).all()
+def _add_movie_checked(db: Session, user_id: str, movie_data: MovieData) -> Tuple[str, Optional[models.WatchlistEntry]]:
+    # SELECT-then-INSERT for dialects without ON CONFLICT ... RETURNING
+    existing_entry = _get_entry(db, user_id, imdb_id_of(movie_data))
+    if existing_entry:
+        return "already_exists", existing_entry
 
-def get_all_movies(db: Session) -> List[models.Movie]:
-    return db.query(models.Movie).all()
+    movie = _catalog_movies(db, [movie_data])[0]
+    entry = models.WatchlistEntry(user_id=user_id, movie=movie, watched=False)
+    db.add(entry)
+    db.flush()
+    aggregates.record_added(db, entry)
+    db.commit()
+    db.refresh(entry)
+    return "created", entry
+
+def get_existing_imdb_ids(db: Session, user_id: str, imdb_ids: Iterable[str]) -> Set[str]:
+    """The IMDb IDs already on the user's watchlist."""
+    imdb_ids = list(imdb_ids)
+    if not imdb_ids:
+        return set()
+    rows = db.execute(
+        select(models.Movie.imdb_id)
+        .join(models.WatchlistEntry, models.WatchlistEntry.movie_id == models.Movie.id)
+        .where(models.WatchlistEntry.user_id == user_id, models.Movie.imdb_id.in_(imdb_ids))
+    ).all()
+    return {imdb_id for (imdb_id,) in rows}
 
-def get_movies_by_watched_status(db: Session, watched: bool) -> List[models.Movie]:
-    return db.query(models.Movie).filter(models.Movie.watched.is_(watched)).all()
+def add_movies(db: Session, user_id: str, movies_data: List[MovieData]) -> Tuple[List[models.WatchlistEntry], Set[str]]:
+    """
+    Add many movies to the user's watchlist in a single transaction.
 
-def update_watched_status(db: Session, imdb_id: str, watched: bool) -> Optional[models.Movie]:
-    movie = db.query(models.Movie).filter_by(imdb_id=imdb_id).first()
-    if movie:
-        movie.watched = watched
+    Returns the created entries and the IMDb IDs skipped because they are
+    already on the watchlist (including ones added concurrently since the
+    caller checked).
+    """
+    skipped = get_existing_imdb_ids(db, user_id, (imdb_id_of(data) for data in movies_data))
+    Entry = models.WatchlistEntry
+    insert = _conflict_insert(db)
+    if insert is not None:
+        movies = _catalog_movies(db, [data for data in movies_data if imdb_id_of(data) not in skipped])
+        if not movies:
+            return [], skipped
+        stmt = insert(Entry).on_conflict_do_nothing(index_elements=[Entry.user_id, Entry.movie_id]).returning(Entry)
+        entries = db.scalars(stmt, [{"user_id": user_id, "movie_id": movie.id} for movie in movies]).all()
+        # Entries another writer added since the check come back missing rather than failing the batch
+        skipped |= {movie.imdb_id for movie in movies} - {entry.imdb_id for entry in entries}
+        if entries:
+            aggregates.record_added_many(db, entries)
         db.commit()
-        db.refresh(movie)
-        return movie
+        return list(entries), skipped
+
+    for attempt in range(2):
+        movies = _catalog_movies(db, [data for data in movies_data if imdb_id_of(data) not in skipped])
+        if not movies:
+            return [], skipped
+        try:
+            entries = [Entry(user_id=user_id, movie=movie, watched=False) for movie in movies]
+            db.add_all(entries)
+            db.flush()
+            aggregates.record_added_many(db, entries)
+            db.commit()
+            return entries, skipped
+        except IntegrityError:
+            # Lost a race with another writer; drop the IDs that now exist and retry once
+            db.rollback()
+            if attempt:
+                raise
+            skipped = get_existing_imdb_ids(db, user_id, (imdb_id_of(data) for data in movies_data))
+    return [], skipped
+
+def get_movie_watchlist(db: Session, user_id: str, genre: Optional[str] = None) -> List[models.WatchlistEntry]:
+    return list(db.scalars(_entries(user_id).where(*_watchlist_filter(None, genre))))
+
+def get_all_movies(db: Session, user_id: str) -> List[models.WatchlistEntry]:
+    return list(db.scalars(_entries(user_id)))
+
+def get_movies_by_watched_status(
+    db: Session, user_id: str, watched: bool, genre: Optional[str] = None
+) -> List[models.WatchlistEntry]:
+    return list(db.scalars(_entries(user_id).where(*_watchlist_filter(watched, genre))))
+
+def _watchlist_filter(watched: Optional[bool], genre: Optional[str] = None) -> list:
+    # No watched filter means the to-watch list, matching get_movie_watchlist
+    conditions = [models.WatchlistEntry.watched.is_(False if watched is None else watched)]
+    if genre:
+        conditions.append(genres.genre_filter(genre))
+    return conditions
+
+def _after(after: Tuple[datetime, int]):
+    # Entries sort by (date_added, movie_id) within a user
+    after_date, after_id = after
+    Entry = models.WatchlistEntry
+    return or_(
+        Entry.date_added > after_date,
+        and_(Entry.date_added == after_date, Entry.movie_id > after_id)
+    )
+
+def get_movies_page(
+    db: Session,
+    user_id: str,
+    watched: Optional[bool],
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    genre: Optional[str] = None
+) -> List[models.WatchlistEntry]:
+    """Keyset page ordered by (date_added, movie_id), starting after the given sort key."""
+    Entry = models.WatchlistEntry
+    stmt = _entries(user_id).where(*_watchlist_filter(watched, genre))
+    if after is not None:
+        stmt = stmt.where(_after(after))
+    return list(db.scalars(stmt.order_by(Entry.date_added, Entry.movie_id).limit(limit)))
+
+def get_movie_rows(
+    db: Session,
+    user_id: str,
+    watched: Optional[bool],
+    genre: Optional[str] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None
+) -> list:
+    """
+    Same movies as get_movie_watchlist / get_movies_page, as plain tuples of
+    serialization.MOVIE_FIELDS followed by the movie_id (no ORM objects are built).
+    """
+    Entry = models.WatchlistEntry
+    entry_columns, movie_columns = Entry.__table__.c, models.Movie.__table__.c
+    columns = [
+        entry_columns[field] if field in entry_columns else movie_columns[field]
+        for field in serialization.MOVIE_FIELDS
+    ]
+    stmt = (
+        select(*columns, Entry.movie_id)
+        .select_from(Entry)
+        .join(models.Movie, models.Movie.id == Entry.movie_id)
+        .where(Entry.user_id == user_id, *_watchlist_filter(watched, genre))
+    )
+    if limit is not None:
+        if after is not None:
+            stmt = stmt.where(_after(after))
+        stmt = stmt.order_by(Entry.date_added, Entry.movie_id).limit(limit)
+    return db.execute(stmt).all()
+
+def iter_movies(
+    db: Session,
+    user_id: str,
+    watched: Optional[bool],
+    batch_size: int = 500,
+    genre: Optional[str] = None
+) -> Iterator[models.WatchlistEntry]:
+    """Stream the user's entries in batches; on PostgreSQL this uses a server-side cursor."""
+    Entry = models.WatchlistEntry
+    stmt = (
+        _entries(user_id)
+        .where(*_watchlist_filter(watched, genre))
+        .order_by(Entry.date_added, Entry.movie_id)
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.scalars(stmt)
+
+def search_watchlist(db: Session, user_id: str, q: str, limit: int) -> List[models.WatchlistEntry]:
+    return search.search_movies(db, user_id, q, limit)
+
+def _catalog_id(imdb_id: str):
+    return select(models.Movie.id).where(models.Movie.imdb_id == imdb_id).scalar_subquery()
+
+def update_watched_status(db: Session, user_id: str, imdb_id: str, watched: bool) -> Optional[models.WatchlistEntry]:
+    if not db.get_bind().dialect.update_returning:
+        return _update_watched_status_checked(db, user_id, imdb_id, watched)
+
+    # Only entries whose status actually changes match, so a returned row means the aggregates move
+    Entry = models.WatchlistEntry
+    stmt = (
+        update(Entry)
+        .where(Entry.user_id == user_id, Entry.movie_id == _catalog_id(imdb_id), Entry.watched.is_not(watched))
+        .values(watched=watched)
+        .returning(Entry)
+    )
+    entry = db.scalars(stmt).first()
+    if entry is None:
+        # Not on the watchlist or already in that state; the lookup tells them apart
+        return _get_entry(db, user_id, imdb_id)
+
+    aggregates.record_watched_changed(db, user_id, watched)
+    db.commit()
+    return entry
+
+def _update_watched_status_checked(db: Session, user_id: str, imdb_id: str, watched: bool) -> Optional[models.WatchlistEntry]:
+    entry = _get_entry(db, user_id, imdb_id)
+    if entry:
+        if entry.watched != watched:
+            aggregates.record_watched_changed(db, user_id, watched)
+        entry.watched = watched
+        db.commit()
+        db.refresh(entry)
+        return entry
     return None
 
-def delete_movie(db: Session, imdb_id: str) -> Optional[models.Movie]:
-    movie = db.query(models.Movie).filter_by(imdb_id=imdb_id).first()
-    if movie:
-        db.delete(movie)
+def delete_movie(db: Session, user_id: str, imdb_id: str) -> Optional[models.WatchlistEntry]:
+    """Remove the movie from the user's watchlist; the catalog keeps it for other users."""
+    if not db.get_bind().dialect.delete_returning:
+        return _delete_movie_checked(db, user_id, imdb_id)
+
+    Entry = models.WatchlistEntry
+    stmt = delete(Entry).where(Entry.user_id == user_id, Entry.movie_id == _catalog_id(imdb_id)).returning(Entry)
+    entry = db.scalars(stmt).first()
+    if entry is None:
+        return None
+
+    aggregates.record_removed(db, entry)
+    # Keep the returned row (and its movie) readable; committing would expire the now-missing instance
+    db.expunge(entry)
+    db.commit()
+    return entry
+
+def _delete_movie_checked(db: Session, user_id: str, imdb_id: str) -> Optional[models.WatchlistEntry]:
+    entry = _get_entry(db, user_id, imdb_id)
+    if entry:
+        db.delete(entry)
+        aggregates.record_removed(db, entry)
         db.commit()
-        return movie
+        return entry
     return None
 
-def get_total_movies(db: Session) -> int:
-    return db.query(models.Movie).count()
+def get_stale_movies(db: Session, refreshed_before: datetime, limit: int, skip_locked: bool = False) -> List[models.Movie]:
+    """
+    Catalog movies due a metadata refresh: never refreshed first, then least recently refreshed.
+    With ``skip_locked`` the rows are locked FOR UPDATE SKIP LOCKED where the
+    dialect has it (PostgreSQL), passing over rows another transaction holds.
+    """
+    Movie = models.Movie
+
+    def due(stmt):
+        return stmt.with_for_update(skip_locked=True) if skip_locked else stmt
+
+    movies = list(db.scalars(due(select(Movie).where(Movie.last_refreshed_at.is_(None)).order_by(Movie.id).limit(limit))))
+    if len(movies) < limit:
+        movies += db.scalars(due(
+            select(Movie)
+            .where(Movie.last_refreshed_at < refreshed_before)
+            .order_by(Movie.last_refreshed_at, Movie.id)
+            .limit(limit - len(movies))
+        ))
+    return movies
+
+def claim_stale_movies(db: Session, refreshed_before: datetime, claimed_until: datetime, limit: int) -> List[Tuple[int, str]]:
+    """
+    Take up to ``limit`` movies due a refresh as ``(id, imdb_id)``, so that
+    refreshers running side by side never fetch the same movie.
+
+    Claimed movies get ``last_refreshed_at = claimed_until``, which keeps them
+    from being due again until the claim runs out; ``refresh_movies`` then
+    stamps the ones actually refreshed. The UPDATE re-checks that each movie is
+    still due, so of two refreshers that picked the same movie only one gets it.
+    """
+    Movie = models.Movie
+    ids = [movie.id for movie in get_stale_movies(db, refreshed_before, limit, skip_locked=True)]
+    if not ids:
+        db.rollback()
+        return []
+
+    still_due = or_(Movie.last_refreshed_at.is_(None), Movie.last_refreshed_at < refreshed_before)
+    stmt = update(Movie).where(Movie.id.in_(ids), still_due).values(last_refreshed_at=claimed_until)
+    options = {"synchronize_session": False}
+    if db.get_bind().dialect.update_returning:
+        claimed = db.execute(stmt.returning(Movie.id, Movie.imdb_id), execution_options=options).all()
+    else:
+        db.execute(stmt, execution_options=options)
+        claimed = db.execute(
+            select(Movie.id, Movie.imdb_id).where(Movie.id.in_(ids), Movie.last_refreshed_at == claimed_until)
+        ).all()
+    db.commit()
+    order = {movie_id: n for n, movie_id in enumerate(ids)}
+    return sorted(((movie_id, imdb_id) for movie_id, imdb_id in claimed), key=lambda movie: order[movie[0]])
+
+def refresh_movies(db: Session, fetched: Dict[int, Optional[dict]], refreshed_at: datetime) -> List[str]:
+    """
+    Write re-fetched OMDb metadata (``{movie_id: payload}``, None when OMDb no
+    longer has it) back to the catalog and stamp every movie as refreshed.
+
+    Only rating, plot and poster_url are refreshed. Changed movies are written
+    with one executemany UPDATE; the rating totals and versions of the users
+    who saved them move in the same transaction. Returns the changed IMDb IDs.
+    """
+    Movie = models.Movie
+    if not fetched:
+        return []
+    current = {movie.id: movie for movie in db.scalars(select(Movie).where(Movie.id.in_(list(fetched))))}
+    changes = []
+    for movie_id, movie_data in fetched.items():
+        movie = current.get(movie_id)
+        if movie is None or not movie_data:
+            continue
+        fields = _movie_fields(movie_data)
+        new = {name: fields[name] for name in ("rating", "plot", "poster_url")}
+        if any(getattr(movie, name) != value for name, value in new.items()):
+            changes.append((movie, new))
+
+    db.execute(
+        update(Movie).where(Movie.id.in_(list(current))).values(last_refreshed_at=refreshed_at),
+        execution_options={"synchronize_session": False},
+    )
+    if changes:
+        # Old values are read from the loaded movies, which the bulk UPDATE leaves as they were
+        search.reindex_movies(db, [(movie, new["plot"]) for movie, new in changes if movie.plot != new["plot"]])
+        aggregates.record_movies_changed(db, {movie.id: (movie.rating, new["rating"]) for movie, new in changes})
+        db.execute(update(Movie), [{"id": movie.id, **new} for movie, new in changes])
+    db.commit()
+    # The loaded copies are stale now; later reads in this session go back to the database
+    for movie in current.values():
+        db.expire(movie)
+    return [movie.imdb_id for movie, _ in changes]
+
+def get_watchlist_version(db: Session, user_id: str) -> int:
+    return aggregates.read_version(db, user_id)
+
+def get_total_movies(db: Session, user_id: str) -> int:
+    return db.query(models.WatchlistEntry).filter(models.WatchlistEntry.user_id == user_id).count()
 
-def get_watched_movies_count(db: Session) -> int:
-    return db.query(models.Movie).filter(models.Movie.watched.is_(True)).count()
\ No newline at end of file
+def get_watched_movies_count(db: Session, user_id: str) -> int:
+    Entry = models.WatchlistEntry
+    return db.query(Entry).filter(Entry.user_id == user_id, Entry.watched.is_(True)).count()
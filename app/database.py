@@ -1,14 +1,125 @@
-import os
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from typing import Any, Dict
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.config import DB_CONNECTION_STRING
+from sqlalchemy.pool import NullPool
+from app.config import (
+    DB_CONNECTION_STRING,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_ECHO,
+    DB_LOG_LEVEL,
+    METRICS_ENABLED,
+)
+from app import metrics
 
 Base = declarative_base()
 
+
+def engine_options(connection_string: str) -> Dict[str, Any]:
+    """create_engine keyword arguments for the configured pool and logging settings."""
+    options: Dict[str, Any] = {"echo": DB_ECHO, "pool_pre_ping": DB_POOL_PRE_PING}
+    if make_url(connection_string).get_backend_name() == "sqlite":
+        # SQLite uses its own single-connection pools; sizing options do not apply
+        return options
+    if DB_POOL_SIZE <= 0:
+        options["poolclass"] = NullPool
+        return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+def make_sessionmaker(bind) -> sessionmaker:
+    """The app's session settings, for its engine or a test's."""
+    # Writes return their rows via RETURNING; keep them loaded after commit instead of re-selecting
+    return sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bind)
+
+
+class PoolStats:
+    """
+    Time spent waiting for a pooled connection, measured per session checkout.
+
+    Opening a new database connection during the checkout is not waiting on
+    the pool, so ``time_new_connections`` measures it and ``get_db`` leaves it out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+        # Only QueuePool exposes sizing; SQLite and NullPool report what they have
+        stats["pool_class"] = type(pool).__name__
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            stats[name] = method() if callable(method) else None
+        return stats
+
+
+# Seconds this thread spent opening new connections during the current checkout
+_connecting = threading.local()
+
+
+def time_new_connections(engine) -> None:
+    """Time the opening of new DBAPI connections, so get_db can tell it apart from waiting on the pool."""
+    @event.listens_for(engine, "do_connect")
+    def _started(dialect, connection_record, cargs, cparams):
+        _connecting.started = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _opened(dbapi_connection, connection_record):
+        started = getattr(_connecting, "started", None)
+        if started is not None:
+            _connecting.seconds = getattr(_connecting, "seconds", 0.0) + time.perf_counter() - started
+            _connecting.started = None
+
+
+logging.getLogger("sqlalchemy.engine").setLevel(DB_LOG_LEVEL)
+pool_stats = PoolStats()
+
 if DB_CONNECTION_STRING:
-    engine = create_engine(DB_CONNECTION_STRING, echo=True)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine = create_engine(DB_CONNECTION_STRING, **engine_options(DB_CONNECTION_STRING))
+    time_new_connections(engine)
+    if METRICS_ENABLED:
+        metrics.instrument_engine(engine)
+    SessionLocal = make_sessionmaker(engine)
 else:
     engine = None
     SessionLocal = None
@@ -21,6 +132,21 @@ def get_db():
 
     db = SessionLocal()
     try:
+        # Check the connection out up front so pool wait time can be measured;
+        # time spent opening a new connection is not waiting and is left out
+        _connecting.seconds = 0.0
+        start = time.perf_counter()
+        try:
+            db.connection()
+        except exc.TimeoutError:
+            pool_stats.record_timeout()
+            raise
+        pool_stats.record_wait(max(time.perf_counter() - start - _connecting.seconds, 0.0))
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_pool_stats() -> Dict[str, Any]:
+    if engine is None:
+        return {}
+    return pool_stats.snapshot(engine.pool)
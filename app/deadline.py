@@ -0,0 +1,102 @@
+# Per-request time budget: set when an HTTP request arrives, read by upstream
+# calls made on its behalf (OMDb retries stop once it has run out)
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from app.config import REQUEST_DEADLINE
+
+# Lets a caller (or the proxy in front of the API) ask for a shorter budget, in seconds
+TIMEOUT_HEADER = b"x-request-timeout"
+
+
+class _Budget:
+    # Mutable so a call shared by several requests can move its deadline as they join
+    __slots__ = ("ends",)
+
+    def __init__(self, ends: Optional[float]):
+        self.ends = ends
+
+
+# Absolute time.monotonic() by which the current request must be answered; None outside requests
+_budget: ContextVar[Optional[_Budget]] = ContextVar("deadline", default=None)
+
+
+def _ends() -> Optional[float]:
+    budget = _budget.get()
+    return budget.ends if budget is not None else None
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget (never below 0); None when there is no deadline."""
+    ends = _ends()
+    if ends is None:
+        return None
+    return max(ends - time.monotonic(), 0.0)
+
+
+@contextmanager
+def budget(seconds: Optional[float]) -> Iterator[None]:
+    """Run a block under a deadline ``seconds`` from now; an enclosing, earlier deadline still applies."""
+    ends = _ends()
+    if seconds is not None and seconds > 0:
+        mine = time.monotonic() + seconds
+        ends = mine if ends is None else min(ends, mine)
+    token = _budget.set(_Budget(ends))
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+class SharedBudget:
+    """
+    Deadline of one call made on behalf of several callers (see singleflight):
+    the latest of theirs, or none once a caller without a deadline joins. A
+    caller with a short deadline then cannot cut the call short for the others;
+    each caller stops waiting at its own deadline instead.
+    """
+
+    def __init__(self):
+        self._budget = _Budget(_ends())
+
+    def join(self) -> None:
+        """Another caller waits on the call: extend the deadline to cover it."""
+        ends = _ends()
+        if self._budget.ends is not None:
+            self._budget.ends = None if ends is None else max(self._budget.ends, ends)
+
+    async def run(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # Runs as its own task, so this only replaces the budget in the task's copy of the context
+        _budget.set(self._budget)
+        return await fn()
+
+
+def _requested_timeout(scope) -> Optional[float]:
+    for name, value in scope.get("headers", ()):
+        if name == TIMEOUT_HEADER:
+            try:
+                seconds = float(value)
+            except ValueError:
+                return None
+            return seconds if seconds > 0 else None
+    return None
+
+
+class DeadlineMiddleware:
+    """Plain ASGI middleware giving each request REQUEST_DEADLINE seconds, or less if the caller asks."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        seconds = REQUEST_DEADLINE if REQUEST_DEADLINE > 0 else None
+        requested = _requested_timeout(scope)
+        if requested is not None:
+            seconds = requested if seconds is None else min(seconds, requested)
+        with budget(seconds):
+            await self.app(scope, receive, send)
@@ -0,0 +1,152 @@
+"""
+Normalized genre storage.
+
+``models.Movie.genre`` keeps OMDb's raw comma-joined string; this module keeps
+the ``genres`` / ``movie_genres`` tables in step with it so genre filters and
+per-genre stats are indexed lookups. Existing rows can be backfilled with:
+
+    python -m app.genres backfill
+"""
+import logging
+import sys
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import models, aggregates
+
+logger = logging.getLogger(__name__)
+
+
+def split_genres(raw: Optional[str]) -> List[str]:
+    """'Action, Crime, Drama' -> ['Action', 'Crime', 'Drama'] (order kept; blanks, "N/A" and repeats dropped)."""
+    if not raw:
+        return []
+    names = []
+    for name in raw.split(","):
+        name = name.strip()
+        # OMDb sends "N/A" for a movie without genres
+        if name and name != "N/A" and name not in names:
+            names.append(name)
+    return names
+
+
+def _genre_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    """Look up genre IDs by name, creating the missing genres."""
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.execute(select(models.Genre.name, models.Genre.id).where(models.Genre.name.in_(names))).all())
+    returning = db.get_bind().dialect.insert_returning
+    for name in names - ids.keys():
+        try:
+            # Savepoint so losing a race with a concurrent insert keeps the outer transaction
+            with db.begin_nested():
+                stmt = insert(models.Genre).values(name=name)
+                if returning:
+                    ids[name] = db.execute(stmt.returning(models.Genre.id)).scalar_one()
+                else:
+                    ids[name] = db.execute(stmt).inserted_primary_key[0]
+        except IntegrityError:
+            ids[name] = db.execute(select(models.Genre.id).where(models.Genre.name == name)).scalar_one()
+    return ids
+
+
+def attach(db: Session, movies: Iterable[models.Movie]) -> None:
+    """Link flushed movies (their ``id`` must be set) to their genres."""
+    movies = [m for m in movies if m.genre]
+    per_movie = {m.id: split_genres(m.genre) for m in movies}
+    ids = _genre_ids(db, (name for names in per_movie.values() for name in names))
+    rows = [
+        {"movie_id": movie_id, "genre_id": ids[name]}
+        for movie_id, names in per_movie.items()
+        for name in names
+    ]
+    if rows:
+        db.execute(insert(models.movie_genres), rows)
+
+
+def detach(db: Session, movie_ids: Iterable[int]) -> None:
+    movie_ids = list(movie_ids)
+    if movie_ids:
+        db.execute(delete(models.movie_genres).where(models.movie_genres.c.movie_id.in_(movie_ids)))
+
+
+def genre_filter(genre: str):
+    """WHERE clause selecting watchlist entries whose movie is tagged with ``genre`` (case-insensitive)."""
+    tagged = (
+        select(models.movie_genres.c.movie_id)
+        .join(models.Genre, models.Genre.id == models.movie_genres.c.genre_id)
+        .where(func.lower(models.Genre.name) == genre.strip().lower())
+    )
+    return models.WatchlistEntry.movie_id.in_(tagged)
+
+
+def genre_stats(db: Session, user_id: str) -> List[Dict]:
+    """Movie count and average rating per genre of the user's watchlist, most common genre first."""
+    Entry = models.WatchlistEntry
+    rows = db.execute(
+        select(
+            models.Genre.name,
+            func.count(models.movie_genres.c.movie_id),
+            func.avg(models.Movie.rating),
+        )
+        .join(models.movie_genres, models.movie_genres.c.genre_id == models.Genre.id)
+        .join(Entry, Entry.movie_id == models.movie_genres.c.movie_id)
+        .join(models.Movie, models.Movie.id == Entry.movie_id)
+        .where(Entry.user_id == user_id)
+        .group_by(models.Genre.name)
+        .order_by(func.count(models.movie_genres.c.movie_id).desc(), models.Genre.name)
+    ).all()
+    return [
+        {"genre": name, "movie_count": count, "average_rating": float(average) if average is not None else None}
+        for name, count, average in rows
+    ]
+
+
+def backfill(db: Session, batch_size: int = 1000) -> int:
+    """Link every movie that has a genre string but no movie_genres rows. Returns the number linked."""
+    linked = 0
+    last_id = 0
+    while True:
+        # Only the columns attach() reads, so this also runs against schemas older than the model
+        movies = (
+            db.query(models.Movie.id, models.Movie.genre)
+            .filter(models.Movie.id > last_id)
+            .filter(models.Movie.genre.isnot(None))
+            .filter(~models.Movie.id.in_(select(models.movie_genres.c.movie_id)))
+            .order_by(models.Movie.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not movies:
+            break
+        last_id = movies[-1].id
+        attach(db, movies)
+        # Genre filters now match these movies, so every user's cached watchlist responses are stale
+        aggregates.record_changed(db)
+        db.commit()
+        linked += sum(1 for m in movies if split_genres(m.genre))
+    return linked
+
+
+def main(argv) -> int:
+    from app.database import SessionLocal
+
+    if argv != ["backfill"]:
+        print("usage: python -m app.genres backfill")
+        return 2
+    if SessionLocal is None:
+        print("Database is not configured. DB_CONNECTION_STRING is missing.")
+        return 2
+
+    db = SessionLocal()
+    try:
+        print(f"Linked genres for {backfill(db)} movie(s)")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
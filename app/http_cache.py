@@ -0,0 +1,40 @@
+# Conditional GET helpers: ETags derived from the watchlist version, 304 handling
+# and Cache-Control for the read endpoints
+import hashlib
+from typing import Optional
+from fastapi import Response
+from app.config import HTTP_CACHE_MAX_AGE
+
+# Watchlists are per user: only the user's own (browser) cache may store them
+CACHE_CONTROL = f"private, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+
+
+def etag(version: int, resource: str, user_id: str) -> str:
+    # Every response of a resource changes with the watchlist version; caches key by
+    # URL, so query parameters do not need to be part of the tag. Versions are
+    # counted per user, so the tag also carries a hash of the user (not the ID
+    # itself) to keep one user's tag from matching another's
+    user = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16]
+    return f'"{resource}-{user}-{version}"'
+
+
+def matches(if_none_match: Optional[str], tag: str) -> bool:
+    """Whether an If-None-Match header matches ``tag`` (weak comparison, as RFC 9110 asks for)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+
+def set_headers(response: Response, tag: str) -> None:
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    # Watchlists (and their versions) are per user, so caches must not share them across users
+    response.headers["Vary"] = "X-User-Id"
+
+
+def not_modified(tag: str) -> Response:
+    response = Response(status_code=304)
+    set_headers(response, tag)
+    return response
@@ -0,0 +1,77 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from typing import Dict
+
+
+class ConnectionStats:
+    """Counts requests sent and TCP connections opened, so reuse can be derived."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self) -> None:
+        with self._lock:
+            self.connections_opened += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.connections_opened = 0
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            requests_sent = self.requests
+            opened = self.connections_opened
+        reused = max(requests_sent - opened, 0)
+        return {
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / requests_sent, 4) if requests_sent else 0.0,
+        }
+
+
+def _counting_pool(base, stats: ConnectionStats):
+    # Count at connect() time: urllib3 reconnects dropped sockets on existing connection objects
+    class CountingConnection(base.ConnectionCls):
+        def connect(self):
+            stats.record_connection()
+            return super().connect()
+
+    class CountingPool(base):
+        ConnectionCls = CountingConnection
+
+    return CountingPool
+
+
+def build_session(
+    stats: ConnectionStats,
+    pool_connections: int,
+    pool_maxsize: int,
+    pool_block: bool = False,
+    keepalive: bool = True,
+) -> requests.Session:
+    """
+    Build a requests Session whose connection pools are bounded per host and
+    report every new TCP connection to ``stats``.
+    """
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    adapter.poolmanager.pool_classes_by_scheme = {
+        "http": _counting_pool(HTTPConnectionPool, stats),
+        "https": _counting_pool(HTTPSConnectionPool, stats),
+    }
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keepalive:
+        session.headers["Connection"] = "close"
+    return session
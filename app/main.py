@@ -1,12 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from sqlalchemy.orm import Session
 from contextlib import asynccontextmanager
-from app.analytics import compute_movie_stats
-from app.database import get_db
-from app import crud, schemas
-from app import omdb_client
-from typing import Optional
+from app.analytics import compute_movie_stats, compute_genre_stats
+from app.database import get_db, get_pool_stats
+from app import crud, schemas, pagination, metrics, http_cache, serialization, config
+from app import omdb_client, async_omdb_client, omdb_guard, omdb_latency, refresher, deadline
+from app.config import BULK_FETCH_CONCURRENCY, METRICS_ENABLED, REFRESH_ENABLED
+from typing import Optional, Iterable, Iterator, Tuple
+import asyncio
 import logging
+import math
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,7 +21,13 @@ logging.basicConfig(
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logging.info("Movie Watchlist API starting up...")
+    async_omdb_client.open_client()
+    if REFRESH_ENABLED:
+        refresher.start()
     yield
+    await refresher.stop()
+    await async_omdb_client.close_client()
+    omdb_client.close_session()
     logging.info("Movie Watchlist API shutting down...")
 
 app = FastAPI(
@@ -26,58 +37,213 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+# Upstream calls made for a request (OMDb timeouts and retries) stop at its deadline
+app.add_middleware(deadline.DeadlineMiddleware)
+
+# OMDb calls refused on the client side (circuit open, rate limit, daily quota) fail fast
+@app.exception_handler(omdb_guard.OMDbUnavailable)
+async def omdb_unavailable(request, exc: omdb_guard.OMDbUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Movie service unavailable", "reason": exc.reason},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
 # search movies, input: title, output: list of movies
 @app.get("/api/v1/search/{title}")
-def search_movies(title: str):
+async def search_movies(title: str):
     try:
-        results = omdb_client.search_movies(title)
+        results = await async_omdb_client.search_movies(title)
         return results
+    except omdb_guard.OMDbUnavailable:
+        raise
     except Exception as e:
         logging.warning(f'Error searching movies: {e}')
         raise HTTPException(status_code=503, detail="Movie search service unavailable")
 
 # fetch movies by id, input: imdb_id, output: movie details
 @app.get("/api/v1/movies/{imdb_id}")
-def get_movie_details(imdb_id: str):
+async def get_movie_details(imdb_id: str):
     try:
-        movie = omdb_client.fetch_movie_by_id(imdb_id)
+        movie = await async_omdb_client.fetch_movie_by_id(imdb_id)
         if not movie:
             raise HTTPException(status_code=404, detail="Movie not found")
         return movie
-    except HTTPException:
+    except (HTTPException, omdb_guard.OMDbUnavailable):
         raise
     except Exception as e:
         logging.warning(f'Error fetching movie details: {e}')
         raise HTTPException(status_code=503, detail="Movie details service unavailable")
 
+# Watchlist owner: set by the authenticating proxy in front of the API, or the
+# default user for single-user deployments
+def get_user_id(x_user_id: Optional[str] = Header(None, min_length=1, max_length=255)) -> str:
+    return x_user_id or config.DEFAULT_USER_ID
+
+def _watchlist_etag(db: Session, user_id: str, resource: str, if_none_match: Optional[str]) -> Tuple[str, bool]:
+    # Only the user's watchlist version is read (a single-row lookup), so a matching
+    # If-None-Match is answered without touching the watchlist tables
+    tag = http_cache.etag(crud.get_watchlist_version(db, user_id), resource, user_id)
+    return tag, http_cache.matches(if_none_match, tag)
+
+def _json_movies(rows, response: Response) -> Response:
+    body = serialization.encode_movie_rows(rows, config.WATCHLIST_SERIALIZATION)
+    return Response(body, media_type="application/json", headers=dict(response.headers))
+
+def _ndjson_lines(movies: Iterable) -> Iterator[str]:
+    for movie in movies:
+        yield schemas.MovieResponse.model_validate(movie, from_attributes=True).model_dump_json() + "\n"
+
 # get movie watchlist, output: list of movies
+# optional keyset pagination (limit/cursor, next page token in X-Next-Cursor)
+# or NDJSON streaming (stream=true) for large lists
 @app.get("/api/v1/movies/", response_model=list[schemas.MovieResponse])
-def get_watchlist(watched: Optional[bool] = None, db: Session = Depends(get_db)):
-    if watched is None:
-        return crud.get_movie_watchlist(db)
-    return crud.get_movies_by_watched_status(db, watched)
+def get_watchlist(
+    response: Response,
+    watched: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    genre: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    tag, unchanged = _watchlist_etag(db, user_id, "movies", if_none_match)
+    if unchanged:
+        return http_cache.not_modified(tag)
+    http_cache.set_headers(response, tag)
+
+    if stream:
+        movies = crud.iter_movies(db, user_id, watched, genre=genre)
+        return StreamingResponse(_ndjson_lines(movies), media_type="application/x-ndjson", headers=dict(response.headers))
+
+    # Opt-in fast path: plain rows encoded straight to JSON, same bytes as the response_model
+    fast = config.WATCHLIST_SERIALIZATION in ("validated", "trusted")
+
+    if limit is None and cursor is None:
+        if fast:
+            return _json_movies(crud.get_movie_rows(db, user_id, watched, genre=genre), response)
+        if watched is None:
+            return crud.get_movie_watchlist(db, user_id, genre=genre)
+        return crud.get_movies_by_watched_status(db, user_id, watched, genre=genre)
+
+    try:
+        after = pagination.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    page_size = limit or pagination.DEFAULT_PAGE_SIZE
+    # Fetch one extra row to learn whether another page follows
+    if fast:
+        movies = crud.get_movie_rows(db, user_id, watched, genre=genre, limit=page_size + 1, after=after)
+    else:
+        movies = crud.get_movies_page(db, user_id, watched, page_size + 1, after, genre=genre)
+    if len(movies) > page_size:
+        movies = movies[:page_size]
+        last = movies[-1]
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(last.date_added, last.movie_id)
+    return _json_movies(movies, response) if fast else movies
+
+# full-text search over saved movies, input: q (title/plot words), output: best matches first
+@app.get("/api/v1/watchlist/search", response_model=list[schemas.MovieResponse])
+def search_watchlist(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    return crud.search_watchlist(db, user_id, q, limit)
 
 # add movie to watchlist, input movie data
 @app.post('/api/v1/movies', response_model=schemas.MovieResponse, status_code=201)
-def add_movie_to_watchlist(req_body: schemas.MovieCreate, db: Session = Depends(get_db)):
-    movie_data = omdb_client.fetch_movie_by_id(req_body.imdb_id)
+async def add_movie_to_watchlist(
+    req_body: schemas.MovieCreate,
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    # DB session is synchronous; keep it off the event loop
+    # A movie another user already saved is in the catalog; OMDb is only asked for new ones
+    movie_data = await run_in_threadpool(crud.get_catalog_movie, db, req_body.imdb_id)
+    if movie_data is None:
+        movie_data = await async_omdb_client.fetch_movie_by_id(req_body.imdb_id)
     if not movie_data:
         raise HTTPException(status_code=404, detail="Movie not found")
     
-    status, movie = crud.add_movie(db, movie_data)
+    status, movie = await run_in_threadpool(crud.add_movie, db, user_id, movie_data)
     if status == "already_exists":
         raise HTTPException(status_code=400, detail="Movie is already in your watchlist")
     
     return movie
 
+# add many movies at once, input: list of imdb_ids, output: per-ID status
+@app.post('/api/v1/movies/bulk', response_model=schemas.MovieBulkResponse)
+async def add_movies_to_watchlist(
+    req_body: schemas.MovieBulkCreate,
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    imdb_ids = list(dict.fromkeys(req_body.imdb_ids))  # de-duplicate, keep request order
+    statuses = {}
+
+    existing = await run_in_threadpool(crud.get_existing_imdb_ids, db, user_id, imdb_ids)
+    for imdb_id in existing:
+        statuses[imdb_id] = "already_exists"
+
+    # Movies other users saved come from the catalog without an OMDb call
+    catalog = await run_in_threadpool(
+        crud.get_catalog_movies, db, [imdb_id for imdb_id in imdb_ids if imdb_id not in existing]
+    )
+
+    semaphore = asyncio.Semaphore(BULK_FETCH_CONCURRENCY)
+
+    async def fetch(imdb_id: str):
+        async with semaphore:
+            try:
+                return imdb_id, await async_omdb_client.fetch_movie_by_id(imdb_id)
+            except Exception as e:
+                logging.warning(f'Error fetching movie details for bulk add of {imdb_id}: {e}')
+                statuses[imdb_id] = "upstream_error"
+                return imdb_id, None
+
+    fetched = await asyncio.gather(
+        *(fetch(imdb_id) for imdb_id in imdb_ids if imdb_id not in existing and imdb_id not in catalog)
+    )
+
+    to_insert = []
+    requested = {}  # OMDb's imdbID -> ID as given in the request
+    for imdb_id, movie_data in [*catalog.items(), *fetched]:
+        if imdb_id in statuses:
+            continue
+        canonical = crud.imdb_id_of(movie_data) if movie_data else None
+        if not movie_data:
+            statuses[imdb_id] = "not_found"
+        elif canonical in requested:
+            # Two spellings of the same ID in one request; store it once
+            statuses[imdb_id] = "already_exists"
+        else:
+            to_insert.append(movie_data)
+            requested[canonical] = imdb_id
+
+    created, skipped = await run_in_threadpool(crud.add_movies, db, user_id, to_insert)
+    for movie in created:
+        statuses[requested[movie.imdb_id]] = "created"
+    for imdb_id in skipped:
+        statuses[requested.get(imdb_id, imdb_id)] = "already_exists"
+
+    return {"results": [{"imdb_id": imdb_id, "status": statuses[imdb_id]} for imdb_id in imdb_ids]}
+
 # update watched status, input: imdb_id, watched(boolean), output: updated movie details
 @app.patch("/api/v1/movies/{imdb_id}/watched", response_model=schemas.MovieWatchedResponse)
 def update_movie_status(
     imdb_id: str, 
     watched: bool,
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
-    updated_movie = crud.update_watched_status(db, imdb_id, watched)
+    updated_movie = crud.update_watched_status(db, user_id, imdb_id, watched)
     
     if not updated_movie:
         logging.warning(f"Attempt to update non-existent movie: {imdb_id}")
@@ -86,8 +252,8 @@ def update_movie_status(
 
 # delete movie, input: imdb_id, output: deleted movie details
 @app.delete("/api/v1/movies/{imdb_id}", response_model=schemas.MovieResponse)
-def delete_movie(imdb_id: str, db: Session = Depends(get_db)):
-    deleted_movie = crud.delete_movie(db, imdb_id)
+def delete_movie(imdb_id: str, user_id: str = Depends(get_user_id), db: Session = Depends(get_db)):
+    deleted_movie = crud.delete_movie(db, user_id, imdb_id)
 
     if not deleted_movie:
         logging.warning(f"Attempt to delete non-existent movie: {imdb_id}")
@@ -96,5 +262,52 @@ def delete_movie(imdb_id: str, db: Session = Depends(get_db)):
     return deleted_movie
 
 @app.get("/api/v1/analytics", response_model=schemas.AnalyticsResponse)
-def get_analytics(db: Session = Depends(get_db)):
-    return compute_movie_stats(db)
\ No newline at end of file
+def get_analytics(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    tag, unchanged = _watchlist_etag(db, user_id, "analytics", if_none_match)
+    if unchanged:
+        return http_cache.not_modified(tag)
+    http_cache.set_headers(response, tag)
+    return compute_movie_stats(db, user_id)
+
+# per-genre movie counts and average ratings
+@app.get("/api/v1/analytics/genres", response_model=list[schemas.GenreStatsResponse])
+def get_genre_analytics(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    tag, unchanged = _watchlist_etag(db, user_id, "analytics-genres", if_none_match)
+    if unchanged:
+        return http_cache.not_modified(tag)
+    http_cache.set_headers(response, tag)
+    return compute_genre_stats(db, user_id)
+
+# OMDb client cache, connection reuse, coalescing, limits, latency and refresh counters, and DB pool usage, for monitoring
+@app.get("/api/v1/stats")
+def get_stats():
+    return {
+        "db": get_pool_stats(),
+        "omdb": {
+            "cache": omdb_client.cache_stats(),
+            "http": omdb_client.connection_stats(),
+            "async_http": async_omdb_client.connection_stats(),
+            "coalescing": {
+                "sync": omdb_client.coalescing_stats(),
+                "async": async_omdb_client.coalescing_stats()
+            },
+            "limits": omdb_guard.stats(),
+            "latency": omdb_latency.stats(),
+            "refresh": refresher.refresh_stats()
+        }
+    }
+
+# Prometheus scrape endpoint: request latency/status, OMDb call latency, DB queries per request
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,256 @@
+"""
+Prometheus metrics for the API, its OMDb calls and its database queries.
+
+A small in-process registry rendered in the Prometheus text format by
+``GET /metrics``. ``MetricsMiddleware`` times every request by route template;
+``instrument_engine`` counts the SQL statements each request runs (through a
+context variable, so the per-request totals also cover sync handlers running
+in the threadpool); the OMDb clients report each upstream call through
+``observe_omdb``, each call refused by ``omdb_guard`` through
+``observe_omdb_rejection``, and retries and hedged requests through
+``observe_omdb_retry`` and ``observe_omdb_hedge``.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labelnames, k)} {_number(v)}" for k, v in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> (per-bucket counts, sum, count); the last bucket is +Inf
+        self._series: Dict[Labels, List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def sum(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        lines = self.header()
+        for labels, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status code.", ("method", "route", "status")
+))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route")
+))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."
+))
+omdb_duration = registry.register(Histogram(
+    "omdb_request_duration_seconds", "Upstream OMDb call latency by operation and outcome.", ("operation", "outcome")
+))
+omdb_rejections = registry.register(Counter(
+    "omdb_rejected_calls_total", "OMDb calls refused before reaching upstream, by reason.", ("reason",)
+))
+omdb_retries = registry.register(Counter(
+    "omdb_retries_total", "Upstream OMDb attempts retried after a timeout, connection error, 5xx or 429."
+))
+omdb_hedges = registry.register(Counter(
+    "omdb_hedged_requests_total", "Hedged OMDb calls by which request answered first.", ("winner",)
+))
+db_queries = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request.", ("route",), QUERY_COUNT_BUCKETS
+))
+db_duration = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per HTTP request.", ("route",)
+))
+
+
+class _RequestDb:
+    """SQL statement totals for the current request; shared with threadpool copies of the context."""
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_db: ContextVar[Optional[_RequestDb]] = ContextVar("request_db", default=None)
+
+
+def observe_omdb(operation: str, outcome: str, seconds: float) -> None:
+    omdb_duration.observe(seconds, operation, outcome)
+
+
+def observe_omdb_rejection(reason: str) -> None:
+    omdb_rejections.inc(reason)
+
+
+def observe_omdb_retry() -> None:
+    omdb_retries.inc()
+
+
+def observe_omdb_hedge(winner: str) -> None:
+    omdb_hedges.inc(winner)
+
+
+def instrument_engine(engine) -> None:
+    """Attribute every statement run on ``engine`` to the request that issued it."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _request_db.get() is not None:
+            conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        totals = _request_db.get()
+        start = conn.info.pop("query_start", None)
+        if totals is not None and start is not None:
+            totals.queries += 1
+            totals.seconds += time.perf_counter() - start
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths share one label so random URLs cannot blow up cardinality
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (no per-request task or body buffering)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        totals = _RequestDb()
+        token = _request_db.set(totals)
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            _request_db.reset(token)
+            route = _route_template(scope)
+            method = scope["method"]
+            http_requests.inc(method, route, status)
+            http_duration.observe(elapsed, method, route)
+            db_queries.observe(totals.queries, route)
+            db_duration.observe(totals.seconds, route)
+
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,249 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once per database and is recorded in the
+``schema_migrations`` table. The baseline creates any table missing from
+``app/models.py``, so on a fresh database the later migrations find nothing to
+change; on an older one they bring the existing tables forward:
+
+    python -m app.migrations upgrade
+    python -m app.migrations status
+
+Migrations that only add indexes run outside a transaction. On PostgreSQL they
+use CREATE/DROP INDEX CONCURRENTLY, so reads and writes continue while the
+index builds; an INVALID index left behind by an interrupted build is dropped
+and built again on the next run.
+"""
+import logging
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, List, Set
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+
+from app import aggregates, genres, models, search
+from app.config import DEFAULT_USER_ID
+from app.database import Base
+
+logger = logging.getLogger(__name__)
+
+# Kept out of Base.metadata so create_all and the models never see it
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+    # False for DDL that must run outside a transaction (CREATE INDEX CONCURRENTLY)
+    transactional: bool = True
+
+
+def _columns(connection: Connection, table: str) -> Set[str]:
+    return {column["name"] for column in inspect(connection).get_columns(table)}
+
+
+def _model_index(table: Table, name: str) -> Index:
+    return next(index for index in table.indexes if index.name == name)
+
+
+def _drop_invalid_index(connection: Connection, name: str) -> None:
+    # An interrupted CREATE INDEX CONCURRENTLY leaves an INVALID index that
+    # IF NOT EXISTS would then skip over
+    invalid = connection.execute(
+        text(
+            "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid:
+        logger.warning(f"Dropping invalid index {name} left by an interrupted build")
+        drop_index(connection, name)
+
+
+def create_index(connection: Connection, index: Index) -> None:
+    """CREATE INDEX IF NOT EXISTS for a model index; CONCURRENTLY on PostgreSQL."""
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=connection.dialect))
+    if connection.dialect.name == "postgresql":
+        _drop_invalid_index(connection, index.name)
+        ddl = re.sub(r"^CREATE (UNIQUE )?INDEX ", r"CREATE \1INDEX CONCURRENTLY ", ddl)
+    connection.exec_driver_sql(ddl)
+
+
+def drop_index(connection: Connection, name: str) -> None:
+    """DROP INDEX IF EXISTS; CONCURRENTLY on PostgreSQL."""
+    concurrently = "CONCURRENTLY " if connection.dialect.name == "postgresql" else ""
+    connection.exec_driver_sql(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+def _baseline(connection: Connection) -> None:
+    Base.metadata.create_all(bind=connection)
+
+
+def _watchlist_stats_version(connection: Connection) -> None:
+    # create_all does not alter existing tables
+    if "version" not in _columns(connection, "watchlist_stats"):
+        connection.execute(text("ALTER TABLE watchlist_stats ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+
+def _multi_user_watchlists(connection: Connection) -> None:
+    # Before multi-user support the totals were one global row; they are derived
+    # data, so the old tables are dropped and recreated per user by the rebuild below
+    if "user_id" not in _columns(connection, "watchlist_stats"):
+        models.GenreCount.__table__.drop(bind=connection)
+        models.WatchlistStats.__table__.drop(bind=connection)
+        Base.metadata.create_all(bind=connection)
+
+    # Movies used to carry their own watched flag and date added; they become the
+    # default user's watchlist entries, and the movies table the shared catalog
+    if "watched" in _columns(connection, "movies"):
+        if not connection.execute(text("SELECT 1 FROM watchlist_entries LIMIT 1")).first():
+            connection.execute(
+                text(
+                    "INSERT INTO watchlist_entries (user_id, movie_id, watched, date_added) "
+                    "SELECT :user_id, id, coalesce(watched, :false), coalesce(date_added, CURRENT_TIMESTAMP) FROM movies"
+                ),
+                {"user_id": DEFAULT_USER_ID, "false": False},
+            )
+
+    db = Session(bind=connection)
+    try:
+        aggregates.rebuild_all(db)
+    finally:
+        db.close()
+
+
+def _genre_links_and_search_index(connection: Connection) -> None:
+    # Movies saved before genres were normalized and before search existed
+    db = Session(bind=connection)
+    try:
+        genres.backfill(db)
+        search.rebuild(db)
+    finally:
+        db.close()
+
+
+def _workload_indexes(connection: Connection) -> None:
+    # The list index gains movie_id, the keyset tiebreaker, so pages need no sort
+    create_index(connection, _model_index(models.WatchlistEntry.__table__, "ix_watchlist_entries_user_watched_date_movie"))
+    drop_index(connection, "ix_watchlist_entries_user_watched_date")
+    create_index(connection, _model_index(models.Genre.__table__, "ix_genres_lower_name"))
+
+
+def _movie_last_refreshed_at(connection: Connection) -> None:
+    if "last_refreshed_at" not in _columns(connection, "movies"):
+        column_type = models.Movie.__table__.c.last_refreshed_at.type.compile(dialect=connection.dialect)
+        # Existing movies stay NULL (never refreshed), so the refresher takes them first
+        connection.execute(text(f"ALTER TABLE movies ADD COLUMN last_refreshed_at {column_type}"))
+
+
+def _refresh_indexes(connection: Connection) -> None:
+    create_index(connection, _model_index(models.Movie.__table__, "ix_movies_last_refreshed_at_id"))
+    create_index(connection, _model_index(models.WatchlistEntry.__table__, "ix_watchlist_entries_movie_id"))
+
+
+def _watchlist_date_added_not_null(connection: Connection) -> None:
+    # Keyset pages sort and resume on (date_added, movie_id); entries without a date get the migration's
+    connection.execute(text("UPDATE watchlist_entries SET date_added = CURRENT_TIMESTAMP WHERE date_added IS NULL"))
+    # SQLite cannot add the constraint to an existing column; every insert takes the server default there
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("ALTER TABLE watchlist_entries ALTER COLUMN date_added SET NOT NULL"))
+
+
+def _drop_legacy_movie_columns(connection: Connection) -> None:
+    # Migration 3 copied the single-user watched flag and date added into
+    # watchlist_entries; nothing reads them from movies since
+    for name in ("watched", "date_added"):
+        if name in _columns(connection, "movies"):
+            connection.execute(text(f"ALTER TABLE movies DROP COLUMN {name}"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "watchlist_stats_version", _watchlist_stats_version),
+    Migration(3, "multi_user_watchlists", _multi_user_watchlists),
+    # After 3: the backfill bumps every user's watchlist version
+    Migration(4, "genre_links_and_search_index", _genre_links_and_search_index),
+    Migration(5, "workload_indexes", _workload_indexes, transactional=False),
+    Migration(6, "movie_last_refreshed_at", _movie_last_refreshed_at),
+    Migration(7, "refresh_indexes", _refresh_indexes, transactional=False),
+    Migration(8, "watchlist_date_added_not_null", _watchlist_date_added_not_null),
+    Migration(9, "drop_legacy_movie_columns", _drop_legacy_movie_columns),
+]
+
+
+def applied_versions(engine: Engine) -> Set[int]:
+    with engine.begin() as connection:
+        schema_migrations.create(bind=connection, checkfirst=True)
+        return set(connection.execute(schema_migrations.select().with_only_columns(schema_migrations.c.version)).scalars())
+
+
+def pending(engine: Engine) -> List[Migration]:
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def _record(connection: Connection, migration: Migration) -> None:
+    connection.execute(
+        schema_migrations.insert().values(
+            version=migration.version, name=migration.name, applied_at=datetime.now(timezone.utc)
+        )
+    )
+
+
+def upgrade(engine: Engine) -> List[Migration]:
+    """Apply every pending migration in order. Returns the ones applied."""
+    applied = []
+    for migration in pending(engine):
+        logger.info(f"Applying migration {migration.version} {migration.name}")
+        if migration.transactional:
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                _record(connection, migration)
+        else:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                migration.upgrade(connection)
+            # Recorded only once the whole migration succeeded; its steps are idempotent
+            with engine.begin() as connection:
+                _record(connection, migration)
+        applied.append(migration)
+    return applied
+
+
+def main(argv) -> int:
+    from app.database import engine
+
+    if len(argv) != 1 or argv[0] not in ("upgrade", "status"):
+        print("usage: python -m app.migrations [upgrade|status]")
+        return 2
+    if engine is None:
+        print("Database is not configured. DB_CONNECTION_STRING is missing.")
+        return 2
+
+    if argv[0] == "upgrade":
+        applied = upgrade(engine)
+        for migration in applied:
+            print(f"Applied {migration.version} {migration.name}")
+        print(f"Database is up to date ({len(applied)} migration(s) applied)")
+        return 0
+    waiting = pending(engine)
+    for migration in MIGRATIONS:
+        print(f"{migration.version} {migration.name}: {'pending' if migration in waiting else 'applied'}")
+    return 1 if waiting else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
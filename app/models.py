@@ -1,6 +1,14 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, func
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Index, Table, DDL, event, func
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import relationship
 from app.database import Base
 
+# SQLite stores CURRENT_TIMESTAMP without microseconds; bind values in the same
+# format so equality comparisons (e.g. keyset pagination cursors) line up
+Timestamp = DateTime(timezone=True).with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
+
+# Shared catalog: each movie's OMDb metadata is stored once, however many users save it
 class Movie(Base):
     __tablename__ = "movies"
 
@@ -12,5 +20,111 @@ class Movie(Base):
     rating = Column(Float, nullable=True)
     plot = Column(String, nullable=True)
     poster_url = Column(String, nullable=True)
-    watched = Column(Boolean, default=False)
-    date_added = Column(DateTime(timezone=True), server_default=func.now())
+    # When rating/plot/poster_url were last fetched from OMDb (see app.refresher);
+    # NULL for movies stored before refreshes were tracked
+    last_refreshed_at = Column(Timestamp, nullable=True, default=func.now())
+
+    __table_args__ = (
+        # The refresher takes the stalest movies first
+        Index("ix_movies_last_refreshed_at_id", "last_refreshed_at", "id"),
+    )
+
+
+# One user's saved movie. Catalog fields read through to the movie, so an entry
+# serializes like a movie row with the user's watched flag and date added
+class WatchlistEntry(Base):
+    __tablename__ = "watchlist_entries"
+
+    user_id = Column(String, primary_key=True)
+    movie_id = Column(Integer, ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+    watched = Column(Boolean, nullable=False, default=False)
+    # Part of the keyset sort key: a NULL would neither sort nor encode into a cursor
+    date_added = Column(Timestamp, nullable=False, server_default=func.now())
+
+    movie = relationship(Movie, lazy="joined", innerjoin=True)
+
+    imdb_id = association_proxy("movie", "imdb_id")
+    title = association_proxy("movie", "title")
+    year = association_proxy("movie", "year")
+    genre = association_proxy("movie", "genre")
+    rating = association_proxy("movie", "rating")
+    plot = association_proxy("movie", "plot")
+    poster_url = association_proxy("movie", "poster_url")
+
+    __table_args__ = (
+        # Every list query filters on user and watched status and pages by (date_added, movie_id),
+        # so pages are read straight off this index with no sort
+        Index("ix_watchlist_entries_user_watched_date_movie", "user_id", "watched", "date_added", "movie_id"),
+        # Catalog refreshes find every user who saved a movie
+        Index("ix_watchlist_entries_movie_id", "movie_id"),
+    )
+
+
+# Full-text search index over title and plot (see app.search). PostgreSQL keeps a
+# generated tsvector column with a GIN index; SQLite gets an FTS5 external-content
+# table that the crud write functions keep in step. Neither is mapped on Movie.
+SEARCH_DDL = {
+    "postgresql": (
+        "ALTER TABLE movies ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(plot, '')), 'B')) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_movies_search_vector ON movies USING GIN (search_vector)",
+    ),
+    "sqlite": (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5("
+        "title, plot, content='movies', content_rowid='id', tokenize='porter unicode61')",
+    ),
+}
+for _dialect, _statements in SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Movie.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+# The PostgreSQL column and index go with the table; the FTS5 table does not
+event.listen(Movie.__table__, "before_drop", DDL("DROP TABLE IF EXISTS movies_fts").execute_if(dialect="sqlite"))
+
+
+# Normalized genres: OMDb's "Action, Crime, Drama" becomes three movie_genres rows
+class Genre(Base):
+    __tablename__ = "genres"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+
+    # Genre filters match names case-insensitively
+    __table_args__ = (Index("ix_genres_lower_name", func.lower(name)),)
+
+
+movie_genres = Table(
+    "movie_genres",
+    Base.metadata,
+    Column("movie_id", Integer, ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True),
+    Column("genre_id", Integer, ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True),
+    # Filtering by genre starts from the genre side
+    Index("ix_movie_genres_genre_id_movie_id", "genre_id", "movie_id"),
+)
+
+
+# Running totals per user, kept in step with the watchlist entries by the crud
+# write functions, so analytics can be read without scanning every movie
+class WatchlistStats(Base):
+    __tablename__ = "watchlist_stats"
+
+    user_id = Column(String, primary_key=True)
+    total_movies = Column(Integer, nullable=False, default=0)
+    number_watched = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    # Bumped by every write that changes the user's watchlist; read endpoints derive their ETags from it
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class GenreCount(Base):
+    __tablename__ = "genre_counts"
+
+    user_id = Column(String, primary_key=True)
+    genre = Column(String, primary_key=True)
+    movie_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # The most frequent genre is the top of this index for one user
+        Index("ix_genre_counts_user_id_movie_count", "user_id", "movie_count"),
+    )
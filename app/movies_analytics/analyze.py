@@ -1,48 +1,235 @@
+"""
+Summary statistics for an IMDb CSV export (title, genre, rating, votes, ...).
+
+The file is read in chunks with compact dtypes and folded into mergeable
+partial aggregates, so peak memory depends on the chunk size rather than the
+file size. The first run parses the CSV into a columnar cache (see
+``dataset``); later runs over the same file memory-map that instead:
+
+    python -m app.movies_analytics.analyze IMBD.csv
+    python -m app.movies_analytics.analyze dump.csv --chunksize 200000 --json
+    python -m app.movies_analytics.analyze dump.csv --no-cache   # parse the CSV every time
+
+Reported: average rating, most frequent genre, total rows, rows rated above
+8.0, the top 10 titles by rating and, over the first row of each title, the
+top 5 genres by count and the average rating per genre.
+"""
+import argparse
+import heapq
+import json
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
 import pandas as pd
-import numpy as np
-
-df = pd.read_csv("IMBD.csv")
-print(df.head())
-
-# Remove commas from votes and convert to int
-df["votes"] = df["votes"].str.replace(",", "")
-df["votes"] = pd.to_numeric(df["votes"], errors='coerce')
-df["votes"] = df["votes"].astype('Int64')
-# Convert rating to float
-df["rating"] = df["rating"].astype(float)
-# Strip whitespace from genre
-df["genre"] = df["genre"].str.strip()
-
-# Print the cleaned DataFrame
-print("after cleaning:")
-print(df.head())
-
-# Average rating
-average_rating = df["rating"].mean()
-# Most frequent genre
-most_frequent_genre = df["genre"].mode()[0]
-# Total number of movies
-total_movies = len(df)
-# Number of movies above 8.0 rating
-high_rating_count = (df["rating"] > 8.0).sum()
-# Top 10 movies by rating, with unique titles
-top_10_movies = df.sort_values(by="rating", ascending=False).drop_duplicates(subset=["title"]).head(10)
-
-print(f"Average rating: {average_rating}")
-print(f"Most frequent genre: {most_frequent_genre}")
-print(f"Total movies: {total_movies}")
-print(f"Movies with rating > 8: {high_rating_count}")
-print("Top 10 movies by rating:")
-print(top_10_movies[["title", "rating"]])
-
-# Top 5 genres by count, group the titles
-# get unique titles first, then count
-unique_titles = df.drop_duplicates(subset=["title"])
-top_genres = unique_titles["genre"].value_counts().head(5)
-print("Top 5 genres by count:")
-print(top_genres)
-
-# Average rating per genre
-unique_titles = df.drop_duplicates(subset=["title"])
-avg_rating_by_genre = unique_titles.groupby("genre")["rating"].mean().sort_values(ascending=False)
-print(avg_rating_by_genre.head())
\ No newline at end of file
+
+from app import ranking
+from app.movies_analytics import dataset
+from app.movies_analytics.dataset import DEFAULT_CHUNKSIZE, read_chunks
+
+DEFAULT_CSV = Path(__file__).parent / "IMBD.csv"
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".cache"
+HIGH_RATING = 8.0
+TOP_MOVIES = 10
+TOP_GENRES = 5
+
+
+def _ratings(chunk: pd.DataFrame) -> pd.Series:
+    # Ratings have one decimal; rounding the float32 values back gives exactly
+    # the float64 numbers a full read would
+    return chunk["rating"].astype("float64").round(1)
+
+
+def _tenths(ratings: pd.Series) -> pd.Series:
+    # Sums are kept in integer tenths so partials merge exactly, whatever the
+    # chunk size or merge order
+    return (ratings * 10).round()
+
+
+@dataclass
+class GenreTotals:
+    titles: int = 0
+    rating_tenths: int = 0
+    rating_count: int = 0
+
+    def merge(self, other: "GenreTotals") -> None:
+        self.titles += other.titles
+        self.rating_tenths += other.rating_tenths
+        self.rating_count += other.rating_count
+
+
+@dataclass
+class PartialStats:
+    """
+    Aggregates over some rows of the file. ``merge`` combines two partials into
+    the aggregates of their union, so chunks (or files) can be folded in any
+    order. The per-genre title totals assume each title was counted by one
+    partial only; ``analyze`` guarantees that by feeding only the first row of
+    every title into them.
+    """
+    rows: int = 0
+    rating_tenths: int = 0
+    rating_count: int = 0
+    high_rating: int = 0
+    genre_rows: Counter = field(default_factory=Counter)
+    genres: Dict[str, GenreTotals] = field(default_factory=dict)
+    # title -> (best rating, votes at that rating); at most ``top`` entries
+    best: Dict[str, Tuple[float, Optional[int]]] = field(default_factory=dict)
+    top: int = TOP_MOVIES
+
+    def update(self, chunk: pd.DataFrame, first_rows: pd.Series) -> None:
+        """Fold in a chunk; ``first_rows`` marks the first row of each title in the file."""
+        ratings = _ratings(chunk)
+        # Genres stay categorical; whitespace is stripped from the (few) group
+        # keys below instead of from every value
+        genres = chunk["genre"]
+        self.rows += len(chunk)
+        self.rating_tenths += int(_tenths(ratings).sum())
+        self.rating_count += int(ratings.count())
+        self.high_rating += int((ratings > HIGH_RATING).sum())
+        for genre, count in genres.value_counts(sort=False).items():
+            if count:
+                self.genre_rows[str(genre).strip()] += int(count)
+
+        firsts = ranking.group_aggregate(genres, _tenths(ratings), mask=first_rows.to_numpy())
+        for genre, rows, count, tenths in zip(firsts.groups, firsts.rows, firsts.count, firsts.sum):
+            self._genre(str(genre).strip()).merge(GenreTotals(int(rows), int(tenths), int(count)))
+
+        titles = chunk["title"]
+        best = ranking.top_k_distinct(ratings, titles, self.top, ties=titles)
+        votes = chunk["votes"].to_numpy(dtype=object, na_value=None)[best]
+        self._offer_best(zip(titles.to_numpy(dtype=object)[best], ratings.to_numpy()[best], votes))
+
+    def merge(self, other: "PartialStats") -> "PartialStats":
+        self.rows += other.rows
+        self.rating_tenths += other.rating_tenths
+        self.rating_count += other.rating_count
+        self.high_rating += other.high_rating
+        self.genre_rows.update(other.genre_rows)
+        for genre, totals in other.genres.items():
+            self._genre(genre).merge(totals)
+        self._offer_best((title, rating, votes) for title, (rating, votes) in other.best.items())
+        return self
+
+    def _genre(self, genre: str) -> GenreTotals:
+        totals = self.genres.get(genre)
+        if totals is None:
+            totals = self.genres[genre] = GenreTotals()
+        return totals
+
+    def _offer_best(self, candidates: Iterable[Tuple[str, float, Optional[int]]]) -> None:
+        for title, rating, votes in candidates:
+            current = self.best.get(title)
+            if current is None or rating > current[0]:
+                self.best[title] = (float(rating), votes)
+        if len(self.best) > self.top:
+            keep = heapq.nsmallest(self.top, self.best.items(), key=_best_order)
+            self.best = dict(keep)
+
+    def result(self) -> Dict:
+        by_genre = [
+            {
+                "genre": genre,
+                "average_rating": _average(totals.rating_tenths, totals.rating_count),
+                "titles": totals.titles,
+            }
+            for genre, totals in self.genres.items()
+            if totals.rating_count
+        ]
+        by_genre.sort(key=lambda row: (-row["average_rating"], row["genre"]))
+        # Ties: the alphabetically first genre, like pandas' Series.mode()[0]
+        top_genre_rows = sorted(self.genre_rows.items(), key=lambda item: (-item[1], item[0]))
+        title_counts = sorted(
+            ((genre, totals.titles) for genre, totals in self.genres.items() if totals.titles),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return {
+            "total_movies": self.rows,
+            "average_rating": _average(self.rating_tenths, self.rating_count) if self.rating_count else None,
+            "most_frequent_genre": top_genre_rows[0][0] if top_genre_rows else None,
+            "high_rating_count": self.high_rating,
+            "top_movies": [
+                {"title": title, "rating": rating, "votes": votes}
+                for title, (rating, votes) in sorted(self.best.items(), key=_best_order)
+            ],
+            "top_genres": [{"genre": genre, "titles": count} for genre, count in title_counts[:TOP_GENRES]],
+            "average_rating_by_genre": by_genre,
+        }
+
+
+def _average(tenths: int, count: int) -> float:
+    return tenths / count / 10
+
+
+def _best_order(item):
+    title, (rating, _) = item
+    return (-rating, title)
+
+
+class TitleFilter:
+    """
+    Marks the first row of every title across chunks. Titles are remembered as
+    64-bit hashes, so this is the one structure that grows with the number of
+    distinct titles (8 bytes of hash each, not the title strings).
+    """
+
+    def __init__(self):
+        self._seen: Set[int] = set()
+
+    def first_rows(self, titles: pd.Series) -> pd.Series:
+        hashes = pd.util.hash_pandas_object(titles, index=False)
+        new = ~hashes.duplicated() & ~hashes.isin(self._seen)
+        self._seen.update(hashes[new].tolist())
+        return new
+
+
+def analyze(chunks: Iterable[pd.DataFrame], top: int = TOP_MOVIES) -> Dict:
+    stats = PartialStats(top=top)
+    titles = TitleFilter()
+    for chunk in chunks:
+        stats.update(chunk, titles.first_rows(chunk["title"]))
+    return stats.result()
+
+
+def analyze_csv(path=DEFAULT_CSV, chunksize: int = DEFAULT_CHUNKSIZE, top: int = TOP_MOVIES, cache_dir=None) -> Dict:
+    """Stats for the CSV at ``path``, read through the columnar cache in ``cache_dir`` when given."""
+    if cache_dir is None:
+        return analyze(read_chunks(path, chunksize), top)
+    return analyze(dataset.load(path, cache_dir, chunksize).chunks(chunksize), top)
+
+
+def format_report(result: Dict) -> str:
+    lines = [
+        f"Average rating: {result['average_rating']}",
+        f"Most frequent genre: {result['most_frequent_genre']}",
+        f"Total movies: {result['total_movies']}",
+        f"Movies with rating > {HIGH_RATING:g}: {result['high_rating_count']}",
+        f"Top {len(result['top_movies'])} movies by rating:",
+    ]
+    lines += [f"  {movie['rating']:4.1f}  {movie['title']}" for movie in result["top_movies"]]
+    lines.append(f"Top {TOP_GENRES} genres by count:")
+    lines += [f"  {row['titles']:6d}  {row['genre']}" for row in result["top_genres"]]
+    lines.append("Average rating per genre:")
+    lines += [f"  {row['average_rating']:.3f}  {row['genre']}" for row in result["average_rating_by_genre"][:TOP_GENRES]]
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summary statistics for an IMDb CSV export")
+    parser.add_argument("csv", nargs="?", type=Path, default=DEFAULT_CSV)
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk")
+    parser.add_argument("--top", type=int, default=TOP_MOVIES, help="top titles to report")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="columnar cache location")
+    parser.add_argument("--no-cache", action="store_true", help="parse the CSV instead of using the cache")
+    args = parser.parse_args(argv)
+
+    result = analyze_csv(args.csv, args.chunksize, args.top, None if args.no_cache else args.cache_dir)
+    print(json.dumps(result, indent=2) if args.json else format_report(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
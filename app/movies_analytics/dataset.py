@@ -0,0 +1,267 @@
+"""
+Columnar cache for IMDb CSV exports.
+
+Parsing a multi-GB CSV is most of the cost of an analysis, so ``ingest``
+parses it once (in chunks, with the cleaning applied) and writes each column
+to its own flat binary file. ``load`` then memory-maps those files: nothing is
+read until a chunk touches it, and columns a caller does not ask for are never
+read at all.
+
+The cache is keyed by a SHA-256 of the source file, so an edited CSV is
+re-ingested rather than served stale; a small index of (size, mtime) per
+source path avoids re-hashing an unchanged file on every run.
+
+Layout of ``<cache dir>/<sha256>-v<FORMAT_VERSION>/``:
+
+    manifest.json                   row count and source details
+    rating.f32                      float32, NaN when missing
+    votes.i32, votes.valid          int32 and a bool validity mask
+    title.codes, genre.codes        int32 dictionary codes, -1 when missing
+    title.offsets, genre.offsets    int64 offsets into the .data blob
+    title.data, genre.data          UTF-8 dictionary values, back to back
+
+The format is our own rather than Feather/Parquet because pyarrow is not a
+dependency of this project. Raw little-endian arrays can be memory-mapped by
+numpy with no copy and no extra package, and the four columns need nothing
+more. ``manifest.json`` records ``format_version``. ``Dataset`` refuses an
+entry written by another version, and ``ingest`` rebuilds such an entry (or
+one missing its manifest). Bump ``FORMAT_VERSION`` whenever the files above
+change.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+COLUMNS = ("title", "genre", "rating", "votes")
+DEFAULT_CHUNKSIZE = 100_000
+_INDEX_FILE = "sources.json"
+
+# Only the columns the stats need, in the smallest dtypes that hold them
+DTYPES = {
+    "title": "object",
+    "genre": "category",
+    "rating": "float32",
+    "votes": "Int32",
+}
+
+
+def read_chunks(path, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """Parse the CSV itself, a chunk at a time."""
+    # The parser applies thousands="," ("177,031") only to numpy numeric
+    # columns, so votes are parsed as float and narrowed one chunk at a time
+    parse_dtypes = {**DTYPES, "votes": "float64"}
+    reader = pd.read_csv(path, usecols=list(DTYPES), dtype=parse_dtypes, thousands=",", chunksize=chunksize)
+    for chunk in reader:
+        yield chunk.astype({"votes": DTYPES["votes"]})
+
+
+def file_hash(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while block := source.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Dictionary:
+    """Assigns int32 codes to strings in first-seen order while ingesting."""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, values: pd.Series) -> np.ndarray:
+        # Only the chunk's distinct values go through Python
+        local, uniques = pd.factorize(values)
+        codes = np.array([self.codes.setdefault(value, len(self.codes)) for value in uniques], dtype=np.int32)
+        return np.where(local >= 0, codes[local] if len(codes) else -1, -1).astype(np.int32)
+
+    def write(self, directory: Path, name: str) -> None:
+        encoded = [value.encode("utf-8") for value in self.codes]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        offsets.tofile(directory / f"{name}.offsets")
+        (directory / f"{name}.data").write_bytes(b"".join(encoded))
+
+
+def _write_columns(source, directory: Path, chunksize: int) -> int:
+    titles, genres = _Dictionary(), _Dictionary()
+    files = {
+        name: open(directory / name, "wb")
+        for name in ("rating.f32", "votes.i32", "votes.valid", "title.codes", "genre.codes")
+    }
+    rows = 0
+    try:
+        for chunk in read_chunks(source, chunksize):
+            rows += len(chunk)
+            chunk["rating"].to_numpy(dtype=np.float32, na_value=np.nan).tofile(files["rating.f32"])
+            chunk["votes"].to_numpy(dtype=np.int32, na_value=0).tofile(files["votes.i32"])
+            chunk["votes"].notna().to_numpy().tofile(files["votes.valid"])
+            titles.encode(chunk["title"]).tofile(files["title.codes"])
+            # Cleaned once here, so readers never strip again
+            genres.encode(chunk["genre"].astype("object").str.strip()).tofile(files["genre.codes"])
+    finally:
+        for handle in files.values():
+            handle.close()
+    titles.write(directory, "title")
+    genres.write(directory, "genre")
+    return rows
+
+
+def _read_index(cache_dir: Path) -> Dict:
+    try:
+        return json.loads((cache_dir / _INDEX_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _source_hash(source: Path, cache_dir: Path) -> str:
+    stat = source.stat()
+    entry = _read_index(cache_dir).get(str(source.resolve()))
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+    digest = file_hash(source)
+    index = _read_index(cache_dir)
+    index[str(source.resolve())] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(cache_dir / _INDEX_FILE, json.dumps(index, indent=2))
+    return digest
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w") as handle:
+        handle.write(text)
+    os.replace(tmp, path)
+
+
+def cache_path(source, cache_dir) -> Path:
+    source, cache_dir = Path(source), Path(cache_dir)
+    return cache_dir / f"{_source_hash(source, cache_dir)}-v{FORMAT_VERSION}"
+
+
+def _format_version(entry: Path) -> Optional[int]:
+    try:
+        return json.loads((entry / "manifest.json").read_text()).get("format_version")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def ingest(source, cache_dir, chunksize: int = DEFAULT_CHUNKSIZE) -> Path:
+    """Parse ``source`` into the cache unless an entry for its contents exists; returns the entry."""
+    target = cache_path(source, cache_dir)
+    if _format_version(target) == FORMAT_VERSION:
+        return target
+    if target.exists():
+        logger.warning(f"Rebuilding {target}: missing or unreadable manifest, or another format version")
+        shutil.rmtree(target, ignore_errors=True)
+
+    logger.info(f"Ingesting {source} into {target}")
+    # Built next to the target and renamed into place, so readers never see
+    # a half-written entry and a crashed ingest leaves nothing behind
+    building = Path(tempfile.mkdtemp(dir=target.parent, prefix=f".{target.name}."))
+    try:
+        building.chmod(0o755)
+        rows = _write_columns(source, building, chunksize)
+        (building / "manifest.json").write_text(json.dumps({
+            "format_version": FORMAT_VERSION,
+            "rows": rows,
+            "source": str(Path(source).resolve()),
+            "sha256": target.name.rsplit("-", 1)[0],
+        }, indent=2))
+        try:
+            os.rename(building, target)
+        except OSError:
+            # Another process finished the same ingest first
+            if not (target / "manifest.json").exists():
+                raise
+    finally:
+        shutil.rmtree(building, ignore_errors=True)
+    return target
+
+
+class Dataset:
+    """A cached, memory-mapped copy of one CSV."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / "manifest.json").read_text())
+        version = self.manifest.get("format_version")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} has cache format version {version}, expected {FORMAT_VERSION}")
+        self.rows: int = self.manifest["rows"]
+        self._genres: Optional[pd.Index] = None
+        self._dictionaries: Dict[str, tuple] = {}
+        self._maps: Dict[str, np.ndarray] = {}
+
+    def _map(self, name: str, dtype) -> np.ndarray:
+        if name not in self._maps:
+            self._maps[name] = (
+                np.memmap(self.path / name, dtype=dtype, mode="r", shape=(self.rows,))
+                if self.rows else np.empty(0, dtype=dtype)
+            )
+        return self._maps[name]
+
+    def _dictionary(self, name: str, codes) -> List[str]:
+        if name not in self._dictionaries:
+            offsets = np.memmap(self.path / f"{name}.offsets", dtype=np.int64, mode="r")
+            data = self.path / f"{name}.data"
+            blob = np.memmap(data, dtype=np.uint8, mode="r") if data.stat().st_size else np.empty(0, np.uint8)
+            self._dictionaries[name] = (offsets, blob)
+        offsets, blob = self._dictionaries[name]
+        return [blob[offsets[code]:offsets[code + 1]].tobytes().decode("utf-8") for code in codes]
+
+    def _genre_categories(self) -> pd.Index:
+        if self._genres is None:
+            size = (self.path / "genre.offsets").stat().st_size // 8 - 1
+            self._genres = pd.Index(self._dictionary("genre", range(size)), dtype="object")
+        return self._genres
+
+    def _titles(self, codes: np.ndarray) -> pd.Categorical:
+        # Decode only the titles in this slice, as a categorical sorted by
+        # title so sorting and ties behave exactly like the parsed strings
+        uniques, inverse = np.unique(codes, return_inverse=True)
+        present = uniques >= 0
+        names = np.array(self._dictionary("title", uniques[present]), dtype=object)
+        order = np.argsort(names, kind="stable")
+        rank = np.full(len(uniques), -1, dtype=np.int32)
+        rank[np.flatnonzero(present)[order]] = np.arange(len(order), dtype=np.int32)
+        return pd.Categorical.from_codes(rank[inverse], categories=pd.Index(names[order], dtype="object"))
+
+    def column(self, name: str, start: int = 0, stop: Optional[int] = None):
+        if name == "rating":
+            return np.asarray(self._map("rating.f32", np.float32)[start:stop])
+        if name == "votes":
+            values = np.array(self._map("votes.i32", np.int32)[start:stop])
+            valid = np.array(self._map("votes.valid", np.bool_)[start:stop])
+            return pd.arrays.IntegerArray(values, ~valid)
+        if name == "genre":
+            codes = np.asarray(self._map("genre.codes", np.int32)[start:stop])
+            return pd.Categorical.from_codes(codes, categories=self._genre_categories())
+        if name == "title":
+            return self._titles(np.asarray(self._map("title.codes", np.int32)[start:stop]))
+        raise KeyError(name)
+
+    def chunks(self, chunksize: int = DEFAULT_CHUNKSIZE, columns: Sequence[str] = COLUMNS) -> Iterator[pd.DataFrame]:
+        """Frames of up to ``chunksize`` rows holding only ``columns``."""
+        for start in range(0, self.rows, chunksize):
+            stop = min(start + chunksize, self.rows)
+            yield pd.DataFrame(
+                {name: self.column(name, start, stop) for name in columns},
+                index=pd.RangeIndex(start, stop),
+            )
+
+
+def load(source, cache_dir, chunksize: int = DEFAULT_CHUNKSIZE) -> Dataset:
+    """The cached dataset for ``source``, ingesting it first if needed."""
+    return Dataset(ingest(source, cache_dir, chunksize))
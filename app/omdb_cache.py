@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+# Sentinel returned on a cache miss, so a cached ``None`` (negative entry) can be told apart
+MISS = object()
+
+
+def search_key(title: str, page: int = 1) -> str:
+    return f"search:{title.strip().lower()}:{page}"
+
+
+def detail_key(imdb_id: str) -> str:
+    return f"detail:{imdb_id.strip().lower()}"
+
+
+class MemoryCache:
+    """In-process LRU cache where every entry carries its own expiry time."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    SQLite-backed cache shared by every worker process on the host.
+
+    WAL mode lets readers in other processes proceed while one process writes.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        # The file is opened on first use, so importing the app creates nothing on disk
+        self._opened = False
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # Caller holds the lock. None when the file cannot be opened (only the memory tier is used)
+        if not self._opened:
+            self._opened = True
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS omdb_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_omdb_cache_expires_at ON omdb_cache (expires_at)")
+                self._conn = conn
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"OMDb disk cache unavailable at '{self.path}', using memory only: {e}")
+        return self._conn
+
+    def get(self, key: str) -> Tuple[Any, float]:
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return MISS, 0.0
+            row = conn.execute(
+                "SELECT value, expires_at FROM omdb_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        if row is None:
+            return MISS, 0.0
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO omdb_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        # Caller holds the lock. Drop expired rows, then the soonest-to-expire overflow.
+        self._writes_since_prune = 0
+        conn.execute("DELETE FROM omdb_cache WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM omdb_cache WHERE key IN ("
+            "SELECT key FROM omdb_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM omdb_cache")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            # Reopened on next use
+            self._opened = False
+
+
+class OMDbCache:
+    """
+    Two-tier cache for OMDb responses: a small in-process LRU in front of a
+    persistent SQLite store. Values promoted from disk keep their original expiry.
+    """
+
+    def __init__(self, memory: MemoryCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+
+    def _memory_get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is not MISS:
+            self._count("memory_hits")
+        return value
+
+    def _disk_get(self, key: str) -> Any:
+        if self.disk is not None:
+            try:
+                value, expires_at = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"OMDb disk cache read failed for '{key}': {e}")
+                value = MISS
+            if value is not MISS:
+                self._count("disk_hits")
+                self.memory.set(key, value, expires_at)
+                return value
+
+        self._count("misses")
+        return MISS
+
+    def _disk_set(self, key: str, value: Any, expires_at: float) -> None:
+        try:
+            self.disk.set(key, value, expires_at)
+        except sqlite3.Error as e:
+            logger.warning(f"OMDb disk cache write failed for '{key}': {e}")
+
+    def get(self, key: str) -> Any:
+        value = self._memory_get(key)
+        if value is not MISS:
+            return value
+        return self._disk_get(key)
+
+    async def get_async(self, key: str) -> Any:
+        """get() for the event loop: the memory tier inline, the SQLite tier in a worker thread."""
+        value = self._memory_get(key)
+        if value is not MISS:
+            return value
+        if self.disk is None:
+            # Only counts the miss
+            return self._disk_get(key)
+        return await asyncio.to_thread(self._disk_get, key)
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            self._disk_set(key, value, expires_at)
+        self._count("sets")
+
+    async def set_async(self, key: str, value: Any, ttl: int) -> None:
+        """set() for the event loop: the memory tier inline, the SQLite tier in a worker thread."""
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+        self._count("sets")
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+        with self._counter_lock:
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+
+class NullCache:
+    """Stand-in used when caching is disabled; every lookup is a miss."""
+
+    def get(self, key: str) -> Any:
+        return MISS
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        pass
+
+    async def get_async(self, key: str) -> Any:
+        return MISS
+
+    async def set_async(self, key: str, value: Any, ttl: int) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "hits": 0, "memory_entries": 0}
+
+
+def build_cache():
+    if not config.OMDB_CACHE_ENABLED:
+        return NullCache()
+
+    # Opened on first use, not here
+    disk = DiskCache(config.OMDB_CACHE_PATH, config.OMDB_CACHE_DISK_MAX_ENTRIES) if config.OMDB_CACHE_PATH else None
+    return OMDbCache(MemoryCache(config.OMDB_CACHE_MAX_ENTRIES), disk)
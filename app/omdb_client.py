@@ -1,65 +1,241 @@
 import logging
+import threading
+import time
 import requests
-from typing import List, Dict, Any, Optional
-from app.config import OMDB_API_KEY
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Type
+from app import omdb_cache, omdb_guard, omdb_latency, http_pool, singleflight, metrics
+from app.config import (
+    OMDB_API_KEY,
+    OMDB_API_URL,
+    OMDB_CACHE_SEARCH_TTL,
+    OMDB_CACHE_DETAIL_TTL,
+    OMDB_CACHE_NEGATIVE_TTL,
+    OMDB_POOL_CONNECTIONS,
+    OMDB_POOL_MAXSIZE,
+    OMDB_POOL_BLOCK,
+    OMDB_HTTP_KEEPALIVE,
+)
 
 logger = logging.getLogger(__name__)
 
-OMDB_API_URL = "https://www.omdbapi.com/"
-REQUEST_TIMEOUT = 10  # 10sec
+# OMDb "Response": "False" errors that mean the title/ID genuinely does not exist.
+# Only these are cached; quota or API key errors must be retried.
+NEGATIVE_CACHE_ERRORS = {"Movie not found!", "Incorrect IMDb ID."}
 
-def search_movies(title: str, page: int = 1) -> List[Dict[str, Any]]:
-    params = {
+cache = omdb_cache.build_cache()
+# Concurrent cache misses for the same key share one upstream request
+flight = singleflight.SingleFlight()
+
+# Shared keep-alive session, opened on first use (the routes call async_omdb_client) and closed by the app lifespan
+http_stats = http_pool.ConnectionStats()
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def open_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = http_pool.build_session(
+                http_stats,
+                pool_connections=OMDB_POOL_CONNECTIONS,
+                pool_maxsize=OMDB_POOL_MAXSIZE,
+                pool_block=OMDB_POOL_BLOCK,
+                keepalive=OMDB_HTTP_KEEPALIVE,
+            )
+            logger.debug(f"Opened OMDb HTTP session (pool_maxsize={OMDB_POOL_MAXSIZE})")
+        return _session
+
+
+def close_session() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _send(params: Dict[str, Any]) -> requests.Response:
+    """One attempt. Raises omdb_guard.OMDbUnavailable, without calling OMDb, while the circuit is open or a limit is hit."""
+    if omdb_latency.deadline_passed():
+        raise requests.Timeout("Request deadline passed before OMDb was called")
+    wait = omdb_guard.admit()
+    if wait:
+        time.sleep(wait)
+    attempt = omdb_latency.Attempt()
+    session = _session or open_session()
+    http_stats.record_request()
+    try:
+        response = session.get(OMDB_API_URL, params=params, timeout=attempt.start())
+    except requests.RequestException as e:
+        attempt.failed(timed_out=isinstance(e, requests.Timeout))
+        raise
+    attempt.answered()
+    omdb_guard.record_response(response)
+    return response
+
+
+def _get(params: Dict[str, Any]) -> requests.Response:
+    """
+    An OMDb lookup, retried with jittered backoff after a timeout, connection
+    error, 5xx or 429 (see omdb_latency). Returns the last response, or raises
+    the last error, once the retries or the request deadline run out.
+    """
+    retries = omdb_latency.Retries()
+    while True:
+        try:
+            delay = retries.backoff(response=_send(params))
+        except omdb_guard.OMDbUnavailable as e:
+            retries.refused(e)
+            break
+        except (requests.Timeout, requests.ConnectionError) as e:
+            delay = retries.backoff(error=e)
+        if delay is None:
+            break
+        time.sleep(delay)
+    return retries.result()
+
+
+class _Lookup:
+    outcome = "error"
+
+
+# What an upstream lookup logs when it times out or otherwise fails, by operation
+_FAILURE_LOGS = {
+    "search": ("Timeout searching for movies with title '{}'", "Failed to search movies for '{}': {}"),
+    "detail": ("Timeout fetching movie with ID '{}'", "Failed to fetch movie data for '{}': {}"),
+}
+
+
+@contextmanager
+def observe_lookup(
+    operation: str,
+    subject: str,
+    timeout_error: Type[Exception],
+    http_error: Type[Exception],
+) -> Iterator[_Lookup]:
+    """
+    Times an upstream lookup (either client's, given its transport's exception
+    types) into metrics.observe_omdb and logs how it failed. The caller sets
+    ``outcome`` on the yielded object once OMDb has answered.
+    """
+    lookup = _Lookup()
+    timeout_log, failure_log = _FAILURE_LOGS[operation]
+    start = time.perf_counter()
+    try:
+        yield lookup
+    except omdb_guard.OMDbUnavailable:
+        # Refused before reaching OMDb; omdb_guard has logged why
+        lookup.outcome = "refused"
+        raise
+    except timeout_error:
+        lookup.outcome = "timeout"
+        logger.error(timeout_log.format(subject))
+        raise
+    except http_error as e:
+        logger.error(failure_log.format(subject, e))
+        raise
+    finally:
+        metrics.observe_omdb(operation, lookup.outcome, time.perf_counter() - start)
+
+
+def search_params(title: str, page: int = 1) -> Dict[str, Any]:
+    return {
         "apikey": OMDB_API_KEY,
         "s": title,
         "page": page
     }
-    
-    try:
-        response = requests.get(OMDB_API_URL, params=params, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data.get("Response") == "False":
-            logger.warning(f"OMDb API error for search '{title}': {data.get('Error', 'Unknown error')}")
-            return []
-        
-        results = data.get('Search', [])
-        logger.debug(f"Search for '{title}' returned {len(results)} results")
-        return results
-        
-    except requests.Timeout:
-        logger.error(f"Timeout searching for movies with title '{title}'")
-        raise
-    except requests.RequestException as e:
-        logger.error(f"Failed to search movies for '{title}': {e}")
-        raise
 
 
-def fetch_movie_by_id(imdb_id: str) -> Optional[Dict[str, Any]]:
-    params = {
+def detail_params(imdb_id: str) -> Dict[str, Any]:
+    return {
         "apikey": OMDB_API_KEY,
         "i": imdb_id,
         "plot": "full"
     }
-    
-    try:
-        response = requests.get(OMDB_API_URL, params=params, timeout=REQUEST_TIMEOUT)
+
+
+def search_result(title: str, data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+    """Results of a decoded OMDb search payload, and how long to cache them (0: not at all)."""
+    if data.get("Response") == "False":
+        logger.warning(f"OMDb API error for search '{title}': {data.get('Error', 'Unknown error')}")
+        return [], OMDB_CACHE_NEGATIVE_TTL if data.get("Error") in NEGATIVE_CACHE_ERRORS else 0
+
+    results = data.get('Search', [])
+    logger.debug(f"Search for '{title}' returned {len(results)} results")
+    return results, OMDB_CACHE_SEARCH_TTL
+
+
+def detail_result(imdb_id: str, data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Movie dict (or None) of a decoded OMDb detail payload, and how long to cache it (0: not at all)."""
+    if data.get("Response") == "False":
+        logger.warning(f"Movie not found for IMDb ID '{imdb_id}': {data.get('Error', 'Unknown error')}")
+        return None, OMDB_CACHE_NEGATIVE_TTL if data.get("Error") in NEGATIVE_CACHE_ERRORS else 0
+
+    logger.debug(f"Successfully fetched movie details for '{imdb_id}'")
+    return data, OMDB_CACHE_DETAIL_TTL
+
+
+def parse_search_response(title: str, key: str, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turn a decoded OMDb search payload into results and populate the cache."""
+    results, ttl = search_result(title, data)
+    cache.set(key, results, ttl)
+    return results
+
+
+def parse_detail_response(imdb_id: str, key: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Turn a decoded OMDb detail payload into a movie dict (or None) and populate the cache."""
+    movie, ttl = detail_result(imdb_id, data)
+    cache.set(key, movie, ttl)
+    return movie
+
+
+def search_movies(title: str, page: int = 1) -> List[Dict[str, Any]]:
+    key = omdb_cache.search_key(title, page)
+    cached = cache.get(key)
+    if cached is not omdb_cache.MISS:
+        logger.debug(f"Cache hit for search '{title}'")
+        return cached
+
+    return flight.do(key, lambda: _search_upstream(title, page, key))
+
+
+def _search_upstream(title: str, page: int, key: str) -> List[Dict[str, Any]]:
+    with observe_lookup("search", title, requests.Timeout, requests.RequestException) as lookup:
+        response = _get(search_params(title, page))
         response.raise_for_status()
-        
-        data = response.json()
-        
-        if data.get("Response") == "False":
-            logger.warning(f"Movie not found for IMDb ID '{imdb_id}': {data.get('Error', 'Unknown error')}")
-            return None
-        
-        logger.debug(f"Successfully fetched movie details for '{imdb_id}'")
-        return data
-        
-    except requests.Timeout:
-        logger.error(f"Timeout fetching movie with ID '{imdb_id}'")
-        raise
-    except requests.RequestException as e:
-        logger.error(f"Failed to fetch movie data for '{imdb_id}': {e}")
-        raise
\ No newline at end of file
+        results = parse_search_response(title, key, response.json())
+        lookup.outcome = "ok" if results else "not_found"
+        return results
+
+
+def fetch_movie_by_id(imdb_id: str) -> Optional[Dict[str, Any]]:
+    key = omdb_cache.detail_key(imdb_id)
+    cached = cache.get(key)
+    if cached is not omdb_cache.MISS:
+        logger.debug(f"Cache hit for movie '{imdb_id}'")
+        return cached
+
+    return flight.do(key, lambda: _fetch_upstream(imdb_id, key))
+
+
+def _fetch_upstream(imdb_id: str, key: str) -> Optional[Dict[str, Any]]:
+    with observe_lookup("detail", imdb_id, requests.Timeout, requests.RequestException) as lookup:
+        response = _get(detail_params(imdb_id))
+        response.raise_for_status()
+        movie = parse_detail_response(imdb_id, key, response.json())
+        lookup.outcome = "ok" if movie else "not_found"
+        return movie
+
+
+def cache_stats() -> Dict[str, int]:
+    return cache.stats()
+
+
+def connection_stats() -> Dict[str, float]:
+    return http_stats.snapshot()
+
+
+def coalescing_stats() -> Dict[str, int]:
+    return flight.stats()
@@ -0,0 +1,427 @@
+"""
+Client-side limits around every upstream OMDb call.
+
+Checked in order before a call leaves the process:
+
+- a circuit breaker: after ``OMDB_BREAKER_FAILURES`` consecutive failures
+  (timeouts, connection errors, 5xx/429 responses) it opens and calls fail
+  immediately for ``OMDB_BREAKER_RESET_TIMEOUT`` seconds. It then goes
+  half-open: one trial call is let through, and it closes again if that call
+  succeeds and reopens if it fails;
+- a token bucket of ``OMDB_RATE_LIMIT`` calls per second (bursts up to
+  ``OMDB_RATE_BURST``). A call that would wait longer than
+  ``OMDB_RATE_MAX_WAIT`` seconds (or past its request's deadline) for a token
+  is refused instead;
+- the daily quota (``OMDB_DAILY_QUOTA`` calls per UTC day). The count is kept
+  in a SQLite file shared by every worker process on the host, like the disk
+  tier of the response cache. It is also spent when OMDb itself reports
+  "Request limit reached!".
+
+A refused call raises an ``OMDbUnavailable`` subclass carrying a
+``retry_after`` hint; the API answers those with 503 and a Retry-After
+header. The breaker and the bucket are per process. The async client goes
+through ``admit_async`` and ``record_response_async``, which run the quota's
+SQLite I/O in a worker thread so a contended file never stalls the event loop.
+``stats()`` is reported under ``omdb.limits`` in /api/v1/stats.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from app import config, deadline, metrics
+
+logger = logging.getLogger(__name__)
+
+# OMDb's error for a key that has used up its daily requests (sent with HTTP 401)
+QUOTA_ERROR = "Request limit reached!"
+
+
+class OMDbUnavailable(Exception):
+    """An OMDb call refused on the client side; retry after ``retry_after`` seconds."""
+    reason = "unavailable"
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(OMDbUnavailable):
+    reason = "circuit_open"
+
+
+class RateLimited(OMDbUnavailable):
+    reason = "rate_limited"
+
+
+class QuotaExhausted(OMDbUnavailable):
+    reason = "quota_exhausted"
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tokens = self.capacity
+            self._updated = self._clock()
+            self.rejections = 0
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        Take a token. Returns how long to wait before using it (0 when one was
+        available), or None, taking nothing, if that would be over ``max_wait``.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens can go negative: each waiter reserves the token that arrives after the previous one's
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                self.rejections += 1
+                return None
+            self._tokens -= 1
+            return wait
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.capacity,
+                "tokens": round(max(self._tokens, 0.0), 3),
+                "rejections": self.rejections,
+            }
+
+
+def _utc_day(now: Optional[datetime] = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+
+def seconds_until_utc_midnight(now: Optional[datetime] = None) -> float:
+    now = now or datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+class DailyQuota:
+    """
+    Calls made per UTC day, refused once ``limit`` is reached (0 disables the limit).
+
+    With a ``path`` the count lives in SQLite, so every worker process draws
+    on one quota and a restart does not reset it; otherwise it is in memory.
+    """
+
+    def __init__(self, limit: int, path: Optional[str] = None):
+        self.limit = limit
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # The file is opened on first use, so importing the app creates nothing on disk
+        self._opened = not path
+        self._memory: Dict[str, int] = {}
+        self.rejections = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # Caller holds the lock. None when there is no file or it cannot be opened
+        if not self._opened:
+            self._opened = True
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS omdb_quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+                self._conn = conn
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"OMDb quota file unavailable at '{self.path}', counting in memory only: {e}")
+        return self._conn
+
+    def _execute(self, statement: str, params: tuple) -> Optional[sqlite3.Cursor]:
+        # Caller holds the lock. None when the file is unavailable (the in-memory count is used)
+        conn = self._connection()
+        if conn is None:
+            return None
+        try:
+            conn.execute("INSERT OR IGNORE INTO omdb_quota (day, used) VALUES (?, 0)", (params[-1],))
+            return conn.execute(statement, params)
+        except sqlite3.Error as e:
+            logger.warning(f"OMDb quota update failed, counting in memory: {e}")
+            return None
+
+    def consume(self, now: Optional[datetime] = None) -> bool:
+        """Count one call against today's quota; False (nothing counted) when it is used up."""
+        day = _utc_day(now)
+        cap = self.limit if self.limit > 0 else None
+        with self._lock:
+            # One conditional UPDATE, so concurrent processes cannot overshoot the limit
+            cursor = self._execute(
+                "UPDATE omdb_quota SET used = used + 1 WHERE (? IS NULL OR used < ?) AND day = ?", (cap, cap, day)
+            )
+            if cursor is not None:
+                allowed = cursor.rowcount == 1
+            else:
+                used = self._memory.get(day, 0)
+                allowed = cap is None or used < cap
+                if allowed:
+                    # Only today's count is kept
+                    self._memory = {day: used + 1}
+            if not allowed:
+                self.rejections += 1
+            return allowed
+
+    def exhaust(self, now: Optional[datetime] = None) -> None:
+        """OMDb says the key is out of requests: mark today's quota as used up."""
+        if self.limit <= 0:
+            return
+        day = _utc_day(now)
+        with self._lock:
+            cursor = self._execute("UPDATE omdb_quota SET used = max(used, ?) WHERE day = ?", (self.limit, day))
+            if cursor is None:
+                self._memory = {day: max(self._memory.get(day, 0), self.limit)}
+
+    def used(self, now: Optional[datetime] = None) -> int:
+        day = _utc_day(now)
+        with self._lock:
+            conn = self._connection()
+            if conn is not None:
+                try:
+                    row = conn.execute("SELECT used FROM omdb_quota WHERE day = ?", (day,)).fetchone()
+                    return row[0] if row else 0
+                except sqlite3.Error:
+                    pass
+            return self._memory.get(day, 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._memory = {}
+            self.rejections = 0
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM omdb_quota")
+
+    def remaining(self) -> Optional[int]:
+        """Calls left today; None without a limit."""
+        return max(self.limit - self.used(), 0) if self.limit > 0 else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "used": self.used(),
+            "remaining": self.remaining(),
+            "resets_in_seconds": round(seconds_until_utc_midnight()),
+            "rejections": self.rejections,
+        }
+
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with half-open trial calls."""
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        half_open_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = max(half_open_calls, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = 0.0
+            self.trials = 0
+            self.times_opened = 0
+            self.rejections = 0
+
+    def allow(self) -> None:
+        """Raise CircuitOpen unless a call may go through now (as a trial call while half-open)."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.reset_timeout - self._clock()
+                if remaining > 0:
+                    self.rejections += 1
+                    raise CircuitOpen("OMDb circuit is open", retry_after=remaining)
+                self.state = HALF_OPEN
+                self.trials = 0
+                logger.info("OMDb circuit half-open; sending a trial request")
+            if self.state == HALF_OPEN:
+                if self.trials >= self.half_open_calls:
+                    self.rejections += 1
+                    raise CircuitOpen("OMDb circuit is half-open and its trial request is in flight", retry_after=1.0)
+                self.trials += 1
+
+    def release(self) -> None:
+        """A call let through by allow() was refused before it was sent."""
+        with self._lock:
+            if self.state == HALF_OPEN and self.trials > 0:
+                self.trials -= 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("OMDb circuit closed")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = self._clock()
+                self.times_opened += 1
+                logger.warning(
+                    f"OMDb circuit opened after {self.failures} consecutive failure(s); "
+                    f"failing fast for {self.reset_timeout}s"
+                )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self.state
+            if state == OPEN and self._clock() >= self.opened_at + self.reset_timeout:
+                # Becomes half-open on the next call
+                state = HALF_OPEN
+            return {
+                "state": state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejections": self.rejections,
+            }
+
+
+breaker = CircuitBreaker(config.OMDB_BREAKER_FAILURES, config.OMDB_BREAKER_RESET_TIMEOUT)
+bucket = TokenBucket(config.OMDB_RATE_LIMIT, config.OMDB_RATE_BURST)
+quota = DailyQuota(config.OMDB_DAILY_QUOTA, config.OMDB_QUOTA_PATH)
+
+
+def _refuse(error: OMDbUnavailable) -> None:
+    metrics.observe_omdb_rejection(error.reason)
+    logger.warning(f"OMDb call refused ({error.reason}): {error}; retry after {error.retry_after:.1f}s")
+    raise error
+
+
+def _take_token() -> float:
+    # The in-memory checks: breaker, then rate limit
+    try:
+        breaker.allow()
+    except CircuitOpen as e:
+        _refuse(e)
+    # Waiting for a token past the request's deadline would be wasted
+    max_wait = config.OMDB_RATE_MAX_WAIT
+    left = deadline.remaining()
+    if left is not None:
+        max_wait = min(max_wait, left)
+    wait = bucket.reserve(max_wait)
+    if wait is None:
+        breaker.release()
+        _refuse(RateLimited("OMDb client rate limit reached", retry_after=1 / bucket.rate))
+    return wait
+
+
+def _refuse_quota() -> None:
+    breaker.release()
+    _refuse(QuotaExhausted("OMDb daily quota used up", retry_after=seconds_until_utc_midnight()))
+
+
+def admit() -> float:
+    """
+    Let one upstream call through the breaker, the rate limit and the quota,
+    or raise OMDbUnavailable. Returns the seconds to wait before sending it.
+    """
+    wait = _take_token()
+    if not quota.consume():
+        _refuse_quota()
+    return wait
+
+
+async def admit_async() -> float:
+    """admit() for the event loop: the quota's SQLite write runs in a worker thread, so a busy file stalls only this call."""
+    wait = _take_token()
+    try:
+        allowed = await asyncio.to_thread(quota.consume)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    if not allowed:
+        _refuse_quota()
+    return wait
+
+
+def _feed_breaker(response) -> bool:
+    # True when OMDb says the key is out of requests
+    status = response.status_code
+    if status >= 500 or status == 429:
+        breaker.record_failure()
+        return False
+    # OMDb is up; an exhausted key is a quota problem, not an outage
+    breaker.record_success()
+    if status != 401:
+        return False
+    try:
+        error = response.json().get("Error")
+    except ValueError:
+        return False
+    if error != QUOTA_ERROR:
+        return False
+    logger.warning("OMDb reports the daily request limit reached")
+    return True
+
+
+def record_response(response) -> None:
+    """Feed a response (requests or httpx) into the breaker and the quota."""
+    if _feed_breaker(response):
+        quota.exhaust()
+
+
+async def record_response_async(response) -> None:
+    """record_response() for the event loop: the quota's SQLite write runs in a worker thread."""
+    if _feed_breaker(response):
+        await asyncio.to_thread(quota.exhaust)
+
+
+def release() -> None:
+    """An admitted call was abandoned (cancelled) before its answer: free its half-open trial slot."""
+    breaker.release()
+
+
+def record_failure() -> None:
+    """The call raised (timeout, connection error) before a response came back."""
+    breaker.record_failure()
+
+
+def reset() -> None:
+    breaker.reset()
+    bucket.reset()
+    quota.reset()
+
+
+def stats() -> Dict[str, Any]:
+    return {"circuit": breaker.snapshot(), "rate_limit": bucket.snapshot(), "quota": quota.snapshot()}
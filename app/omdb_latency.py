@@ -0,0 +1,273 @@
+"""
+Timeouts, retries and hedging for upstream OMDb calls.
+
+- Timeouts adapt to measured latency: each attempt gets ``OMDB_TIMEOUT_MULTIPLIER``
+  times the p99 of the last ``OMDB_LATENCY_WINDOW`` attempts, clamped between
+  ``OMDB_TIMEOUT_MIN`` and ``OMDB_TIMEOUT_MAX`` (the latter also applies until
+  ``OMDB_LATENCY_MIN_SAMPLES`` attempts have been measured). An attempt that
+  times out is recorded at its timeout, so timeouts widen again when OMDb slows
+  down instead of cutting off every call.
+- Lookups are idempotent GETs, so a timeout, connection error, 5xx or 429 is
+  retried up to ``OMDB_RETRIES`` times with full-jitter exponential backoff
+  (a random wait of up to ``OMDB_RETRY_BASE_DELAY * 2**n``, at most
+  ``OMDB_RETRY_MAX_DELAY``).
+- Retries and timeouts never run past the deadline of the API request the call
+  is made for (``app/deadline.py``).
+- With ``OMDB_HEDGE_ENABLED`` the async client sends a second request when the
+  first has not answered within the observed p95, and takes whichever answers
+  first.
+
+Every attempt, hedges included, passes ``omdb_guard`` and counts against the
+rate limit and the daily quota. ``stats()`` is reported under
+``omdb.latency`` in /api/v1/stats.
+
+Both clients share these decisions through ``Attempt`` (one request: its
+timeout, latency sample and what the breaker learns from it) and ``Retries``
+(whether to try again, and what a lookup finally reports). The clients only
+send requests and sleep, each with its own transport.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from app import deadline, metrics, omdb_guard
+from app.config import (
+    OMDB_HEDGE_ENABLED,
+    OMDB_LATENCY_MIN_SAMPLES,
+    OMDB_LATENCY_WINDOW,
+    OMDB_RETRIES,
+    OMDB_RETRY_BASE_DELAY,
+    OMDB_RETRY_MAX_DELAY,
+    OMDB_TIMEOUT_MAX,
+    OMDB_TIMEOUT_MIN,
+    OMDB_TIMEOUT_MULTIPLIER,
+)
+
+logger = logging.getLogger(__name__)
+
+# Shortest timeout handed to the HTTP client when the deadline is all but spent
+_MIN_ATTEMPT_TIMEOUT = 0.001
+
+
+class LatencyTracker:
+    """Latencies of the last ``window`` attempts, for quantiles."""
+
+    def __init__(self, window: int, min_samples: int):
+        self.min_samples = max(min_samples, 1)
+        self._samples: deque = deque(maxlen=max(window, 1))
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The ``q`` quantile (nearest rank) of the window; None until ``min_samples`` attempts are in."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CallStats:
+    """Retry and hedging counters, reported under /api/v1/stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.retries = 0
+            self.hedges = 0
+            self.hedge_wins = 0
+            self.deadline_exceeded = 0
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+        metrics.observe_omdb_retry()
+
+    def record_hedge(self, won: bool) -> None:
+        with self._lock:
+            self.hedges += 1
+            self.hedge_wins += won
+        metrics.observe_omdb_hedge("hedge" if won else "primary")
+
+    def record_deadline_exceeded(self) -> None:
+        with self._lock:
+            self.deadline_exceeded += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "deadline_exceeded": self.deadline_exceeded,
+            }
+
+
+tracker = LatencyTracker(OMDB_LATENCY_WINDOW, OMDB_LATENCY_MIN_SAMPLES)
+call_stats = CallStats()
+
+
+def adaptive_timeout() -> float:
+    """Timeout for one attempt from measured latency, before the request deadline is applied."""
+    p99 = tracker.quantile(0.99)
+    if p99 is None:
+        return OMDB_TIMEOUT_MAX
+    return min(max(p99 * OMDB_TIMEOUT_MULTIPLIER, OMDB_TIMEOUT_MIN), OMDB_TIMEOUT_MAX)
+
+
+def deadline_passed() -> bool:
+    """Whether the current request's deadline has passed, leaving no time to call OMDb."""
+    left = deadline.remaining()
+    if left is not None and left <= 0:
+        call_stats.record_deadline_exceeded()
+        return True
+    return False
+
+
+def attempt_timeout() -> float:
+    """Timeout for the next attempt: the adaptive timeout, cut to what is left of the request deadline."""
+    timeout = adaptive_timeout()
+    left = deadline.remaining()
+    if left is None:
+        return timeout
+    return max(min(timeout, left), _MIN_ATTEMPT_TIMEOUT)
+
+
+def hedge_delay() -> Optional[float]:
+    """How long the first request gets before a hedge is sent; None when hedging is off or latency is not known yet."""
+    if not OMDB_HEDGE_ENABLED:
+        return None
+    p95 = tracker.quantile(0.95)
+    left = deadline.remaining()
+    if p95 is None or (left is not None and left <= p95):
+        return None
+    return p95
+
+
+def retryable_status(status: int) -> bool:
+    return status >= 500 or status == 429
+
+
+def retry_delay(attempt: int) -> Optional[float]:
+    """
+    Backoff before retrying after failed attempt number ``attempt`` (0-based),
+    or None when retries are used up or the deadline leaves no room for another try.
+    """
+    if attempt >= OMDB_RETRIES:
+        return None
+    delay = random.uniform(0, min(OMDB_RETRY_MAX_DELAY, OMDB_RETRY_BASE_DELAY * 2 ** attempt))
+    left = deadline.remaining()
+    if left is not None and left < delay + OMDB_TIMEOUT_MIN:
+        return None
+    return delay
+
+
+class Attempt:
+    """
+    Bookkeeping of one request to OMDb, created once omdb_guard has admitted it.
+    The client calls ``start`` right before sending, then exactly one of
+    ``answered``, ``failed`` or ``cancelled``.
+    """
+
+    def __init__(self):
+        self.timeout: Optional[float] = None
+        self._start: Optional[float] = None
+
+    def start(self) -> float:
+        """The request is being sent; returns its timeout (taken now, as waiting for a token used up part of the deadline)."""
+        self.timeout = attempt_timeout()
+        self._start = time.perf_counter()
+        return self.timeout
+
+    def answered(self) -> None:
+        """OMDb answered; the client still hands the response to omdb_guard."""
+        tracker.record(time.perf_counter() - self._start)
+
+    def failed(self, timed_out: bool) -> None:
+        """The request raised before OMDb answered."""
+        if timed_out:
+            # Only a lower bound on the latency, but it keeps the timeout from shrinking while OMDb is slow
+            tracker.record(self.timeout)
+        omdb_guard.record_failure()
+
+    def cancelled(self) -> None:
+        """Lost a hedged race or the caller went away, possibly before the request was sent."""
+        # No outcome to report, but a half-open trial slot this call held must go to the next call
+        omdb_guard.release()
+        if self._start is not None:
+            tracker.record(time.perf_counter() - self._start)
+
+
+class Retries:
+    """
+    Retry decisions of one OMDb lookup. After each attempt the client passes
+    its response or transport error to ``backoff`` and sleeps for the delay it
+    returns; once that is None, ``result`` is what the lookup reports.
+    """
+
+    def __init__(self):
+        self.attempt = 0
+        self._response: Any = None
+        self._error: Optional[BaseException] = None
+
+    def backoff(self, response: Any = None, error: Optional[BaseException] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt; None when the response is final or the retries or deadline ran out."""
+        self._response, self._error = response, error
+        if error is None and not retryable_status(response.status_code):
+            return None
+        delay = retry_delay(self.attempt)
+        if delay is None:
+            return None
+        logger.warning(
+            f"OMDb attempt {self.attempt + 1} failed ({error or f'HTTP {response.status_code}'}); retrying in {delay:.2f}s"
+        )
+        call_stats.record_retry()
+        self.attempt += 1
+        return delay
+
+    def refused(self, error: "omdb_guard.OMDbUnavailable") -> None:
+        """omdb_guard refused an attempt: raised for the first one; for a retry the lookup ends with how OMDb itself failed."""
+        if self.attempt == 0:
+            raise error
+
+    def result(self) -> Any:
+        """The last response, or the last transport error raised."""
+        if self._error is not None:
+            raise self._error
+        return self._response
+
+
+def reset() -> None:
+    tracker.reset()
+    call_stats.reset()
+
+
+def stats() -> Dict[str, Any]:
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return round(value, 4) if value is not None else None
+
+    return {
+        "samples": len(tracker),
+        "p50": rounded(tracker.quantile(0.5)),
+        "p95": rounded(tracker.quantile(0.95)),
+        "p99": rounded(tracker.quantile(0.99)),
+        "timeout": rounded(adaptive_timeout()),
+        "hedging": OMDB_HEDGE_ENABLED,
+        **call_stats.snapshot(),
+    }
@@ -0,0 +1,23 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(date_added: datetime, movie_id: int) -> str:
+    """Opaque token pointing just past the given (date_added, id) sort key."""
+    payload = json.dumps([date_added.isoformat(), movie_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor. Raises ValueError for malformed tokens."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        date_added, movie_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(date_added), int(movie_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
@@ -0,0 +1,220 @@
+"""
+Vectorized top-K and grouped aggregation over columns of movie data.
+
+Everything here is linear in the number of rows: top-K uses partial selection
+(``np.partition``) and only fully sorts the K survivors, de-duplication and
+grouping use hash-based factorization, and grouped sums are ``np.bincount``.
+Inputs are array-likes (numpy arrays, pandas Series or Categoricals); results
+are row positions or per-group arrays.
+
+Ordering is deterministic: higher values first, ties broken by the ``ties``
+key (usually the title) ascending, then by position. Missing values never
+rank.
+
+pandas and numpy are heavy imports, so the API process imports this module
+only from code paths that already need them.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _values(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def _keys(keys):
+    # pd.factorize takes arrays, Series and Categoricals but not plain lists
+    return np.asarray(keys, dtype=object) if isinstance(keys, (list, tuple)) else keys
+
+
+def _take(column, positions: np.ndarray) -> np.ndarray:
+    # Gather just these rows, without first converting (or copying) the whole column
+    return pd.Series(_keys(column), copy=False).iloc[positions].to_numpy(dtype=object)
+
+
+def factorize(keys) -> np.ndarray:
+    """int codes for ``keys`` in order of first appearance; -1 for missing keys."""
+    codes, _ = pd.factorize(_keys(keys))
+    return codes
+
+
+def first_rows(keys) -> np.ndarray:
+    """Boolean mask of the first row of every distinct key (missing keys are never first)."""
+    keys = pd.Series(_keys(keys), copy=False)
+    return (~keys.duplicated() & keys.notna()).to_numpy()
+
+
+def _rank_keys(ties, positions: np.ndarray) -> np.ndarray:
+    # Dense ranks of the tie keys of just these rows, so lexsort can use them
+    if ties is None:
+        return positions
+    ranks, _ = pd.factorize(_take(ties, positions), sort=True)
+    # Missing tie keys go last
+    return np.where(ranks < 0, len(positions), ranks)
+
+
+def _prune(values: np.ndarray, positions: np.ndarray, m: int) -> np.ndarray:
+    """``positions`` whose value is at least the ``m``-th best among them (ties included)."""
+    if len(positions) <= m:
+        return positions
+    candidates = values[positions]
+    # O(n) partial selection, no sort
+    mth = -np.partition(-candidates, m - 1)[m - 1]
+    return positions[candidates >= mth]
+
+
+def _select(values: np.ndarray, positions: np.ndarray, k: int, ties) -> np.ndarray:
+    """The ``k`` best of ``positions`` (already free of NaN), best first."""
+    if k <= 0 or len(positions) == 0:
+        return np.zeros(0, dtype=np.intp)
+    positions = _prune(values, positions, k)
+    # Only the survivors (k plus any ties at the boundary) are sorted
+    order = np.lexsort((positions, _rank_keys(ties, positions), -values[positions]))
+    return positions[order[:k]]
+
+
+def _best_rows(values: np.ndarray, positions: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Of ``positions`` (with dense key ``codes``), the highest-valued row per key, first on ties."""
+    keep = codes >= 0
+    positions, codes = positions[keep], codes[keep]
+    if len(positions) == 0:
+        return positions
+    size = codes.max() + 1
+    candidates = values[positions]
+    # Two unbuffered scatter passes, linear and without a sort: the best value
+    # per key, then the first row holding it
+    best = np.full(size, -np.inf)
+    np.maximum.at(best, codes, candidates)
+    at_best = candidates == best[codes]
+    none = np.iinfo(np.intp).max
+    first = np.full(size, none, dtype=np.intp)
+    np.minimum.at(first, codes[at_best], positions[at_best])
+    return first[first != none]
+
+
+def _distinct_candidates(values: np.ndarray, positions: np.ndarray, keys, k: int) -> np.ndarray:
+    """
+    Rows holding the best value of every key that can make the top ``k``.
+
+    Prunes to the ``m`` best rows and grows ``m`` until they cover ``k``
+    distinct keys. Any key left out then has a best value below ``k`` keys
+    that are in, so usually one O(n) pass suffices.
+    """
+    m = k
+    while True:
+        pruned = _prune(values, positions, m)
+        best = _best_rows(values, pruned, factorize(_take(keys, pruned)))
+        if len(best) >= k or len(pruned) == len(positions):
+            return best
+        m *= 4
+
+
+def top_k(values, k: int, ties=None) -> np.ndarray:
+    """Row positions of the ``k`` largest ``values``, best first."""
+    values = _values(values)
+    return _select(values, np.flatnonzero(~np.isnan(values)), k, ties)
+
+
+def best_per_key(values, keys) -> np.ndarray:
+    """
+    Row position of the highest value for each key (first such row on ties),
+    in order of each key's first appearance; keys without a value are left out.
+    """
+    values = _values(values)
+    valid = np.flatnonzero(~np.isnan(values))
+    return _best_rows(values, valid, factorize(keys)[valid])
+
+
+def top_k_distinct(values, keys, k: int, ties=None) -> np.ndarray:
+    """Row positions of the ``k`` best keys, each at its highest value, best first."""
+    values = _values(values)
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    return _select(values, _distinct_candidates(values, np.flatnonzero(~np.isnan(values)), keys, k), k, ties)
+
+
+def _group_order(codes: np.ndarray, groups: int) -> np.ndarray:
+    # A stable argsort of 16-bit codes is a radix sort in numpy, i.e. linear
+    if groups <= np.iinfo(np.uint16).max:
+        return np.argsort(codes.astype(np.uint16), kind="stable")
+    return np.argsort(codes, kind="stable")
+
+
+def top_k_by_group(values, groups, k: int, keys=None, ties=None) -> Dict[object, np.ndarray]:
+    """
+    ``top_k`` (or ``top_k_distinct`` when ``keys`` is given) within each group.
+
+    Returns {group: row positions, best first} in order of first appearance;
+    rows with a missing group are left out.
+    """
+    values = _values(values)
+    codes, uniques = pd.factorize(_keys(groups))
+    valid = np.flatnonzero(~np.isnan(values) & (codes >= 0))
+    codes = codes[valid]
+    members = valid[_group_order(codes, len(uniques))]
+    ends = np.cumsum(np.bincount(codes, minlength=len(uniques)))
+    result = {}
+    for code, (start, end) in enumerate(zip(np.concatenate(([0], ends[:-1])), ends)):
+        if start == end:
+            continue
+        positions = members[start:end]
+        if keys is not None:
+            positions = _distinct_candidates(values, positions, keys, k)
+        result[uniques[code]] = _select(values, positions, k, ties)
+    return result
+
+
+@dataclass
+class GroupStats:
+    """Per-group totals, aligned with ``groups``."""
+    groups: np.ndarray
+    rows: np.ndarray
+    count: np.ndarray
+    sum: np.ndarray
+
+    @property
+    def mean(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 0, self.sum / np.maximum(self.count, 1), np.nan)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {"rows": self.rows, "count": self.count, "sum": self.sum, "mean": self.mean},
+            index=pd.Index(self.groups, name="group"),
+        )
+
+
+def group_aggregate(groups, values, mask: Optional[np.ndarray] = None) -> GroupStats:
+    """
+    Row count, non-missing value count, sum and mean of ``values`` per group.
+
+    ``mask`` restricts the rows, e.g. to ``first_rows(titles)`` so several
+    aggregations can share one de-duplication pass. Groups come out in order
+    of first appearance; rows with a missing group are left out.
+    """
+    values = _values(values)
+    codes, uniques = pd.factorize(_keys(groups))
+    uniques = np.asarray(uniques, dtype=object)
+    keep = codes >= 0
+    if mask is not None:
+        keep &= np.asarray(mask, dtype=bool)
+    codes, values = codes[keep], values[keep]
+    present = ~np.isnan(values)
+    size = len(uniques)
+    rows = np.bincount(codes, minlength=size)
+    count = np.bincount(codes[present], minlength=size)
+    total = np.bincount(codes[present], weights=values[present], minlength=size)
+    used = rows > 0
+    return GroupStats(uniques[used], rows[used], count[used], total[used])
+
+
+def most_frequent(groups) -> Optional[object]:
+    """The most common non-missing value; ties go to the smallest, like ``Series.mode()[0]``."""
+    codes, uniques = pd.factorize(_keys(groups))
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    if len(counts) == 0 or counts.max() == 0:
+        return None
+    return min(uniques[counts == counts.max()])
@@ -0,0 +1,218 @@
+"""
+Background refresh of catalog metadata from OMDb.
+
+A movie's rating, plot and poster are stored when it is first saved. The
+refresher re-fetches the movies due a refresh (never refreshed first, then
+least recently refreshed), one batch every ``REFRESH_INTERVAL`` seconds, and
+writes back only what changed. Every movie fetched gets a new
+``last_refreshed_at``, so the catalog is refreshed at a steady rate instead of
+in bursts.
+
+Several refreshers may run at once (every API worker with ``REFRESH_ENABLED``,
+plus any ``python -m app.refresher run``). Each claims its batch in the
+database before calling OMDb (``crud.claim_stale_movies``), so they split the
+due movies between them instead of all fetching the same ones. A claim lasts
+``REFRESH_INTERVAL`` seconds: a movie whose lookup failed, or whose refresher
+died mid-batch, is due again after that. Users who saved a changed movie get their rating totals adjusted
+and their watchlist version bumped. OMDb calls go through ``omdb_guard`` like
+any other, and the refresher stops short of the last
+``REFRESH_QUOTA_RESERVE`` calls of the daily quota.
+
+With ``REFRESH_ENABLED`` the API runs the loop as a task started from its
+lifespan. OMDb calls are async and database work runs in worker threads, so
+request handling is never blocked. It can also run as its own process:
+
+    python -m app.refresher run     # keep refreshing
+    python -m app.refresher once    # one batch, e.g. from cron
+"""
+import asyncio
+import logging
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import async_omdb_client, crud, omdb_guard
+from app.config import (
+    REFRESH_BATCH_SIZE,
+    REFRESH_CONCURRENCY,
+    REFRESH_INTERVAL,
+    REFRESH_MAX_AGE,
+    REFRESH_QUOTA_RESERVE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshStats:
+    """Counters for the refresh loop, reported under /api/v1/stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.batches = 0
+            self.refreshed = 0
+            self.changed = 0
+            self.errors = 0
+            self.last_batch_at: Optional[datetime] = None
+
+    def record_batch(self, refreshed: int, changed: int, errors: int, at: datetime) -> None:
+        with self._lock:
+            self.batches += 1
+            self.refreshed += refreshed
+            self.changed += changed
+            self.errors += errors
+            self.last_batch_at = at
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "refreshed": self.refreshed,
+                "changed": self.changed,
+                "errors": self.errors,
+                "last_batch_at": self.last_batch_at.isoformat() if self.last_batch_at else None,
+            }
+
+
+stats = RefreshStats()
+_task: Optional[asyncio.Task] = None
+
+
+def _claim_stale_movies(refreshed_before: datetime, limit: int) -> List[Tuple[int, str]]:
+    from app.database import SessionLocal
+
+    # Claimed movies look refreshed until REFRESH_INTERVAL from now, then are due again
+    claimed_until = refreshed_before + timedelta(seconds=REFRESH_INTERVAL)
+    db = SessionLocal()
+    try:
+        return crud.claim_stale_movies(db, refreshed_before, claimed_until, limit)
+    finally:
+        db.close()
+
+
+def _write_back(fetched: Dict[int, Optional[dict]], refreshed_at: datetime) -> List[str]:
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return crud.refresh_movies(db, fetched, refreshed_at)
+    finally:
+        db.close()
+
+
+def _batch_size() -> int:
+    # Refreshes can wait; requests get the last REFRESH_QUOTA_RESERVE calls of the daily quota
+    remaining = omdb_guard.quota.remaining()
+    if remaining is None:
+        return REFRESH_BATCH_SIZE
+    return min(REFRESH_BATCH_SIZE, remaining - REFRESH_QUOTA_RESERVE)
+
+
+async def _fetch_all(movies: List[Tuple[int, str]]) -> Dict[int, Optional[dict]]:
+    """Fresh OMDb payloads by movie id; movies whose lookup failed are left out and retried once their claim runs out."""
+    semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+    async def fetch(movie_id: int, imdb_id: str):
+        async with semaphore:
+            try:
+                return movie_id, await async_omdb_client.refetch_movie_by_id(imdb_id)
+            except Exception as e:
+                logger.warning(f"Error refreshing metadata for {imdb_id}: {e}")
+                return None
+
+    results = await asyncio.gather(*(fetch(movie_id, imdb_id) for movie_id, imdb_id in movies))
+    return dict(result for result in results if result is not None)
+
+
+async def refresh_batch(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Refresh one batch of the movies due a refresh. Returns how many were refreshed, changed and failed."""
+    now = now or datetime.now(timezone.utc)
+    # The quota is read from its SQLite file: off the event loop
+    batch_size = await asyncio.to_thread(_batch_size)
+    if batch_size <= 0:
+        return {"refreshed": 0, "changed": 0, "errors": 0}
+    # No database connection is held while OMDb is being called
+    movies = await asyncio.to_thread(_claim_stale_movies, now - timedelta(seconds=REFRESH_MAX_AGE), batch_size)
+    if not movies:
+        return {"refreshed": 0, "changed": 0, "errors": 0}
+    fetched = await _fetch_all(movies)
+    changed = await asyncio.to_thread(_write_back, fetched, now) if fetched else []
+    result = {"refreshed": len(fetched), "changed": len(changed), "errors": len(movies) - len(fetched)}
+    stats.record_batch(**result, at=now)
+    if changed:
+        logger.info(f"Refreshed metadata of {len(fetched)} movie(s); changed: {', '.join(changed)}")
+    return result
+
+
+async def run_forever() -> None:
+    """Refresh a batch every REFRESH_INTERVAL seconds until cancelled; a failed batch is retried next time."""
+    logger.info(
+        f"Metadata refresh started (batch={REFRESH_BATCH_SIZE}, interval={REFRESH_INTERVAL}s, max_age={REFRESH_MAX_AGE}s)"
+    )
+    while True:
+        try:
+            await refresh_batch()
+        except Exception:
+            logger.exception("Metadata refresh batch failed")
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+def start() -> asyncio.Task:
+    """Run the refresh loop as a task on the running event loop."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(run_forever(), name="metadata-refresh")
+    return _task
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        task, _task = _task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def refresh_stats() -> Dict[str, Any]:
+    return {"running": _task is not None and not _task.done(), **stats.snapshot()}
+
+
+async def _run(command: str) -> None:
+    async_omdb_client.open_client()
+    try:
+        if command == "once":
+            result = await refresh_batch()
+            print(f"Refreshed {result['refreshed']} movie(s), {result['changed']} changed, {result['errors']} failed")
+        else:
+            await run_forever()
+    finally:
+        await async_omdb_client.close_client()
+
+
+def main(argv) -> int:
+    from app.database import SessionLocal
+
+    if len(argv) != 1 or argv[0] not in ("run", "once"):
+        print("usage: python -m app.refresher [run|once]")
+        return 2
+    if SessionLocal is None:
+        print("Database is not configured. DB_CONNECTION_STRING is missing.")
+        return 2
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(_run(argv[0]))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
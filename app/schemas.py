@@ -1,11 +1,24 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal
 from datetime import datetime
+from app.config import BULK_MAX_ITEMS
 
 # Incoming POST request
 class MovieCreate(BaseModel):
     imdb_id: str
 
+# Incoming bulk POST request
+class MovieBulkCreate(BaseModel):
+    imdb_ids: List[str] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+# Per-ID outcome of a bulk add
+class MovieBulkResult(BaseModel):
+    imdb_id: str
+    status: Literal["created", "already_exists", "not_found", "upstream_error"]
+
+class MovieBulkResponse(BaseModel):
+    results: List[MovieBulkResult]
+
 # Response model for getting movie details
 class MovieResponse(BaseModel):
     imdb_id: str
@@ -35,4 +48,10 @@ class AnalyticsResponse(BaseModel):
     average_rating: Optional[float] = None
     most_frequent_genre: Optional[str] = None
     number_watched: int
-    total_movies: int
\ No newline at end of file
+    total_movies: int
+
+# Response model for per-genre analytics
+class GenreStatsResponse(BaseModel):
+    genre: str
+    movie_count: int
+    average_rating: Optional[float] = None
@@ -0,0 +1,149 @@
+"""
+Full-text search over the saved movies' titles and plots.
+
+The index covers the shared catalog; searches return the matching entries of
+one user's watchlist.
+
+PostgreSQL keeps a generated ``tsvector`` column with a GIN index on it, so
+the database maintains the index itself. SQLite uses an FTS5 external-content
+table (``movies_fts``) that the crud write functions update through
+``index_movies`` / ``unindex_movie``. Both are created with the movies table
+(``models.SEARCH_DDL``). Other dialects have no index and fall back to a
+case-insensitive substring match of every word (a scan, title matches first).
+Existing databases can be (re)indexed with:
+
+    python -m app.search rebuild
+"""
+import logging
+import sys
+from types import SimpleNamespace
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import and_, case, column, func, literal_column, or_, select, table, text
+from sqlalchemy.orm import Session, contains_eager
+from app import models
+
+logger = logging.getLogger(__name__)
+
+# Title matches outrank plot matches; the PostgreSQL weights live in models.SEARCH_DDL
+_FTS5_WEIGHTS = (10.0, 1.0)
+_movies_fts = table("movies_fts", column("rowid"))
+
+
+def create_index(connection) -> None:
+    """Create the search index for ``connection``'s dialect if it is missing."""
+    for statement in models.SEARCH_DDL.get(connection.dialect.name, ()):
+        connection.execute(text(statement))
+
+
+def _maintained_by_crud(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def index_movies(db: Session, movies: Iterable[models.Movie]) -> None:
+    """Add newly inserted movies (``id`` set) to the index."""
+    if not _maintained_by_crud(db):
+        return
+    rows = [{"id": m.id, "title": m.title, "plot": m.plot} for m in movies]
+    if rows:
+        db.execute(text("INSERT INTO movies_fts (rowid, title, plot) VALUES (:id, :title, :plot)"), rows)
+
+
+def unindex_movie(db: Session, movie: models.Movie) -> None:
+    """Remove a deleted movie; FTS5 needs the values that were indexed."""
+    if not _maintained_by_crud(db):
+        return
+    db.execute(
+        text("INSERT INTO movies_fts (movies_fts, rowid, title, plot) VALUES ('delete', :id, :title, :plot)"),
+        {"id": movie.id, "title": movie.title, "plot": movie.plot},
+    )
+
+
+def reindex_movies(db: Session, changes: Iterable[Tuple[models.Movie, Optional[str]]]) -> None:
+    """Re-index movies whose plot changed, given as (movie as indexed, new plot)."""
+    if not _maintained_by_crud(db):
+        return
+    for movie, plot in changes:
+        unindex_movie(db, movie)
+        index_movies(db, [SimpleNamespace(id=movie.id, title=movie.title, plot=plot)])
+
+
+def _fts5_query(q: str) -> str:
+    # Quote every term so user input cannot use FTS5 query syntax; terms are ANDed
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def _contains(column, term: str):
+    # ILIKE with the pattern characters of the term escaped
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+def search_movies(db: Session, user_id: str, q: str, limit: int) -> List[models.WatchlistEntry]:
+    """The user's saved movies whose title or plot match every word of ``q``, best match first."""
+    if not q.split():
+        return []
+    Entry = models.WatchlistEntry
+    entries = (
+        select(Entry)
+        .join(Entry.movie)
+        .options(contains_eager(Entry.movie))
+        .where(Entry.user_id == user_id)
+    )
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        query = func.plainto_tsquery(literal_column("'english'"), q)
+        vector = literal_column("movies.search_vector")
+        stmt = (
+            entries
+            .where(vector.op("@@")(query))
+            .order_by(func.ts_rank(vector, query).desc(), models.Movie.id)
+        )
+    elif dialect == "sqlite":
+        fts = literal_column("movies_fts")
+        stmt = (
+            entries
+            .join(_movies_fts, _movies_fts.c.rowid == models.Movie.id)
+            .where(fts.match(_fts5_query(q)))
+            .order_by(func.bm25(fts, *_FTS5_WEIGHTS), models.Movie.id)
+        )
+    else:
+        Movie = models.Movie
+        terms = q.split()
+        in_title = and_(*(_contains(Movie.title, term) for term in terms))
+        stmt = (
+            entries
+            .where(*(or_(_contains(Movie.title, term), _contains(Movie.plot, term)) for term in terms))
+            .order_by(case((in_title, 0), else_=1), Movie.id)
+        )
+    return list(db.scalars(stmt.limit(limit)))
+
+
+def rebuild(db: Session) -> None:
+    """Create the index if needed and repopulate it from the movies table."""
+    create_index(db.connection())
+    if _maintained_by_crud(db):
+        db.execute(text("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')"))
+    db.commit()
+
+
+def main(argv) -> int:
+    from app.database import SessionLocal
+
+    if argv != ["rebuild"]:
+        print("usage: python -m app.search rebuild")
+        return 2
+    if SessionLocal is None:
+        print("Database is not configured. DB_CONNECTION_STRING is missing.")
+        return 2
+
+    db = SessionLocal()
+    try:
+        rebuild(db)
+        print("Search index rebuilt")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
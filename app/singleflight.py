@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app import deadline
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def record(self, coalesced: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            if coalesced:
+                self.coalesced += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.coalesced = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.calls - self.coalesced,
+                "coalesced": self.coalesced,
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key into one execution.
+
+    The first caller runs ``fn``; callers arriving while it is in flight block
+    until it finishes and receive the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.counters = _Counters()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        self.counters.record(coalesced=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        return self.counters.snapshot()
+
+
+class AsyncSingleFlight:
+    """
+    asyncio variant of SingleFlight.
+
+    The shared call runs as its own task, so a caller being cancelled (e.g. the
+    client disconnecting) does not cancel the upstream request for the others.
+    It runs under the latest request deadline of its callers, and each caller
+    stops waiting (asyncio.TimeoutError) at its own.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, Tuple[asyncio.Task, deadline.SharedBudget]] = {}
+        self.counters = _Counters()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._tasks.get(key)
+        leader = call is None
+        if leader:
+            budget = deadline.SharedBudget()
+            task = asyncio.ensure_future(budget.run(fn))
+            self._tasks[key] = (task, budget)
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            task, budget = call
+            budget.join()
+        self.counters.record(coalesced=not leader)
+        left = deadline.remaining()
+        if left is None:
+            return await asyncio.shield(task)
+        return await asyncio.wait_for(asyncio.shield(task), left)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        call = self._tasks.get(key)
+        if call is not None and call[0] is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return self.counters.snapshot()
@@ -0,0 +1,193 @@
+"""
+Local OMDb stand-in for load tests and offline development.
+
+Serves the movies in ``fixtures/omdb_movies.json`` with OMDb's request and
+response format (``?s=`` search, ``?i=`` detail). Any other ID of the form
+``tt9NNNNNN`` gets a synthetic movie, so bulk loads can use as many distinct
+IDs as they need. Latency, server errors and hung requests can be injected:
+
+    python -m benchmarks.fake_omdb --port 8099 --latency-ms 80 --jitter-ms 20 --error-rate 0.01
+
+then run the API with ``OMDB_API_URL=http://127.0.0.1:8099/``.
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures" / "omdb_movies.json"
+SYNTHETIC_ID = re.compile(r"^tt9\d{6,7}$")
+SEARCH_PAGE_SIZE = 10
+
+
+@dataclass
+class Faults:
+    latency_ms: float = 0.0  # added to every response
+    jitter_ms: float = 0.0  # uniform +/- on top of latency_ms
+    error_rate: float = 0.0  # share of requests answered with HTTP 500
+    timeout_rate: float = 0.0  # share of requests held for hang_seconds before answering
+    hang_seconds: float = 30.0
+    seed: Optional[int] = None
+
+
+def load_fixtures(path: Path = FIXTURES_PATH) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        return {movie["imdbID"]: movie for movie in json.load(f)}
+
+
+class FakeOMDb:
+    """Thread-per-request HTTP server answering like www.omdbapi.com."""
+
+    def __init__(self, faults: Optional[Faults] = None, fixtures: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.faults = faults or Faults()
+        self.movies = fixtures if fixtures is not None else load_fixtures()
+        self._templates = list(self.movies.values())
+        self._random = random.Random(self.faults.seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self.requests = 0
+        self.errors = 0
+        self.hangs = 0
+
+    # -- responses -----------------------------------------------------
+
+    def movie(self, imdb_id: str) -> Optional[Dict[str, Any]]:
+        if imdb_id in self.movies:
+            return self.movies[imdb_id]
+        if SYNTHETIC_ID.match(imdb_id) and self._templates:
+            number = int(imdb_id[2:])
+            template = self._templates[number % len(self._templates)]
+            return {
+                **template,
+                "Title": f"{template['Title']} {number}",
+                "imdbID": imdb_id,
+                "imdbRating": f"{1 + number % 90 / 10:.1f}",
+            }
+        return None
+
+    def search(self, title: str, page: int) -> List[Dict[str, Any]]:
+        needle = title.strip().lower()
+        matches = [m for m in self.movies.values() if needle in m["Title"].lower()]
+        start = (page - 1) * SEARCH_PAGE_SIZE
+        return [
+            {"Title": m["Title"], "Year": m["Year"], "imdbID": m["imdbID"], "Type": m["Type"], "Poster": m["Poster"]}
+            for m in matches[start:start + SEARCH_PAGE_SIZE]
+        ]
+
+    def respond(self, query: Dict[str, str]) -> Dict[str, Any]:
+        if "i" in query:
+            movie = self.movie(query["i"])
+            return movie if movie else {"Response": "False", "Error": "Incorrect IMDb ID."}
+        if "s" in query:
+            results = self.search(query["s"], int(query.get("page", "1")))
+            if not results:
+                return {"Response": "False", "Error": "Movie not found!"}
+            return {"Search": results, "totalResults": str(len(results)), "Response": "True"}
+        return {"Response": "False", "Error": "Something went wrong."}
+
+    def _draw(self):
+        """Decide this request's delay and fault: (seconds, 'ok'|'error'|'hang')."""
+        faults = self.faults
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            delay = max(0.0, faults.latency_ms + self._random.uniform(-faults.jitter_ms, faults.jitter_ms)) / 1000
+            if roll < faults.timeout_rate:
+                self.hangs += 1
+                return faults.hang_seconds, "hang"
+            if roll < faults.timeout_rate + faults.error_rate:
+                self.errors += 1
+                return delay, "error"
+        return delay, "ok"
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                delay, outcome = fake._draw()
+                if delay:
+                    time.sleep(delay)
+                if outcome == "error":
+                    status, body = 500, b'{"Response":"False","Error":"Internal server error"}'
+                else:
+                    query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                    status, body = 200, json.dumps(fake.respond(query)).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "hangs": self.hangs}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Local OMDb stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    fake = FakeOMDb(Faults(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed,
+    ))
+    print(f"Fake OMDb listening on {fake.start(args.host, args.port)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark: how long ``import app.main`` takes and what it loads.
+
+Imports the app in a fresh interpreter under ``-X importtime`` and reports
+the wall time, RSS after import and the slowest top-level packages, then
+checks them against a budget (exit status 1 when over, or when a module that
+must stay lazy was imported):
+
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime --budget-ms 1200 --budget-rss-mb 120 --json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+DEFAULT_MODULE = "app.main"
+# Only needed by specific endpoints; importing them at startup is a regression
+LAZY_MODULES = ("pandas", "numpy")
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "rss_mb": peak / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "loaded": sorted(name for name in {lazy!r} if name in sys.modules),
+}}))
+"""
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)")
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Milliseconds per top-level package from ``-X importtime`` output."""
+    totals: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            # Self time, so nested imports are not counted twice
+            self_us, name = match.groups()
+            totals[name.split(".")[0]] += int(self_us) / 1000
+    return dict(totals)
+
+
+def measure(module: str = DEFAULT_MODULE, lazy: Sequence[str] = LAZY_MODULES) -> Dict:
+    env = dict(os.environ)
+    # Enough configuration for the app to import without touching real services
+    env.setdefault("DB_CONNECTION_STRING", "sqlite://")
+    env.setdefault("OMDB_API_KEY", "importtime")
+    env["PYTHONWARNINGS"] = "ignore"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, lazy=tuple(lazy))],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    probe["packages_ms"] = parse_importtime(result.stderr)
+    return probe
+
+
+def over_budget(result: Dict, budget_ms: float, budget_rss_mb: float) -> List[str]:
+    problems = []
+    if result["import_ms"] > budget_ms:
+        problems.append(f"import took {result['import_ms']:.0f}ms (budget {budget_ms:.0f}ms)")
+    if result["rss_mb"] > budget_rss_mb:
+        problems.append(f"RSS after import {result['rss_mb']:.1f}MB (budget {budget_rss_mb:.0f}MB)")
+    for name in result["loaded"]:
+        problems.append(f"{name} was imported at startup")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import-time and RSS budget for the API process")
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--budget-rss-mb", type=float, default=100.0)
+    parser.add_argument("--top", type=int, default=10, help="slowest packages to list")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    result = measure(args.module)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"import {args.module}: {result['import_ms']:.0f}ms, RSS {result['rss_mb']:.1f}MB")
+        slowest = sorted(result["packages_ms"].items(), key=lambda item: item[1], reverse=True)
+        for name, ms in slowest[:args.top]:
+            print(f"  {name:<24} {ms:8.1f}ms")
+
+    problems = over_budget(result, args.budget_ms, args.budget_rss_mb)
+    for problem in problems:
+        print(f"OVER BUDGET {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
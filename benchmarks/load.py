@@ -0,0 +1,286 @@
+"""
+End-to-end load benchmark for every route in app/main.py.
+
+By default the API runs in-process (ASGI transport, throwaway SQLite file) and
+talks to a FakeOMDb started on a free port, so no network or API key is
+needed. Each scenario sends a fixed number of requests at fixed concurrency and
+reports p50/p95/p99 latency, throughput and errors; the run also records peak
+RSS. Results are written as JSON and can be checked against a baseline:
+
+    python -m benchmarks.load --concurrency 16 --requests 200 --save-baseline
+    python -m benchmarks.load --concurrency 16 --requests 200   # exits 1 on regression
+
+Use ``--url`` to drive an API that is already running (then ``peak_rss_mb``
+only covers this harness) and ``--omdb-url`` to reuse a running fake.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import httpx
+
+from benchmarks.fake_omdb import FakeOMDb, Faults, load_fixtures
+
+RESULTS_DIR = Path(__file__).parent / "results"
+DEFAULT_OUTPUT = RESULTS_DIR / "latest.json"
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+# Synthetic IDs (see fake_omdb) per scenario, so writes never collide
+SEED_IDS = 9000000
+ADD_IDS = 9100000
+BULK_IDS = 9200000
+BULK_BATCH = 20
+SEED_MOVIES = 200
+
+
+@dataclass
+class Scenario:
+    name: str
+    request: Callable[[httpx.AsyncClient, int], Any]  # (client, request number) -> awaitable response
+    expect: int = 200
+
+
+def synthetic_id(base: int, n: int) -> str:
+    return f"tt{base + n}"
+
+
+def scenarios(search_terms: Sequence[str], fixture_ids: Sequence[str]) -> List[Scenario]:
+    """Every route, ordered so the write scenarios leave data for the reads after them."""
+    def pick(values, n):
+        return values[n % len(values)]
+
+    return [
+        Scenario("omdb_search", lambda c, n: c.get(f"/api/v1/search/{pick(search_terms, n)}")),
+        Scenario("omdb_details", lambda c, n: c.get(f"/api/v1/movies/{pick(fixture_ids, n)}")),
+        Scenario("add_movie", lambda c, n: c.post("/api/v1/movies", json={"imdb_id": synthetic_id(ADD_IDS, n)}), 201),
+        Scenario("bulk_add", lambda c, n: c.post("/api/v1/movies/bulk", json={
+            "imdb_ids": [synthetic_id(BULK_IDS, n * BULK_BATCH + i) for i in range(BULK_BATCH)]
+        })),
+        Scenario("list_all", lambda c, n: c.get("/api/v1/movies/")),
+        Scenario("list_page", lambda c, n: c.get("/api/v1/movies/", params={"limit": 100})),
+        Scenario("list_genre", lambda c, n: c.get("/api/v1/movies/", params={"genre": "Drama", "limit": 100})),
+        Scenario("list_stream", lambda c, n: c.get("/api/v1/movies/", params={"stream": "true"})),
+        Scenario("watchlist_search", lambda c, n: c.get("/api/v1/watchlist/search", params={"q": pick(search_terms, n)})),
+        Scenario("mark_watched", lambda c, n: c.patch(
+            f"/api/v1/movies/{synthetic_id(SEED_IDS, n % SEED_MOVIES)}/watched", params={"watched": str(n % 2 == 0).lower()}
+        )),
+        Scenario("analytics", lambda c, n: c.get("/api/v1/analytics")),
+        Scenario("analytics_genres", lambda c, n: c.get("/api/v1/analytics/genres")),
+        Scenario("stats", lambda c, n: c.get("/api/v1/stats")),
+        Scenario("metrics", lambda c, n: c.get("/metrics")),
+        Scenario("delete_movie", lambda c, n: c.delete(f"/api/v1/movies/{synthetic_id(ADD_IDS, n)}")),
+    ]
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(len(sorted_values) * pct / 100))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, wall_seconds: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        "throughput_rps": round(count / wall_seconds, 2) if wall_seconds else 0.0,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, float]:
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while (n := next(counter)) < requests:
+            start = time.perf_counter()
+            try:
+                response = await scenario.request(client, n)
+                ok = response.status_code == scenario.expect
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline`` beyond ``tolerance`` (0.2 = 20%)."""
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = results.get("scenarios", {}).get(name)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput_rps']}/s vs baseline {base['throughput_rps']}/s"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {base['errors']}")
+    base_rss, rss = baseline.get("peak_rss_mb"), results.get("peak_rss_mb")
+    if base_rss and rss and rss > base_rss * (1 + tolerance):
+        regressions.append(f"peak RSS {rss}MB vs baseline {base_rss}MB")
+    return regressions
+
+
+def check_baseline(results: Dict[str, Any], baseline: Path, tolerance: float) -> int:
+    """Exit status for a run: 1 when it regressed against ``baseline``, or when there is no baseline to compare with."""
+    if not baseline.exists():
+        # Passing without a comparison would hide every regression
+        print(f"No baseline at {baseline}; record one on this machine with --save-baseline")
+        return 1
+    regressions = compare(results, json.loads(baseline.read_text()), tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print("No regressions against baseline" if not regressions else f"{len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+
+def _in_process_client(omdb_url: str, workdir: str, omdb_cache: bool) -> httpx.AsyncClient:
+    # Configuration is read at import time, so set it before the app is imported
+    os.environ["DB_CONNECTION_STRING"] = f"sqlite:///{workdir}/bench.sqlite3"
+    os.environ["OMDB_API_URL"] = omdb_url
+    os.environ.setdefault("OMDB_API_KEY", "benchmark")
+    # A disk cache left by an earlier run would answer calls this run is meant to make
+    os.environ["OMDB_CACHE_PATH"] = ""
+    os.environ["OMDB_CACHE_ENABLED"] = "true" if omdb_cache else "false"
+    # The stand-in server has no limits to protect
+    os.environ["OMDB_RATE_LIMIT"] = "0"
+    os.environ["OMDB_DAILY_QUOTA"] = "0"
+    os.environ["OMDB_QUOTA_PATH"] = ""
+
+    from app.database import Base, engine
+    from app.main import app
+
+    # One INFO line per request would swamp the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    Base.metadata.create_all(bind=engine)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60)
+
+
+async def run(args) -> Dict[str, Any]:
+    fixtures = load_fixtures()
+    fake = None
+    omdb_url = args.omdb_url
+    if omdb_url is None:
+        fake = FakeOMDb(Faults(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            timeout_rate=args.timeout_rate,
+            seed=0,
+        ), fixtures)
+        omdb_url = fake.start()
+
+    workdir = tempfile.TemporaryDirectory()
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        client = _in_process_client(omdb_url, workdir.name, not args.no_omdb_cache)
+
+    search_terms = [movie["Title"].split()[-1] for movie in fixtures.values()]
+    selected = [s for s in scenarios(search_terms, list(fixtures)) if not args.scenarios or s.name in args.scenarios]
+    results: Dict[str, Any] = {
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "target": args.url or "in-process",
+            "omdb_latency_ms": args.latency_ms,
+            "omdb_error_rate": args.error_rate,
+            "omdb_timeout_rate": args.timeout_rate,
+            "omdb_cache": not args.no_omdb_cache,
+        },
+        "scenarios": {},
+    }
+    try:
+        async with client:
+            # Movies for the update scenario; not timed
+            for start in range(0, SEED_MOVIES, BULK_BATCH):
+                await client.post("/api/v1/movies/bulk", json={
+                    "imdb_ids": [synthetic_id(SEED_IDS, n) for n in range(start, start + BULK_BATCH)]
+                })
+            for scenario in selected:
+                summary = await run_scenario(client, scenario, args.requests, args.concurrency)
+                results["scenarios"][scenario.name] = summary
+                print(
+                    f"{scenario.name:<18} p50 {summary['p50_ms']:>9.2f}ms  p95 {summary['p95_ms']:>9.2f}ms  "
+                    f"p99 {summary['p99_ms']:>9.2f}ms  {summary['throughput_rps']:>9.1f}/s  errors {summary['errors']}"
+                )
+            if not args.url:
+                from app import async_omdb_client
+                await async_omdb_client.close_client()
+    finally:
+        if fake is not None:
+            results["fake_omdb"] = fake.stats()
+            fake.stop()
+        workdir.cleanup()
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    print(f"peak RSS {results['peak_rss_mb']}MB")
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load benchmark for the watchlist API")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--scenarios", nargs="*", help="only run these scenarios")
+    parser.add_argument("--url", help="benchmark a running API instead of an in-process one")
+    parser.add_argument("--omdb-url", help="use a running fake OMDb instead of starting one")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fake OMDb latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--no-omdb-cache", action="store_true", help="send every OMDb call upstream")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    return check_baseline(results, args.baseline, args.tolerance)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Benchmark for app/ranking.py against the sort-based pandas idioms it replaces.
+
+Generates synthetic movie rows (rating with 5% missing, title keys with
+repeats, 500 genres) and times, at each size:
+
+- top 10 distinct titles: ``sort_values + drop_duplicates + head`` vs ``top_k_distinct``
+- top 10 distinct titles per genre: ``sort_values + drop_duplicates + groupby.head``
+  vs ``top_k_by_group``
+- per-genre mean over unique titles: ``drop_duplicates + groupby.mean`` vs
+  ``first_rows + group_aggregate``
+
+and checks that both sides agree. The last column is time per row relative to
+the smallest size, so a linear implementation stays near 1.0:
+
+    python -m benchmarks.ranking --rows 1000000 10000000
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from app import ranking
+
+K = 10
+GENRES = 500
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ratings = rng.integers(10, 100, rows).astype(np.float32) / 10
+    ratings[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        # Integer keys stand in for titles; each appears about 3 times
+        "title": rng.integers(0, max(rows // 3, 1), rows),
+        "genre": rng.integers(0, GENRES, rows).astype(np.int32),
+        "rating": ratings,
+    })
+
+
+def pandas_cases(df: pd.DataFrame) -> Dict[str, Callable]:
+    def top():
+        ranked = df.sort_values(["rating", "title"], ascending=[False, True]).drop_duplicates("title")
+        return ranked.head(K)["title"].tolist()
+
+    def top_by_genre():
+        ranked = df.dropna(subset=["rating"]).sort_values(["rating", "title"], ascending=[False, True])
+        ranked = ranked.drop_duplicates(["genre", "title"])
+        return {g: group["title"].tolist() for g, group in ranked.groupby("genre").head(K).groupby("genre")}
+
+    def genre_means():
+        return df.drop_duplicates("title").groupby("genre")["rating"].mean().to_dict()
+
+    return {"top_k_distinct": top, "top_k_by_group": top_by_genre, "group_mean": genre_means}
+
+
+def ranking_cases(df: pd.DataFrame) -> Dict[str, Callable]:
+    titles, genres, ratings = df["title"].to_numpy(), df["genre"].to_numpy(), df["rating"].to_numpy()
+
+    def top():
+        return titles[ranking.top_k_distinct(ratings, titles, K, ties=titles)].tolist()
+
+    def top_by_genre():
+        result = ranking.top_k_by_group(ratings, genres, K, keys=titles, ties=titles)
+        return {g: titles[positions].tolist() for g, positions in result.items()}
+
+    def genre_means():
+        stats = ranking.group_aggregate(genres, ratings, mask=ranking.first_rows(titles))
+        return dict(zip(stats.groups.tolist(), stats.mean.tolist()))
+
+    return {"top_k_distinct": top, "top_k_by_group": top_by_genre, "group_mean": genre_means}
+
+
+def timed(fn: Callable, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def same(left, right) -> bool:
+    if isinstance(left, dict) and left and isinstance(next(iter(left.values())), float):
+        return left.keys() == right.keys() and all(np.isclose(left[k], right[k], equal_nan=True) for k in left)
+    return left == right
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="top-K / group-by benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    per_row: Dict[str, float] = {}
+    ok = True
+    print(f"{'rows':>11} {'case':<16} {'pandas':>10} {'ranking':>10} {'speedup':>8} {'ns/row':>8} {'vs first':>8}")
+    for rows in sorted(args.rows):
+        df = make_frame(rows)
+        expected = pandas_cases(df)
+        for name, fn in ranking_cases(df).items():
+            pandas_s, pandas_result = timed(expected[name], args.repeat)
+            ranking_s, ranking_result = timed(fn, args.repeat)
+            if not same(pandas_result, ranking_result):
+                print(f"{name}: results differ at {rows} rows")
+                ok = False
+            ns = ranking_s / rows * 1e9
+            scale = ns / per_row.setdefault(name, ns)
+            print(
+                f"{rows:>11,} {name:<16} {pandas_s * 1000:>8.0f}ms {ranking_s * 1000:>8.0f}ms "
+                f"{pandas_s / ranking_s:>7.1f}x {ns:>8.1f} {scale:>8.2f}"
+            )
+        del df
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark for GET /api/v1/movies/ list encoding.
+
+Times fetch + encode of the whole watchlist from an in-memory SQLite database
+for each WATCHLIST_SERIALIZATION mode and checks that they produce identical
+bytes:
+
+    python -m benchmarks.serialization --movies 10000 --repeat 5
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import crud, serialization
+from app.config import DEFAULT_USER_ID
+from app.models import Base
+
+
+def seed(db, count: int) -> None:
+    crud.add_movies(db, DEFAULT_USER_ID, [{
+        "imdbID": f"tt{i:08d}",
+        "Title": f"Movie {i}",
+        "Year": str(1950 + i % 70),
+        "Genre": "Action, Drama" if i % 2 else "Comedy",
+        "imdbRating": f"{i % 10}.{i % 9}",
+        "Plot": "A long enough plot line to look like a real OMDb description of the movie. " * 2,
+        "Poster": f"https://example.com/posters/{i}.jpg",
+    } for i in range(count)])
+
+
+def response_model_path(db) -> bytes:
+    # What FastAPI does for response_model=list[MovieResponse]: ORM rows,
+    # from_attributes validation, then one dump
+    movies = crud.get_movie_watchlist(db, DEFAULT_USER_ID)
+    adapter = serialization.movie_list_adapter
+    return adapter.dump_json(adapter.validate_python(movies, from_attributes=True))
+
+
+def fast_path(mode: str) -> Callable:
+    def run(db) -> bytes:
+        return serialization.encode_movie_rows(crud.get_movie_rows(db, DEFAULT_USER_ID, None), mode)
+    return run
+
+
+def best_of(fn: Callable, db, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        db.expunge_all()  # no identity-map reuse between runs
+        start = time.perf_counter()
+        fn(db)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Watchlist list encoding micro-benchmark")
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, args.movies)
+
+    paths: Dict[str, Callable] = {
+        "off (response_model)": response_model_path,
+        "validated": fast_path("validated"),
+        "trusted": fast_path("trusted"),
+    }
+    outputs = {name: fn(db) for name, fn in paths.items()}
+    if len(set(outputs.values())) != 1:
+        print("Encodings differ!")
+        return 1
+
+    if serialization.orjson is None:
+        print("orjson is not installed; 'trusted' falls back to 'validated'")
+    baseline = None
+    for name, fn in paths.items():
+        seconds = best_of(fn, db, args.repeat)
+        baseline = baseline or seconds
+        print(f"{name:<22} {seconds * 1000:9.1f}ms  {baseline / seconds:5.1f}x")
+    print(f"{args.movies} movies, {len(outputs['trusted'])} bytes, identical output")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,5 @@
-from app.database import Base, engine
-from app.models import Movie
+# Kept for existing deploy scripts: schema changes are versioned migrations in app/migrations.py
+import sys
+from app import migrations
 
-# Create all tables defined in your models
-Base.metadata.create_all(bind=engine)
-
-print("Database tables created or updated successfully!")
+sys.exit(migrations.main(["upgrade"]))
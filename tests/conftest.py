@@ -2,7 +2,65 @@
 # This file is loaded BEFORE test collection, so env vars are set early
 
 import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
 
 # Set environment variables before any app imports happen
 os.environ["DB_CONNECTION_STRING"] = "sqlite:///:memory:"
 os.environ["OMDB_API_KEY"] = "test_api_key"
+# Keep the OMDb cache in memory only so tests never touch a shared file
+os.environ["OMDB_CACHE_PATH"] = ""
+# Count the OMDb daily quota in memory, not in a shared file
+os.environ["OMDB_QUOTA_PATH"] = ""
+# One attempt per OMDb call, so mocked calls are counted as made; the retry tests turn retries on
+os.environ["OMDB_RETRIES"] = "0"
+
+
+@pytest.fixture(autouse=True)
+def reset_omdb_cache():
+    # Each test starts cold so mocked HTTP calls are always reached
+    from app import omdb_client
+    omdb_client.cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def reset_omdb_guard():
+    # Breaker, rate limit and quota state must not leak between tests
+    from app import omdb_guard
+    omdb_guard.reset()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def reset_omdb_latency():
+    # Measured latencies would otherwise change the timeouts of later tests
+    from app import omdb_latency
+    omdb_latency.reset()
+    yield
+
+
+# Real SQLite database for the tests that run queries; StaticPool keeps its one
+# connection, and so the in-memory database, shared by every session
+engine = create_engine(
+    "sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+
+
+@pytest.fixture
+def session_factory():
+    # Fresh tables for each test, for modules that open sessions of their own; the
+    # sessions are set up like the app's, expire_on_commit=False included
+    from app.database import make_sessionmaker
+    from app.models import Base
+    Base.metadata.create_all(engine)
+    yield make_sessionmaker(engine)
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
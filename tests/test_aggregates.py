@@ -0,0 +1,200 @@
+# Tests for aggregates.py against a real SQLite in-memory database,
+# checking the incrementally maintained totals against the pandas computation
+import random
+from unittest.mock import patch
+from app.models import Movie, WatchlistEntry, WatchlistStats
+from app import crud, aggregates, analytics
+
+USER = "alice"
+
+def movie_data(imdb_id, genre="Drama", rating="8.0"):
+    return {
+        "imdbID": imdb_id,
+        "Title": f"Movie {imdb_id}",
+        "Year": "2020",
+        "Genre": genre,
+        "imdbRating": rating,
+    }
+
+def incremental_stats(db, user_id=USER):
+    with patch("app.analytics.config.ANALYTICS_BACKEND", "incremental"):
+        return analytics.compute_movie_stats(db, user_id)
+
+def pandas_stats(db, user_id=USER):
+    with patch("app.analytics.config.ANALYTICS_BACKEND", "pandas"):
+        return analytics.compute_movie_stats(db, user_id)
+
+
+def test_empty_database(db):
+    assert incremental_stats(db) == {
+        "average_rating": None,
+        "most_frequent_genre": None,
+        "number_watched": 0,
+        "total_movies": 0
+    }
+
+def test_add_update_delete_keep_totals_in_step(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Sci-Fi", "8.8"))
+    crud.add_movie(db, USER, movie_data("tt2", "Sci-Fi", "8.7"))
+    crud.add_movie(db, USER, movie_data("tt3", "Drama", "N/A"))
+    crud.update_watched_status(db, USER, "tt1", True)
+    crud.update_watched_status(db, USER, "tt1", True)  # no change, must not double count
+    crud.update_watched_status(db, USER, "tt3", True)
+    crud.delete_movie(db, USER, "tt3")
+
+    assert incremental_stats(db) == {
+        "average_rating": 8.75,
+        "most_frequent_genre": "Sci-Fi",
+        "number_watched": 1,
+        "total_movies": 2
+    }
+    assert aggregates.verify(db, USER) == {}
+
+def test_duplicate_add_does_not_count_twice(db):
+    crud.add_movie(db, USER, movie_data("tt1"))
+    crud.add_movie(db, USER, movie_data("tt1"))
+    assert incremental_stats(db)["total_movies"] == 1
+
+def test_genre_tie_breaks_like_pandas_mode(db):
+    crud.add_movie(db, USER, movie_data("tt1", "drama"))
+    crud.add_movie(db, USER, movie_data("tt2", "Drama"))
+    crud.add_movie(db, USER, movie_data("tt3", "Action"))
+
+    assert incremental_stats(db)["most_frequent_genre"] == pandas_stats(db)["most_frequent_genre"] == "Action"
+
+def test_matches_pandas_on_random_workload(db):
+    rng = random.Random(42)
+    genres = ["Drama", "Action, Crime", "Comedy", None]
+    for i in range(200):
+        rating = rng.choice(["N/A", f"{rng.uniform(1, 10):.1f}"])
+        crud.add_movie(db, USER, movie_data(f"tt{i}", rng.choice(genres), rating))
+    for i in rng.sample(range(200), 80):
+        crud.update_watched_status(db, USER, f"tt{i}", rng.random() < 0.5)
+    for i in rng.sample(range(200), 50):
+        crud.delete_movie(db, USER, f"tt{i}")
+
+    assert incremental_stats(db) == pandas_stats(db)
+    assert aggregates.verify(db, USER) == {}
+
+def test_verify_reports_and_rebuild_fixes_drift(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Drama", "7.0"))
+    crud.add_movie(db, USER, movie_data("tt2", "Comedy", "9.0"))
+    # Write behind the aggregates' back
+    db.query(WatchlistEntry).filter_by(user_id=USER, movie_id=2).update({"watched": True})
+    db.commit()
+
+    drift = aggregates.verify(db, USER)
+    assert drift == {"number_watched": {"stored": 0, "actual": 1}}
+
+    assert aggregates.rebuild(db, USER) == drift
+    assert aggregates.verify(db, USER) == {}
+    assert incremental_stats(db)["number_watched"] == 1
+
+def test_rebuild_seeds_existing_rows(db):
+    db.add_all([
+        WatchlistEntry(user_id=USER, movie=Movie(imdb_id="tt1", title="A", year="2000", genre="Drama", rating=6.0)),
+        WatchlistEntry(user_id=USER, watched=True, movie=Movie(imdb_id="tt2", title="B", year="2001", genre="Drama", rating=8.0)),
+    ])
+    db.commit()
+    assert db.get(WatchlistStats, USER) is None
+
+    assert aggregates.rebuild_all(db) == {USER: {
+        "total_movies": {"stored": 0, "actual": 2},
+        "number_watched": {"stored": 0, "actual": 1},
+        "rating_count": {"stored": 0, "actual": 2},
+        "genres": {"stored": {}, "actual": {"Drama": 2}},
+        "rating_sum": {"stored": 0.0, "actual": 14.0},
+    }}
+
+    assert incremental_stats(db) == pandas_stats(db)
+
+def test_round_rating_matches_numpy():
+    import numpy as np
+    rng = random.Random(7)
+    for _ in range(10000):
+        value = rng.uniform(0, 10)
+        assert analytics.round_rating(value) == float(np.round(value, 2))
+    assert analytics.round_rating(8.3325) == 8.33
+
+def test_version_moves_with_every_change(db):
+    assert aggregates.read_version(db, USER) == 0
+
+    crud.add_movie(db, USER, movie_data("tt1"))
+    after_add = aggregates.read_version(db, USER)
+    crud.add_movie(db, USER, movie_data("tt1"))  # duplicate, nothing changes
+    assert aggregates.read_version(db, USER) == after_add
+
+    crud.update_watched_status(db, USER, "tt1", True)
+    after_update = aggregates.read_version(db, USER)
+    crud.update_watched_status(db, USER, "tt1", True)  # no change
+    assert aggregates.read_version(db, USER) == after_update > after_add
+
+    crud.add_movies(db, USER, [movie_data("tt2"), movie_data("tt3")])
+    after_bulk = aggregates.read_version(db, USER)
+    crud.delete_movie(db, USER, "tt2")
+    assert aggregates.read_version(db, USER) > after_bulk > after_update
+
+def test_rebuild_keeps_version_increasing(db):
+    crud.add_movie(db, USER, movie_data("tt1"))
+    before = aggregates.read_version(db, USER)
+    aggregates.rebuild(db, USER)
+    assert aggregates.read_version(db, USER) == before + 1
+
+def test_totals_are_per_user(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Drama", "6.0"))
+    crud.add_movie(db, USER, movie_data("tt2", "Comedy", "8.0"))
+    crud.add_movie(db, "bob", movie_data("tt2", "Comedy", "8.0"))
+    crud.update_watched_status(db, "bob", "tt2", True)
+
+    assert incremental_stats(db) == pandas_stats(db)
+    assert incremental_stats(db, "bob") == pandas_stats(db, "bob") == {
+        "average_rating": 8.0,
+        "most_frequent_genre": "Comedy",
+        "number_watched": 1,
+        "total_movies": 1
+    }
+    assert incremental_stats(db, "carol")["total_movies"] == 0
+    assert aggregates.verify_all(db) == {}
+
+def test_version_is_per_user(db):
+    crud.add_movie(db, USER, movie_data("tt1"))
+    before = aggregates.read_version(db, USER)
+    crud.add_movie(db, "bob", movie_data("tt1"))
+    crud.delete_movie(db, "bob", "tt1")
+    assert aggregates.read_version(db, USER) == before
+
+    # A catalog-wide change (e.g. a genre backfill) moves every user's version
+    aggregates.record_changed(db)
+    assert aggregates.read_version(db, USER) == before + 1
+
+
+# Test the totals stay right on dialects without ON CONFLICT, which fall back to UPDATE-then-INSERT
+@patch("app.aggregates._upsert_insert", return_value=None)
+def test_fallback_without_upsert(_, db):
+    crud.add_movie(db, USER, movie_data("tt1", rating="8.0", genre="Drama"))
+    crud.add_movie(db, USER, movie_data("tt2", rating=None, genre="Drama"))
+    crud.delete_movie(db, USER, "tt2")
+
+    assert aggregates.verify(db, USER) == {}
+    assert aggregates.read_version(db, USER) == 3
+
+
+# Test a fallback insert that loses the race with another writer retries its update
+def test_fallback_retries_update_after_losing_insert_race(db):
+    crud.add_movie(db, USER, movie_data("tt1"))
+    updates = []
+
+    def update():
+        # The first UPDATE finds no row; another writer inserts it before our INSERT
+        updates.append(1)
+        if len(updates) == 1:
+            return 0
+        return db.query(WatchlistStats).filter(WatchlistStats.user_id == USER).update(
+            {WatchlistStats.total_movies: WatchlistStats.total_movies + 1}, synchronize_session=False
+        )
+
+    aggregates._update_or_insert(db, update, WatchlistStats, {"user_id": USER, "total_movies": 1, "version": 1})
+    db.commit()
+
+    assert len(updates) == 2
+    assert aggregates.read_totals(db, USER)["total_movies"] == 2
@@ -1,6 +1,13 @@
 # Unit tests for analytics.py
+import random
+import sys
+import pytest
 from unittest.mock import MagicMock, patch
+from sqlalchemy import event
 from app.analytics import compute_movie_stats
+from app.models import Movie, WatchlistEntry
+
+USER = "alice"
 
 
 class TestComputeMovieStats:
@@ -12,7 +19,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = []
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             assert result["average_rating"] is None
             assert result["most_frequent_genre"] is None
@@ -31,7 +38,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [mock_movie]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             assert result["average_rating"] == 8.8
             assert result["most_frequent_genre"] == "Sci-Fi"
@@ -50,7 +57,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [mock_movie]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             assert result["average_rating"] == 8.7
             assert result["most_frequent_genre"] == "Action"
@@ -82,7 +89,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [movie1, movie2, movie3]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             assert result["average_rating"] == 8.7  # (8.8 + 8.7 + 8.6) / 3 = 8.7
             assert result["most_frequent_genre"] == "Sci-Fi"  # 2 Sci-Fi vs 1 Drama
@@ -114,7 +121,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [movie1, movie2, movie3]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             # Average should handle None values (pandas will ignore them)
             assert result["average_rating"] == 8.0  # (7.5 + 8.5) / 2 = 8.0
@@ -138,7 +145,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = movies
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             assert result["most_frequent_genre"] == "Action"
             assert result["number_watched"] == 3  # movies 0, 2, 4
@@ -165,7 +172,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [movie1, movie2]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             # When there's a tie, pandas mode() returns the first encountered
             assert result["most_frequent_genre"] in ["Drama", "Action"]
@@ -192,7 +199,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [movie1, movie2]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             assert result["number_watched"] == 0
             assert result["total_movies"] == 2
@@ -223,7 +230,7 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [movie1, movie2, movie3]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             assert result["number_watched"] == 3
             assert result["total_movies"] == 3
@@ -249,8 +256,133 @@ class TestComputeMovieStats:
         with patch('app.analytics.crud.get_all_movies') as mock_get_all:
             mock_get_all.return_value = [movie1, movie2]
             
-            result = compute_movie_stats(mock_db)
+            result = compute_movie_stats(mock_db, USER)
             
             # (7.777 + 8.888) / 2 = 8.3325, rounded to 8.33
             assert result["average_rating"] == 8.33
             assert result["total_movies"] == 2
+
+
+# SQL push-down backend, checked against the pandas path on a real SQLite database (conftest's db)
+def saved(watched=False, user_id=USER, **fields):
+    return WatchlistEntry(user_id=user_id, watched=watched, movie=Movie(**fields))
+
+
+def stats_with_backend(db, backend):
+    with patch('app.analytics.config.ANALYTICS_BACKEND', backend):
+        return compute_movie_stats(db, USER)
+
+
+class TestSqlBackend:
+
+    def test_empty_database(self, db):
+        assert stats_with_backend(db, "sql") == {
+            "average_rating": None,
+            "most_frequent_genre": None,
+            "number_watched": 0,
+            "total_movies": 0
+        }
+
+    def test_basic_stats(self, db):
+        db.add_all([
+            saved(imdb_id="tt1", title="Inception", year="2010", genre="Sci-Fi", rating=8.8, watched=True),
+            saved(imdb_id="tt2", title="The Matrix", year="1999", genre="Sci-Fi", rating=8.7, watched=True),
+            saved(imdb_id="tt3", title="Interstellar", year="2014", genre="Drama", rating=8.6, watched=False),
+        ])
+        db.commit()
+
+        result = stats_with_backend(db, "sql")
+
+        assert result["average_rating"] == 8.7
+        assert result["most_frequent_genre"] == "Sci-Fi"
+        assert result["number_watched"] == 2
+        assert result["total_movies"] == 3
+
+    def test_no_ratings_and_no_genres(self, db):
+        db.add(saved(imdb_id="tt1", title="Unknown", year="2020", genre=None, rating=None))
+        db.commit()
+
+        assert stats_with_backend(db, "sql") == stats_with_backend(db, "pandas")
+
+    def test_genre_ties_break_like_pandas_mode(self, db):
+        for i, genre in enumerate(["drama", "Drama", "Action", "action"]):
+            db.add(saved(imdb_id=f"tt{i}", title=f"Movie {i}", year="2020", genre=genre, rating=7.0))
+        db.commit()
+
+        assert stats_with_backend(db, "sql")["most_frequent_genre"] == "Action"
+        assert stats_with_backend(db, "pandas")["most_frequent_genre"] == "Action"
+
+    def test_matches_pandas_on_random_data(self, db):
+        rng = random.Random(3)
+        genres = ["Drama", "Action, Crime", "Comedy", "Horror", None]
+        for i in range(500):
+            rating = None if rng.random() < 0.1 else round(rng.uniform(1, 10), rng.choice([1, 3]))
+            db.add(saved(
+                imdb_id=f"tt{i}", title=f"Movie {i}", year="2020",
+                genre=rng.choice(genres), rating=rating, watched=rng.random() < 0.4,
+                # Another user's movies must not leak into the stats
+                user_id=rng.choice([USER, "bob"])
+            ))
+        db.commit()
+
+        assert stats_with_backend(db, "sql") == stats_with_backend(db, "pandas")
+
+    def test_runs_two_aggregate_queries(self, db):
+        db.add(saved(imdb_id="tt1", title="Inception", year="2010", genre="Sci-Fi", rating=8.8))
+        db.commit()
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.get_bind(), "before_cursor_execute", record)
+        try:
+            stats_with_backend(db, "sql")
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", record)
+
+        assert len(statements) == 2
+        # Only aggregates and the genre column are read, never whole movie rows
+        assert not any("movies.title" in statement for statement in statements)
+
+
+# Every pandas-path case again, with pandas unavailable
+class TestWithoutPandas(TestComputeMovieStats):
+
+    @pytest.fixture(autouse=True)
+    def no_pandas(self):
+        with patch('app.analytics._load_pandas', return_value=None):
+            yield
+
+
+class TestPythonBackend:
+
+    def test_matches_pandas_on_random_data(self, db):
+        rng = random.Random(5)
+        genres = ["Drama", "Action, Crime", "Comedy", "Horror", None]
+        for i in range(500):
+            rating = None if rng.random() < 0.1 else round(rng.uniform(1, 10), rng.choice([1, 3]))
+            db.add(saved(
+                imdb_id=f"tt{i}", title=f"Movie {i}", year="2020",
+                genre=rng.choice(genres), rating=rating, watched=rng.random() < 0.4
+            ))
+        db.commit()
+
+        assert stats_with_backend(db, "python") == stats_with_backend(db, "pandas")
+
+    def test_genre_ties_break_like_pandas_mode(self, db):
+        for i, genre in enumerate(["drama", "Drama", "Action", "action"]):
+            db.add(saved(imdb_id=f"tt{i}", title=f"Movie {i}", year="2020", genre=genre, rating=7.0))
+        db.commit()
+
+        assert stats_with_backend(db, "python")["most_frequent_genre"] == "Action"
+
+    def test_missing_pandas_falls_back(self, db):
+        db.add(saved(imdb_id="tt1", title="Inception", year="2010", genre="Sci-Fi", rating=8.8, watched=True))
+        db.commit()
+
+        # A None entry in sys.modules makes the import raise ImportError
+        with patch('app.analytics._pandas', None), patch.dict(sys.modules, {"pandas": None}):
+            result = stats_with_backend(db, "pandas")
+
+        assert result == stats_with_backend(db, "python")
@@ -0,0 +1,135 @@
+# Tests for movies_analytics/analyze.py: the chunked aggregates against a
+# plain full-file pandas computation of the same stats
+import io
+import pandas as pd
+import pytest
+from app.movies_analytics import analyze
+
+CSV = """title,genre,rating,votes,description
+Alpha,Drama,9.1,"1,234",x
+Beta, Comedy ,7.0,50,x
+Alpha,Comedy,9.5,"2,000",x
+Gamma,Drama,,,x
+Delta,Comedy,8.5,"10,000",x
+Beta,Drama,3.0,7,x
+Epsilon,Drama,8.5,99,x
+"""
+
+
+def small_csv():
+    return io.StringIO(CSV)
+
+
+@pytest.fixture(scope="module")
+def full_frame():
+    df = pd.read_csv(analyze.DEFAULT_CSV)
+    df["genre"] = df["genre"].str.strip()
+    return df
+
+
+class TestReadChunks:
+    def test_compact_dtypes(self):
+        chunk = next(analyze.read_chunks(small_csv(), chunksize=3))
+        assert list(chunk.columns) == ["title", "genre", "rating", "votes"]
+        assert isinstance(chunk["genre"].dtype, pd.CategoricalDtype)
+        assert chunk["rating"].dtype == "float32"
+        assert chunk["votes"].dtype == "Int32"
+        assert chunk["votes"].tolist() == [1234, 50, 2000]
+
+    def test_chunk_sizes(self):
+        assert [len(c) for c in analyze.read_chunks(small_csv(), chunksize=3)] == [3, 3, 1]
+
+
+class TestAnalyze:
+    def test_small_file(self):
+        result = analyze.analyze_csv(small_csv(), chunksize=2, top=3)
+        assert result["total_movies"] == 7
+        assert result["average_rating"] == pytest.approx((9.1 + 7.0 + 9.5 + 8.5 + 3.0 + 8.5) / 6)
+        assert result["most_frequent_genre"] == "Drama"
+        assert result["high_rating_count"] == 4
+        # Alpha counts once at its best rating; Delta and Epsilon tie, by title
+        assert result["top_movies"] == [
+            {"title": "Alpha", "rating": 9.5, "votes": 2000},
+            {"title": "Delta", "rating": 8.5, "votes": 10000},
+            {"title": "Epsilon", "rating": 8.5, "votes": 99},
+        ]
+        # First row per title: Alpha/Drama 9.1, Beta/Comedy 7.0, Gamma/Drama unrated, ...
+        assert result["top_genres"] == [{"genre": "Drama", "titles": 3}, {"genre": "Comedy", "titles": 2}]
+        assert result["average_rating_by_genre"] == [
+            {"genre": "Drama", "average_rating": pytest.approx(8.8), "titles": 3},
+            {"genre": "Comedy", "average_rating": pytest.approx(7.75), "titles": 2},
+        ]
+
+    @pytest.mark.parametrize("chunksize", [1, 3, 100])
+    def test_independent_of_chunk_size(self, chunksize):
+        assert analyze.analyze_csv(small_csv(), chunksize=chunksize) == analyze.analyze_csv(small_csv())
+
+    def test_mode_ties_and_whitespace(self):
+        csv = "title,genre,rating,votes\nA, Drama,5.0,1\nB,Comedy,5.0,1\nC,Drama ,5.0,1\nD,Comedy,5.0,1\n"
+        result = analyze.analyze_csv(io.StringIO(csv), chunksize=3)
+        # Two rows each once the whitespace is stripped; ties go to the first name
+        assert result["most_frequent_genre"] == "Comedy"
+        assert result["top_genres"] == [{"genre": "Comedy", "titles": 2}, {"genre": "Drama", "titles": 2}]
+
+    def test_empty_file(self):
+        result = analyze.analyze_csv(io.StringIO("title,genre,rating,votes\n"))
+        assert result["total_movies"] == 0
+        assert result["average_rating"] is None
+        assert result["most_frequent_genre"] is None
+        assert result["top_movies"] == []
+
+    def test_matches_full_read(self, full_frame):
+        df = full_frame
+        result = analyze.analyze_csv(chunksize=997)
+
+        assert result["total_movies"] == len(df)
+        assert result["average_rating"] == pytest.approx(df["rating"].mean())
+        assert result["most_frequent_genre"] == df["genre"].mode()[0]
+        assert result["high_rating_count"] == (df["rating"] > 8.0).sum()
+
+        top = df.sort_values(by="rating", ascending=False).drop_duplicates(subset=["title"]).head(10)
+        # The last places can tie; compare ratings, and titles above the tie
+        assert [m["rating"] for m in result["top_movies"]] == top["rating"].tolist()
+        assert {m["title"] for m in result["top_movies"][:9]} == set(top["title"][:9])
+
+        unique_titles = df.drop_duplicates(subset=["title"])
+        counts = unique_titles["genre"].value_counts()
+        assert [row["titles"] for row in result["top_genres"]] == counts.head(5).tolist()
+        averages = unique_titles.groupby("genre")["rating"].mean().dropna()
+        by_genre = {row["genre"]: row["average_rating"] for row in result["average_rating_by_genre"]}
+        assert by_genre == pytest.approx(averages.to_dict())
+
+
+class TestPartialStats:
+    def test_merge_equals_single_pass(self):
+        chunks = list(analyze.read_chunks(small_csv(), chunksize=3))
+        titles = analyze.TitleFilter()
+        partials = []
+        for chunk in chunks:
+            partial = analyze.PartialStats()
+            partial.update(chunk, titles.first_rows(chunk["title"]))
+            partials.append(partial)
+
+        merged = partials[2].merge(partials[0]).merge(partials[1])
+        assert merged.result() == analyze.analyze_csv(small_csv())
+
+    def test_best_is_bounded(self):
+        stats = analyze.PartialStats(top=2)
+        for chunk in analyze.read_chunks(small_csv(), chunksize=1):
+            stats.update(chunk, pd.Series(True, index=chunk.index))
+            assert len(stats.best) <= 2
+        assert list(stats.best) == ["Alpha", "Delta"]
+
+
+class TestTitleFilter:
+    def test_first_rows_across_chunks(self):
+        titles = analyze.TitleFilter()
+        assert titles.first_rows(pd.Series(["a", "b", "a"])).tolist() == [True, True, False]
+        assert titles.first_rows(pd.Series(["b", "c", "c"], index=[3, 4, 5])).tolist() == [False, True, False]
+
+
+def test_main_prints_report(capsys, tmp_path):
+    assert analyze.main([str(analyze.DEFAULT_CSV), "--chunksize", "5000", "--cache-dir", str(tmp_path)]) == 0
+    out = capsys.readouterr().out
+    assert "Most frequent genre: Comedy" in out
+    assert "Total movies: 9957" in out
@@ -0,0 +1,304 @@
+# Unit tests for async_omdb_client.py, using httpx's MockTransport instead of the network
+import asyncio
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from app import async_omdb_client, omdb_guard, omdb_latency
+from app.async_omdb_client import search_movies, fetch_movie_by_id
+
+
+def run_with_transport(handler, coro_fn):
+    async def runner():
+        async_omdb_client.open_client(transport=httpx.MockTransport(handler))
+        try:
+            return await coro_fn()
+        finally:
+            await async_omdb_client.close_client()
+    return asyncio.run(runner())
+
+
+# Test searching for movies by title
+def test_search_movies_success():
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        return httpx.Response(200, json={
+            "Search": [{"Title": "Inception", "Year": "2010", "imdbID": "tt1375666"}],
+            "Response": "True"
+        })
+
+    results = run_with_transport(handler, lambda: search_movies("Inception"))
+
+    assert results[0]["Title"] == "Inception"
+    assert requests_seen[0].url.params["s"] == "Inception"
+    assert requests_seen[0].url.params["page"] == "1"
+
+# Test searching for movies with no results
+def test_search_movies_not_found():
+    def handler(request):
+        return httpx.Response(200, json={"Response": "False", "Error": "Movie not found!"})
+
+    assert run_with_transport(handler, lambda: search_movies("NonexistentMovie")) == []
+
+# Test searching for movies by not status 200
+def test_search_movies_raises_http_error():
+    def handler(request):
+        return httpx.Response(500)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run_with_transport(handler, lambda: search_movies("Inception"))
+
+# Test a timeout is propagated
+def test_fetch_movie_timeout():
+    def handler(request):
+        raise httpx.ReadTimeout("Request timed out", request=request)
+
+    with pytest.raises(httpx.TimeoutException):
+        run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+
+# Test fetching movie details by IMDb ID
+def test_fetch_movie_success():
+    def handler(request):
+        assert request.url.params["i"] == "tt1375666"
+        assert request.url.params["plot"] == "full"
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+
+    movie = run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+    assert movie["Title"] == "Inception"
+
+# Test invalid IMDb ID returns None
+def test_fetch_movie_not_found():
+    def handler(request):
+        return httpx.Response(200, json={"Response": "False", "Error": "Incorrect IMDb ID."})
+
+    assert run_with_transport(handler, lambda: fetch_movie_by_id("invalid")) is None
+
+# Test the async client shares the sync client's cache
+def test_fetch_movie_uses_shared_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+
+    async def fetch_twice():
+        await fetch_movie_by_id("tt1375666")
+        return await fetch_movie_by_id("tt1375666")
+
+    movie = run_with_transport(handler, fetch_twice)
+    assert movie["Title"] == "Inception"
+    assert len(calls) == 1
+
+# Test a refresh skips the cached payload and replaces it
+def test_refetch_movie_bypasses_cache():
+    ratings = iter(["8.7", "8.8"])
+
+    def handler(request):
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "imdbRating": next(ratings), "Response": "True"})
+
+    async def fetch_then_refetch():
+        await fetch_movie_by_id("tt1375666")
+        refreshed = await async_omdb_client.refetch_movie_by_id("tt1375666")
+        return refreshed, await fetch_movie_by_id("tt1375666")
+
+    refreshed, cached = run_with_transport(handler, fetch_then_refetch)
+    assert refreshed["imdbRating"] == cached["imdbRating"] == "8.8"
+
+# Test many lookups run concurrently on one event loop
+def test_concurrent_fetches():
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        imdb_id = request.url.params["i"]
+        return httpx.Response(200, json={"Title": imdb_id, "imdbID": imdb_id, "Response": "True"})
+
+    async def fetch_many():
+        return await asyncio.gather(*(fetch_movie_by_id(f"tt{i:07d}") for i in range(100)))
+
+    start = time.perf_counter()
+    # The client rate limit is tested in test_omdb_guard.py
+    with patch.object(omdb_guard.bucket, "rate", 0):
+        movies = run_with_transport(handler, fetch_many)
+    elapsed = time.perf_counter() - start
+
+    assert len(movies) == 100
+    # 100 sequential calls would take 5s
+    assert elapsed < 2
+
+# Test concurrent lookups of the same ID share one upstream request
+def test_concurrent_identical_fetches_are_coalesced():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+
+    async def fetch_many():
+        return await asyncio.gather(*(fetch_movie_by_id("tt1375666") for _ in range(20)))
+
+    before = async_omdb_client.coalescing_stats()["coalesced"]
+    movies = run_with_transport(handler, fetch_many)
+
+    assert all(movie["Title"] == "Inception" for movie in movies)
+    assert len(calls) == 1
+    assert async_omdb_client.coalescing_stats()["coalesced"] - before == 19
+
+# Test repeated 5xx responses open the circuit, after which OMDb is not called
+def test_server_errors_open_the_circuit():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(502)
+
+    async def fetch_until_refused():
+        for _ in range(omdb_guard.breaker.failure_threshold):
+            with pytest.raises(httpx.HTTPStatusError):
+                await async_omdb_client.refetch_movie_by_id("tt1375666")
+        with pytest.raises(omdb_guard.CircuitOpen):
+            await async_omdb_client.refetch_movie_by_id("tt1375666")
+
+    run_with_transport(handler, fetch_until_refused)
+    assert len(calls) == omdb_guard.breaker.failure_threshold
+
+# Test OMDb's "Request limit reached!" reply uses up the daily quota
+def test_request_limit_reply_exhausts_quota():
+    def handler(request):
+        return httpx.Response(401, json={"Response": "False", "Error": "Request limit reached!"})
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+    with pytest.raises(omdb_guard.QuotaExhausted):
+        run_with_transport(handler, lambda: fetch_movie_by_id("tt0468569"))
+
+# Test 5xx replies and connection errors are retried with backoff
+@patch("app.omdb_latency.OMDB_RETRIES", 2)
+@patch("app.omdb_latency.OMDB_RETRY_BASE_DELAY", 0)
+def test_transient_failures_are_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("Connection refused", request=request)
+        if len(calls) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+
+    movie = run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+
+    assert movie["Title"] == "Inception"
+    assert len(calls) == 3
+    assert omdb_latency.stats()["retries"] == 2
+
+# Test a retry refused by omdb_guard reports how OMDb failed, not the refusal
+@patch("app.omdb_latency.OMDB_RETRIES", 2)
+@patch("app.omdb_latency.OMDB_RETRY_BASE_DELAY", 0)
+def test_refused_retry_reports_upstream_error():
+    def handler(request):
+        return httpx.Response(500)
+
+    with patch.object(omdb_guard.quota, "limit", 1):
+        with pytest.raises(httpx.HTTPStatusError):
+            run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+
+# Test a slow request is hedged after the observed p95 and the faster answer wins
+@patch("app.omdb_latency.OMDB_HEDGE_ENABLED", True)
+def test_slow_request_is_hedged():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"Title": f"answer {len(calls)}", "imdbID": "tt1375666", "Response": "True"})
+
+    for _ in range(100):
+        omdb_latency.tracker.record(0.05)
+    start = time.perf_counter()
+    movie = run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+
+    assert movie["Title"] == "answer 2"
+    assert time.perf_counter() - start < 2
+    assert omdb_latency.stats()["hedge_wins"] == 1
+
+# Test a fast request is not hedged
+@patch("app.omdb_latency.OMDB_HEDGE_ENABLED", True)
+def test_fast_request_is_not_hedged():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+
+    for _ in range(100):
+        omdb_latency.tracker.record(0.5)
+    run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+
+    assert len(calls) == 1
+    assert omdb_latency.stats()["hedges"] == 0
+
+# Test a failed hedge leaves the first request to answer
+@patch("app.omdb_latency.OMDB_HEDGE_ENABLED", True)
+def test_failed_hedge_waits_for_primary():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    for _ in range(100):
+        omdb_latency.tracker.record(0.05)
+    movie = run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+
+    assert movie["Title"] == "Inception"
+    assert omdb_latency.stats()["hedge_wins"] == 0
+
+# Test the adaptive timeout is passed to httpx
+def test_timeout_follows_measured_latency():
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+
+    for _ in range(100):
+        omdb_latency.tracker.record(0.5)
+    run_with_transport(handler, lambda: fetch_movie_by_id("tt1375666"))
+
+    assert timeouts == [pytest.approx(0.5 * omdb_latency.OMDB_TIMEOUT_MULTIPLIER)]
+
+# Test a call cancelled while half-open gives back the trial slot
+@pytest.mark.parametrize("rate", [0, 0.5])
+def test_cancelled_trial_call_releases_half_open_slot(rate):
+    started = asyncio.Event()
+
+    async def handler(request):
+        started.set()
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={"Title": "Inception", "imdbID": "tt1375666", "Response": "True"})
+
+    async def cancel_trial():
+        call = asyncio.ensure_future(async_omdb_client.refetch_movie_by_id("tt1375666"))
+        if rate:
+            # Cancelled while waiting for a token
+            await asyncio.sleep(0.05)
+        else:
+            await started.wait()
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    for _ in range(omdb_guard.breaker.failure_threshold):
+        omdb_guard.record_failure()
+    omdb_guard.breaker.opened_at -= omdb_guard.breaker.reset_timeout
+    with patch.object(omdb_guard.bucket, "rate", rate), patch.object(omdb_guard.bucket, "_tokens", 0):
+        run_with_transport(handler, cancel_trial)
+
+    assert omdb_guard.breaker.trials == 0
+    omdb_guard.admit()
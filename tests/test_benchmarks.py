@@ -0,0 +1,112 @@
+# Tests for the benchmark tooling: the fake OMDb server and the load report helpers
+import json
+import pytest
+import requests
+from benchmarks.fake_omdb import FakeOMDb, Faults
+from benchmarks.load import check_baseline, compare, percentile, scenarios, summarize
+from benchmarks.importtime import measure, over_budget, parse_importtime
+
+@pytest.fixture
+def fake():
+    server = FakeOMDb(Faults(seed=0))
+    server.start()
+    yield server
+    server.stop()
+
+def omdb_get(server, **params):
+    return requests.get(server.url, params=params, timeout=5)
+
+
+def test_fake_serves_fixture_details(fake):
+    data = omdb_get(fake, i="tt1375666", apikey="x").json()
+    assert data["Title"] == "Inception"
+    assert data["Response"] == "True"
+
+def test_fake_serves_synthetic_ids(fake):
+    data = omdb_get(fake, i="tt9000042").json()
+    assert data["imdbID"] == "tt9000042"
+    assert data["Title"].endswith("9000042")
+
+def test_fake_unknown_id(fake):
+    assert omdb_get(fake, i="tt0000001").json() == {"Response": "False", "Error": "Incorrect IMDb ID."}
+
+def test_fake_search(fake):
+    data = omdb_get(fake, s="matrix").json()
+    assert [m["imdbID"] for m in data["Search"]] == ["tt0133093"]
+    assert omdb_get(fake, s="no such film").json()["Error"] == "Movie not found!"
+
+def test_fake_injects_errors():
+    server = FakeOMDb(Faults(error_rate=1.0))
+    server.start()
+    try:
+        assert omdb_get(server, i="tt1375666").status_code == 500
+        assert server.stats() == {"requests": 1, "errors": 1, "hangs": 0}
+    finally:
+        server.stop()
+
+def test_fake_injects_timeouts():
+    server = FakeOMDb(Faults(timeout_rate=1.0, hang_seconds=1.0))
+    server.start()
+    try:
+        with pytest.raises(requests.Timeout):
+            requests.get(server.url, params={"i": "tt1375666"}, timeout=0.2)
+    finally:
+        server.stop()
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) == 0.0
+
+def test_summarize():
+    summary = summarize([0.001, 0.002, 0.003, 0.004], errors=1, wall_seconds=2.0)
+    assert summary["requests"] == 4
+    assert summary["errors"] == 1
+    assert summary["p50_ms"] == 2.0
+    assert summary["throughput_rps"] == 2.0
+
+def test_compare_flags_regressions():
+    baseline = {"peak_rss_mb": 100.0, "scenarios": {
+        "stats": {"p95_ms": 10.0, "throughput_rps": 100.0, "errors": 0},
+        "analytics": {"p95_ms": 10.0, "throughput_rps": 100.0, "errors": 0},
+    }}
+    results = {"peak_rss_mb": 140.0, "scenarios": {
+        "stats": {"p95_ms": 11.0, "throughput_rps": 95.0, "errors": 0},
+        "analytics": {"p95_ms": 20.0, "throughput_rps": 50.0, "errors": 2},
+    }}
+
+    regressions = compare(results, baseline, tolerance=0.25)
+
+    assert len(regressions) == 4
+    assert all(r.startswith("analytics") or r.startswith("peak RSS") for r in regressions)
+    assert compare(baseline, baseline, tolerance=0.25) == []
+
+def test_check_baseline(tmp_path):
+    results = {"scenarios": {"stats": {"p95_ms": 10.0, "throughput_rps": 100.0, "errors": 0}}}
+    baseline = tmp_path / "baseline.json"
+
+    # A missing baseline fails rather than passing without a comparison
+    assert check_baseline(results, baseline, tolerance=0.25) == 1
+    baseline.write_text(json.dumps(results))
+    assert check_baseline(results, baseline, tolerance=0.25) == 0
+
+def test_scenarios_cover_metrics():
+    assert "metrics" in [scenario.name for scenario in scenarios(["Inception"], ["tt1375666"])]
+
+def test_parse_importtime_uses_self_time():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |     sqlalchemy.util",
+        "import time:       400 |        500 |   sqlalchemy",
+        "import time:        50 |        550 | app.main",
+    ])
+    assert parse_importtime(stderr) == {"sqlalchemy": 0.5, "app": 0.05}
+
+def test_app_import_keeps_heavy_modules_lazy():
+    result = measure("app.main")
+    assert result["loaded"] == []
+    # Generous for slow CI machines (a warm import is about 1s and 75MB), but
+    # still fails if a heavy dependency creeps into startup
+    assert over_budget(result, budget_ms=5000, budget_rss_mb=250) == []
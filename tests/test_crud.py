@@ -1,30 +1,14 @@
 # For unit tests of crud.py. integration tests with a real SQLLite in-memory database
 # create tables ffresh before each test and use SQLAlchemy Session for real queries.
+import re
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.models import Base, Movie
-from app import crud
-
-# SQLite in-memory DB
-TEST_DATABASE_URL = "sqlite:///:memory:"
-
-engine = create_engine(
-    TEST_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-TestSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-@pytest.fixture(autouse=True)
-def setup_tables():
-    Base.metadata.create_all(engine)
-    yield
-    Base.metadata.drop_all(engine)
-
-@pytest.fixture
-def db():
-    session = TestSessionLocal()
-    yield session
-    session.close()
+from unittest.mock import patch
+from datetime import datetime
+from sqlalchemy import event, func, select, update
+from app.models import Movie, WatchlistEntry, movie_genres
+from app import crud, aggregates
+
+USER = "alice"
 
 def sample_movie_data(
     imdb_id="tt1375666",
@@ -48,7 +32,7 @@ def sample_movie_data(
 # Test adding a new movie
 def test_add_movie_success(db):
     data = sample_movie_data()
-    status, movie = crud.add_movie(db, data)
+    status, movie = crud.add_movie(db, USER, data)
 
     assert status == "created"
     assert movie.title == data["Title"]
@@ -57,9 +41,9 @@ def test_add_movie_success(db):
 # Test adding a duplicate movie
 def test_add_movie_duplicate(db):
     data = sample_movie_data()
-    crud.add_movie(db, data)
+    crud.add_movie(db, USER, data)
 
-    status, movie = crud.add_movie(db, data)  # Add again
+    status, movie = crud.add_movie(db, USER, data)  # Add again
 
     assert status == "already_exists"
 
@@ -74,7 +58,7 @@ def test_add_movie_minimal_fields(db):
         "Plot": None,
         "Poster": None
     }
-    status, movie = crud.add_movie(db, data)
+    status, movie = crud.add_movie(db, USER, data)
 
     assert status == "created"
     assert movie.title == data["Title"]
@@ -93,18 +77,18 @@ def test_add_movie_missing_required_fields(db):
         "Poster": None
     }
     with pytest.raises(KeyError):
-        crud.add_movie(db, data)
+        crud.add_movie(db, USER, data)
 
 # Test getting the watchlist (unwatched movies)
 def test_get_movie_watchlist(db):
     movie1 = sample_movie_data(imdb_id="tt1111111", title="Movie 1")
     movie2 = sample_movie_data(imdb_id="tt2222222", title="Movie 2")
-    crud.add_movie(db, movie1)
-    crud.add_movie(db, movie2)
+    crud.add_movie(db, USER, movie1)
+    crud.add_movie(db, USER, movie2)
 
-    crud.update_watched_status(db, movie1["imdbID"], True)
+    crud.update_watched_status(db, USER, movie1["imdbID"], True)
 
-    watchlist = crud.get_movie_watchlist(db)
+    watchlist = crud.get_movie_watchlist(db, USER)
     assert len(watchlist) == 1
     assert all(not movie.watched for movie in watchlist)
 
@@ -113,14 +97,14 @@ def test_get_watched_movies(db):
     movie1 = sample_movie_data(imdb_id="tt1111111", title="Movie 1")
     movie2 = sample_movie_data(imdb_id="tt2222222", title="Movie 2")
     movie3 = sample_movie_data(imdb_id="tt3333333", title="Movie 3")
-    crud.add_movie(db, movie1)
-    crud.add_movie(db, movie2)
-    crud.add_movie(db, movie3)
+    crud.add_movie(db, USER, movie1)
+    crud.add_movie(db, USER, movie2)
+    crud.add_movie(db, USER, movie3)
 
-    crud.update_watched_status(db, movie1["imdbID"], True)
-    crud.update_watched_status(db, movie3["imdbID"], True)
+    crud.update_watched_status(db, USER, movie1["imdbID"], True)
+    crud.update_watched_status(db, USER, movie3["imdbID"], True)
 
-    watched_list = crud.get_movies_by_watched_status(db, True)
+    watched_list = crud.get_movies_by_watched_status(db, USER, True)
     assert len(watched_list) == 2
 
 # Test getting all movies
@@ -128,29 +112,29 @@ def test_get_all_movies(db):
     movie1 = sample_movie_data(imdb_id="tt1111111", title="Movie 1")
     movie2 = sample_movie_data(imdb_id="tt2222222", title="Movie 2")
     movie3 = sample_movie_data(imdb_id="tt3333333", title="Movie 3")
-    crud.add_movie(db, movie1)
-    crud.add_movie(db, movie2)
-    crud.add_movie(db, movie3)
+    crud.add_movie(db, USER, movie1)
+    crud.add_movie(db, USER, movie2)
+    crud.add_movie(db, USER, movie3)
 
-    crud.update_watched_status(db, movie1["imdbID"], True)
-    all_movies = crud.get_all_movies(db)
+    crud.update_watched_status(db, USER, movie1["imdbID"], True)
+    all_movies = crud.get_all_movies(db, USER)
     assert len(all_movies) == 3
 
 # Test updating watched status
 def test_update_watched_status(db):
     data = sample_movie_data()
-    crud.add_movie(db, data)
+    crud.add_movie(db, USER, data)
 
-    updated_movie = crud.update_watched_status(db, data["imdbID"], True)
+    updated_movie = crud.update_watched_status(db, USER, data["imdbID"], True)
     assert updated_movie.watched is True
 
-    updated_movie = crud.update_watched_status(db, data["imdbID"], False)
+    updated_movie = crud.update_watched_status(db, USER, data["imdbID"], False)
     assert updated_movie.watched is False
 
 
 # Test update watched status on non-existent movie
 def test_update_watched_status_non_existent(db):
-    updated_movie = crud.update_watched_status(db, "tt0000000", True)
+    updated_movie = crud.update_watched_status(db, USER, "tt0000000", True)
     assert updated_movie is None
 
 # Test deleteting a movie
@@ -158,31 +142,32 @@ def test_deleting_movie(db):
     movie1 = sample_movie_data(imdb_id="tt1111111", title="Movie 1")
     movie2 = sample_movie_data(imdb_id="tt2222222", title="Movie 2")
     movie3 = sample_movie_data(imdb_id="tt3333333", title="Movie 3")
-    crud.add_movie(db, movie1)
-    crud.add_movie(db, movie2)
-    crud.add_movie(db, movie3)
+    crud.add_movie(db, USER, movie1)
+    crud.add_movie(db, USER, movie2)
+    crud.add_movie(db, USER, movie3)
 
-    crud.delete_movie(db, movie1["imdbID"])
+    crud.delete_movie(db, USER, movie1["imdbID"])
 
-    all_movies = crud.get_all_movies(db)
+    all_movies = crud.get_all_movies(db, USER)
     assert len(all_movies) == 2
 
-    movie = db.query(Movie).filter_by(imdb_id=movie1["imdbID"]).first()
-    assert movie is None
+    assert crud.get_existing_imdb_ids(db, USER, [movie1["imdbID"]]) == set()
+    # The catalog keeps the movie for other users (and a later re-add)
+    assert db.query(Movie).filter_by(imdb_id=movie1["imdbID"]).first() is not None
 
 # Test deleting a non-existent movie
 def test_deleting_non_existent_movie(db):
-    deleted_movie = crud.delete_movie(db, "tt0000000")
+    deleted_movie = crud.delete_movie(db, USER, "tt0000000")
     assert deleted_movie is None
 
 # Test getting total movies count
 def test_get_total_movies(db):
     movie1 = sample_movie_data(imdb_id="tt1111111", title="Movie 1")
     movie2 = sample_movie_data(imdb_id="tt2222222", title="Movie 2")
-    crud.add_movie(db, movie1)
-    crud.add_movie(db, movie2)
+    crud.add_movie(db, USER, movie1)
+    crud.add_movie(db, USER, movie2)
 
-    total_count = crud.get_total_movies(db)
+    total_count = crud.get_total_movies(db, USER)
     assert total_count == 2
 
 # Test getting watched movies count
@@ -190,16 +175,294 @@ def test_get_watched_movies_count(db):
     movie1 = sample_movie_data(imdb_id="tt1111111", title="Movie 1")
     movie2 = sample_movie_data(imdb_id="tt2222222", title="Movie 2")
     movie3 = sample_movie_data(imdb_id="tt3333333", title="Movie 3")
-    crud.add_movie(db, movie1)
-    crud.add_movie(db, movie2)
-    crud.add_movie(db, movie3)
+    crud.add_movie(db, USER, movie1)
+    crud.add_movie(db, USER, movie2)
+    crud.add_movie(db, USER, movie3)
 
-    crud.update_watched_status(db, movie1["imdbID"], True)
-    crud.update_watched_status(db, movie3["imdbID"], True)
+    crud.update_watched_status(db, USER, movie1["imdbID"], True)
+    crud.update_watched_status(db, USER, movie3["imdbID"], True)
 
-    watched_count = crud.get_watched_movies_count(db)
+    watched_count = crud.get_watched_movies_count(db, USER)
     assert watched_count == 2
 
 
 
 
+# Test keyset pagination walks every row exactly once, including rows added in the same second
+def test_get_movies_page_walks_all_rows(db):
+    for i in range(7):
+        crud.add_movie(db, USER, sample_movie_data(imdb_id=f"tt000000{i}", title=f"Movie {i}"))
+    crud.update_watched_status(db, USER, "tt0000003", True)
+
+    seen = []
+    after = None
+    while True:
+        page = crud.get_movies_page(db, USER, None, 2, after)
+        if not page:
+            break
+        seen.extend(movie.imdb_id for movie in page)
+        after = (page[-1].date_added, page[-1].movie_id)
+
+    assert seen == [f"tt000000{i}" for i in range(7) if i != 3]
+
+# Test keyset pagination with the watched filter
+def test_get_movies_page_watched(db):
+    for i in range(3):
+        crud.add_movie(db, USER, sample_movie_data(imdb_id=f"tt000000{i}", title=f"Movie {i}"))
+        crud.update_watched_status(db, USER, f"tt000000{i}", True)
+
+    page = crud.get_movies_page(db, USER, True, 10)
+    assert [movie.imdb_id for movie in page] == ["tt0000000", "tt0000001", "tt0000002"]
+
+# Test streaming yields the same rows as the list query
+def test_iter_movies(db):
+    for i in range(5):
+        crud.add_movie(db, USER, sample_movie_data(imdb_id=f"tt000000{i}", title=f"Movie {i}"))
+
+    streamed = [movie.imdb_id for movie in crud.iter_movies(db, USER, None, batch_size=2)]
+    assert streamed == [movie.imdb_id for movie in crud.get_movie_watchlist(db, USER)]
+
+# Test bulk insert creates new movies and skips existing ones
+def test_add_movies_bulk(db):
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000001", title="Existing"))
+
+    created, skipped = crud.add_movies(db, USER, [
+        sample_movie_data(imdb_id="tt0000001", title="Existing"),
+        sample_movie_data(imdb_id="tt0000002", title="Movie 2"),
+        sample_movie_data(imdb_id="tt0000003", title="Movie 3", genre="Drama"),
+    ])
+
+    assert sorted(movie.imdb_id for movie in created) == ["tt0000002", "tt0000003"]
+    assert skipped == {"tt0000001"}
+    assert crud.get_total_movies(db, USER) == 3
+    assert aggregates.verify(db, USER) == {}
+
+# Test bulk insert with nothing new
+def test_add_movies_bulk_all_existing(db):
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000001"))
+    created, skipped = crud.add_movies(db, USER, [sample_movie_data(imdb_id="tt0000001")])
+    assert created == []
+    assert skipped == {"tt0000001"}
+
+# Test existing-ID lookup
+def test_get_existing_imdb_ids(db):
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000001"))
+    assert crud.get_existing_imdb_ids(db, USER, ["tt0000001", "tt0000002"]) == {"tt0000001"}
+    assert crud.get_existing_imdb_ids(db, USER, []) == set()
+
+# Test that re-setting the same watched status leaves the aggregates alone
+def test_update_watched_status_unchanged(db):
+    data = sample_movie_data()
+    crud.add_movie(db, USER, data)
+    crud.update_watched_status(db, USER, data["imdbID"], True)
+
+    movie = crud.update_watched_status(db, USER, data["imdbID"], True)
+
+    assert movie.watched is True
+    assert aggregates.read_totals(db, USER)["number_watched"] == 1
+    assert aggregates.verify(db, USER) == {}
+
+# Test that deleting a movie updates the aggregates and keeps the catalog's genre links
+def test_delete_movie_keeps_catalog_genres(db):
+    data = sample_movie_data(genre="Action, Drama")
+    crud.add_movie(db, USER, data)
+
+    deleted = crud.delete_movie(db, USER, data["imdbID"])
+
+    assert deleted.imdb_id == data["imdbID"]
+    assert deleted.genre == "Action, Drama"
+    assert db.execute(select(func.count()).select_from(movie_genres)).scalar() == 2
+    assert aggregates.verify(db, USER) == {}
+
+# Test that a duplicate inserted since the existence check is skipped instead of failing the batch
+def test_add_movies_bulk_concurrent_duplicate(db):
+    with patch("app.crud.get_existing_imdb_ids", return_value=set()):
+        crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000001"))
+        created, skipped = crud.add_movies(db, USER, [
+            sample_movie_data(imdb_id="tt0000001"),
+            sample_movie_data(imdb_id="tt0000002"),
+        ])
+
+    assert [movie.imdb_id for movie in created] == ["tt0000002"]
+    assert skipped == {"tt0000001"}
+    assert aggregates.verify(db, USER) == {}
+
+# Test the single-statement writes issue one watchlist_entries statement each
+def test_writes_use_returning(db):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    try:
+        data = sample_movie_data()
+        crud.add_movie(db, USER, data)
+        crud.update_watched_status(db, USER, data["imdbID"], True)
+        crud.delete_movie(db, USER, data["imdbID"])
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record)
+
+    entry_statements = [s for s in statements if re.match(r"(INSERT INTO|UPDATE|DELETE FROM) watchlist_entries ", s)]
+    assert [s.split()[0] for s in entry_statements] == ["INSERT", "UPDATE", "DELETE"]
+    assert all("RETURNING" in s for s in entry_statements)
+
+# Test the rows a write returns are read after its commit without another query
+def test_written_rows_stay_loaded_after_commit(db):
+    data = sample_movie_data()
+    _, added = crud.add_movie(db, USER, data)
+    updated = crud.update_watched_status(db, USER, data["imdbID"], True)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    try:
+        assert (added.imdb_id, added.movie.title) == (data["imdbID"], data["Title"])
+        assert (updated.watched, updated.movie.title) == (True, data["Title"])
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record)
+
+    assert statements == []
+
+# Test the SELECT-based fallback for dialects without RETURNING
+def test_writes_without_returning(db):
+    dialect = db.get_bind().dialect
+    with patch.object(dialect, "insert_returning", False), \
+         patch.object(dialect, "update_returning", False), \
+         patch.object(dialect, "delete_returning", False):
+        data = sample_movie_data()
+        assert crud.add_movie(db, USER, data)[0] == "created"
+        assert crud.add_movie(db, USER, data)[0] == "already_exists"
+        assert crud.update_watched_status(db, USER, data["imdbID"], True).watched is True
+        assert crud.delete_movie(db, USER, data["imdbID"]).imdb_id == data["imdbID"]
+    assert aggregates.verify(db, USER) == {}
+
+
+# Test that watchlists are separate per user
+def test_watchlists_are_per_user(db):
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000001", title="Shared"))
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000002", title="Alice only"))
+    assert crud.add_movie(db, "bob", sample_movie_data(imdb_id="tt0000001", title="Shared"))[0] == "created"
+
+    crud.update_watched_status(db, "bob", "tt0000001", True)
+
+    assert sorted(m.imdb_id for m in crud.get_movie_watchlist(db, USER)) == ["tt0000001", "tt0000002"]
+    assert [m.imdb_id for m in crud.get_movie_watchlist(db, "bob")] == []
+    assert [m.imdb_id for m in crud.get_movies_by_watched_status(db, "bob", True)] == ["tt0000001"]
+    assert crud.update_watched_status(db, "bob", "tt0000002", True) is None
+    assert crud.delete_movie(db, "bob", "tt0000002") is None
+    assert crud.get_total_movies(db, USER) == 2
+    assert crud.get_total_movies(db, "bob") == 1
+    assert aggregates.verify(db, USER) == aggregates.verify(db, "bob") == {}
+
+# Test that a movie saved by several users is stored once
+def test_catalog_is_shared(db):
+    for user_id in ("alice", "bob", "carol"):
+        crud.add_movie(db, user_id, sample_movie_data())
+    crud.add_movies(db, "dave", [sample_movie_data(), sample_movie_data(imdb_id="tt0000002")])
+
+    assert db.query(Movie).count() == 2
+    assert db.query(WatchlistEntry).count() == 5
+    assert db.execute(select(func.count()).select_from(movie_genres)).scalar() == 2
+
+# Test adding a catalog movie without its OMDb payload
+def test_add_catalog_movie(db):
+    crud.add_movie(db, USER, sample_movie_data())
+    movie = crud.get_catalog_movie(db, "tt1375666")
+
+    status, entry = crud.add_movie(db, "bob", movie)
+    assert status == "created"
+    assert (entry.user_id, entry.title, entry.watched) == ("bob", "Inception", False)
+    created, skipped = crud.add_movies(db, "carol", [movie])
+    assert [e.imdb_id for e in created] == ["tt1375666"]
+    assert crud.get_catalog_movie(db, "tt0000000") is None
+
+# Test that deleting then re-adding reuses the catalog row
+def test_readd_after_delete(db):
+    crud.add_movie(db, USER, sample_movie_data())
+    crud.delete_movie(db, USER, "tt1375666")
+    status, entry = crud.add_movie(db, USER, sample_movie_data())
+
+    assert status == "created"
+    assert db.query(Movie).count() == 1
+    assert aggregates.verify(db, USER) == {}
+
+# Test that never-refreshed movies come first, then the least recently refreshed
+def test_get_stale_movies(db):
+    for n in range(1, 5):
+        crud.add_movie(db, USER, sample_movie_data(imdb_id=f"tt000000{n}"))
+    stamps = {"tt0000001": datetime(2024, 3, 1), "tt0000002": None, "tt0000003": datetime(2024, 1, 1), "tt0000004": datetime(2025, 1, 1)}
+    for imdb_id, stamp in stamps.items():
+        db.execute(update(Movie).where(Movie.imdb_id == imdb_id).values(last_refreshed_at=stamp))
+    db.commit()
+
+    stale = crud.get_stale_movies(db, datetime(2024, 6, 1), 10)
+    assert [m.imdb_id for m in stale] == ["tt0000002", "tt0000003", "tt0000001"]
+    assert [m.imdb_id for m in crud.get_stale_movies(db, datetime(2024, 6, 1), 2)] == ["tt0000002", "tt0000003"]
+
+# Test that a claimed movie is not handed out again until its claim runs out
+def test_claim_stale_movies(db):
+    for n in range(1, 4):
+        crud.add_movie(db, USER, sample_movie_data(imdb_id=f"tt000000{n}"))
+    db.execute(update(Movie).values(last_refreshed_at=None))
+    db.commit()
+
+    first = crud.claim_stale_movies(db, datetime(2024, 6, 1), datetime(2024, 6, 2), 2)
+    assert [imdb_id for _, imdb_id in first] == ["tt0000001", "tt0000002"]
+    assert [imdb_id for _, imdb_id in crud.claim_stale_movies(db, datetime(2024, 6, 1), datetime(2024, 6, 2), 2)] == ["tt0000003"]
+    assert crud.claim_stale_movies(db, datetime(2024, 6, 1), datetime(2024, 6, 2), 2) == []
+    assert len(crud.claim_stale_movies(db, datetime(2024, 6, 3), datetime(2024, 6, 4), 5)) == 3
+
+# Test that of two refreshers that picked the same movies, only the first claim wins
+def test_claim_stale_movies_rechecks_due(db):
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000001"))
+    db.execute(update(Movie).values(last_refreshed_at=None))
+    db.commit()
+    picked = crud.get_stale_movies(db, datetime(2024, 6, 1), 10)
+    crud.claim_stale_movies(db, datetime(2024, 6, 1), datetime(2024, 6, 2), 10)
+
+    with patch("app.crud.get_stale_movies", return_value=picked):
+        assert crud.claim_stale_movies(db, datetime(2024, 6, 1), datetime(2024, 6, 2), 10) == []
+
+# Test that new catalog movies count as freshly refreshed
+def test_new_movies_are_not_stale(db):
+    crud.add_movie(db, USER, sample_movie_data())
+    assert crud.get_catalog_movie(db, "tt1375666").last_refreshed_at is not None
+    assert crud.get_stale_movies(db, datetime(2000, 1, 1), 10) == []
+
+# Test writing refreshed metadata back to the catalog and every holder's totals
+def test_refresh_movies(db):
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000001", imdb_rating="7.0"))
+    crud.add_movie(db, USER, sample_movie_data(imdb_id="tt0000002", imdb_rating="N/A"))
+    crud.add_movie(db, "bob", sample_movie_data(imdb_id="tt0000001", imdb_rating="7.0"))
+    crud.add_movie(db, "carol", sample_movie_data(imdb_id="tt0000003"))
+    ids = {m.imdb_id: m.id for m in db.query(Movie)}
+    versions = {user_id: crud.get_watchlist_version(db, user_id) for user_id in (USER, "bob", "carol")}
+    refreshed_at = datetime(2030, 1, 1)
+
+    changed = crud.refresh_movies(db, {
+        ids["tt0000001"]: sample_movie_data(imdb_id="tt0000001", imdb_rating="7.5", plot="New plot"),
+        ids["tt0000002"]: sample_movie_data(imdb_id="tt0000002", imdb_rating="6.0"),
+        ids["tt0000003"]: sample_movie_data(imdb_id="tt0000003"),
+    }, refreshed_at)
+
+    assert sorted(changed) == ["tt0000001", "tt0000002"]
+    movie = crud.get_catalog_movie(db, "tt0000001")
+    assert (movie.rating, movie.plot) == (7.5, "New plot")
+    assert all(m.last_refreshed_at == refreshed_at for m in db.query(Movie))
+    assert aggregates.verify_all(db) == {}
+    assert aggregates.read_totals(db, USER)["rating_count"] == 2
+    assert crud.get_watchlist_version(db, USER) > versions[USER]
+    assert crud.get_watchlist_version(db, "bob") > versions["bob"]
+    assert crud.get_watchlist_version(db, "carol") == versions["carol"]
+
+# Test that a movie OMDb no longer returns keeps its data but counts as refreshed
+def test_refresh_movies_not_found(db):
+    crud.add_movie(db, USER, sample_movie_data())
+    movie_id = crud.get_catalog_movie(db, "tt1375666").id
+
+    assert crud.refresh_movies(db, {movie_id: None}, datetime(2030, 1, 1)) == []
+    movie = crud.get_catalog_movie(db, "tt1375666")
+    assert (movie.rating, movie.last_refreshed_at) == (8.8, datetime(2030, 1, 1))
@@ -0,0 +1,81 @@
+# Unit tests for database.py
+import pytest
+from unittest.mock import patch
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import NullPool, QueuePool
+from app import database
+from app.database import engine_options, PoolStats
+
+
+def test_sqlite_gets_no_pool_sizing():
+    options = engine_options("sqlite:///:memory:")
+    assert "pool_size" not in options
+    assert options["echo"] is False
+
+def test_postgres_gets_configured_pool():
+    with patch.multiple("app.database", DB_POOL_SIZE=7, DB_MAX_OVERFLOW=3, DB_POOL_TIMEOUT=2.5,
+                        DB_POOL_RECYCLE=600, DB_POOL_PRE_PING=True):
+        options = engine_options("postgresql://user:pw@localhost:6543/movies")
+
+    assert options["pool_size"] == 7
+    assert options["max_overflow"] == 3
+    assert options["pool_timeout"] == 2.5
+    assert options["pool_recycle"] == 600
+    assert options["pool_pre_ping"] is True
+
+def test_pool_size_zero_disables_pooling():
+    with patch("app.database.DB_POOL_SIZE", 0):
+        options = engine_options("postgresql://user:pw@localhost/movies")
+    assert options["poolclass"] is NullPool
+    assert "pool_size" not in options
+
+def test_pool_stats_snapshot(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=2, max_overflow=1)
+    stats = PoolStats()
+    stats.record_wait(0.01)
+    stats.record_wait(0.03)
+    stats.record_timeout()
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        snapshot = stats.snapshot(engine.pool)
+
+    assert snapshot["checkouts"] == 2
+    assert snapshot["timeouts"] == 1
+    assert snapshot["wait_seconds_max"] == 0.03
+    assert snapshot["wait_seconds_avg"] == pytest.approx(0.02)
+    assert snapshot["pool_class"] == "QueuePool"
+    assert snapshot["size"] == 2
+    assert snapshot["checkedout"] == 1
+
+def test_pool_stats_without_sizing():
+    engine = create_engine("sqlite://", poolclass=NullPool)
+    snapshot = PoolStats().snapshot(engine.pool)
+    assert snapshot["pool_class"] == "NullPool"
+    assert snapshot["size"] is None
+
+def test_get_db_records_checkout():
+    before = database.pool_stats.checkouts
+    generator = database.get_db()
+    db = next(generator)
+    assert db.execute(text("SELECT 1")).scalar() == 1
+    generator.close()
+    assert database.pool_stats.checkouts == before + 1
+
+def test_get_db_leaves_connection_setup_out_of_the_wait(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'slow.db'}", poolclass=NullPool)
+    database.time_new_connections(engine)
+
+    @event.listens_for(engine, "do_connect")
+    def slow_connect(dialect, connection_record, cargs, cparams):
+        time.sleep(0.2)
+
+    stats = PoolStats()
+    with patch("app.database.SessionLocal", database.make_sessionmaker(engine)), patch("app.database.pool_stats", stats):
+        generator = database.get_db()
+        next(generator)
+        generator.close()
+
+    assert stats.checkouts == 1
+    assert stats.wait_seconds_max < 0.1
@@ -0,0 +1,124 @@
+# Tests for movies_analytics/dataset.py: the columnar cache must hand the
+# analysis exactly the data a CSV parse would
+import json
+import os
+import pandas as pd
+import pytest
+from unittest.mock import patch
+from app.movies_analytics import analyze, dataset
+
+CSV = """title,genre,rating,votes,description
+Amélie," Comedy, Romance ",8.3,"785,000",x
+Alpha,Drama,9.1,"1,234",x
+Gamma,,,,x
+Alpha,Comedy,9.5,"2,000",x
+,Drama,4.0,3,x
+"""
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "movies.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return tmp_path / "cache"
+
+
+class TestIngest:
+    def test_writes_entry_keyed_by_hash(self, source, cache_dir):
+        entry = dataset.ingest(source, cache_dir)
+        assert entry.parent == cache_dir
+        assert entry.name == f"{dataset.file_hash(source)}-v{dataset.FORMAT_VERSION}"
+        manifest = json.loads((entry / "manifest.json").read_text())
+        assert manifest["rows"] == 5
+
+    def test_reuses_entry(self, source, cache_dir):
+        first = dataset.ingest(source, cache_dir)
+        with patch("app.movies_analytics.dataset.read_chunks") as read_chunks, \
+                patch("app.movies_analytics.dataset.file_hash") as file_hash:
+            assert dataset.ingest(source, cache_dir) == first
+        read_chunks.assert_not_called()
+        # Unchanged size and mtime: the source is not even re-hashed
+        file_hash.assert_not_called()
+
+    def test_changed_source_gets_new_entry(self, source, cache_dir):
+        first = dataset.ingest(source, cache_dir)
+        source.write_text(CSV + "Delta,Drama,7.0,10,x\n", encoding="utf-8")
+        second = dataset.ingest(source, cache_dir)
+        assert second != first
+        assert dataset.Dataset(second).rows == 6
+
+    def test_same_size_and_mtime_but_new_content_uses_old_hash(self, source, cache_dir):
+        # The (size, mtime) shortcut is what makes warm runs cheap; document its limit
+        first = dataset.ingest(source, cache_dir)
+        stat = source.stat()
+        source.write_text(CSV.replace("9.1", "9.2"), encoding="utf-8")
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert dataset.ingest(source, cache_dir) == first
+
+    def test_failed_ingest_leaves_nothing(self, source, cache_dir):
+        with patch("app.movies_analytics.dataset._write_columns", side_effect=ValueError("bad row")):
+            with pytest.raises(ValueError):
+                dataset.ingest(source, cache_dir)
+        assert [p.name for p in cache_dir.iterdir()] == [dataset._INDEX_FILE]
+
+    def test_rebuilds_entry_of_other_format_version(self, source, cache_dir):
+        entry = dataset.ingest(source, cache_dir)
+        manifest = json.loads((entry / "manifest.json").read_text())
+        (entry / "manifest.json").write_text(json.dumps({**manifest, "format_version": 0}))
+        (entry / "rating.f32").write_bytes(b"")
+        assert dataset.ingest(source, cache_dir) == entry
+        assert dataset.Dataset(entry).column("rating")[0] == pytest.approx(8.3)
+
+
+class TestDataset:
+    def test_rejects_other_format_version(self, source, cache_dir):
+        entry = dataset.ingest(source, cache_dir)
+        manifest = json.loads((entry / "manifest.json").read_text())
+        (entry / "manifest.json").write_text(json.dumps({**manifest, "format_version": 0}))
+        with pytest.raises(ValueError, match="format version 0"):
+            dataset.Dataset(entry)
+
+    def test_columns_round_trip(self, source, cache_dir):
+        ds = dataset.load(source, cache_dir)
+        (chunk,) = ds.chunks()
+        parsed = next(dataset.read_chunks(source))
+
+        assert chunk["title"].tolist()[:4] == parsed["title"].tolist()[:4]
+        assert pd.isna(chunk["title"][4])
+        # Cleaned on ingest
+        assert chunk["genre"].tolist()[:2] == ["Comedy, Romance", "Drama"]
+        assert pd.isna(chunk["genre"][2])
+        assert chunk["rating"].dtype == "float32"
+        assert chunk["rating"].equals(parsed["rating"])
+        assert chunk["votes"].dtype == "Int32"
+        assert chunk["votes"].equals(parsed["votes"])
+
+    def test_only_requested_columns(self, source, cache_dir):
+        ds = dataset.load(source, cache_dir)
+        chunks = list(ds.chunks(chunksize=2, columns=["rating"]))
+        assert [list(c.columns) for c in chunks] == [["rating"]] * 3
+        assert [len(c) for c in chunks] == [2, 2, 1]
+        assert chunks[1].index.tolist() == [2, 3]
+
+    def test_empty_csv(self, tmp_path, cache_dir):
+        path = tmp_path / "empty.csv"
+        path.write_text("title,genre,rating,votes\n")
+        ds = dataset.load(path, cache_dir)
+        assert ds.rows == 0
+        assert list(ds.chunks()) == []
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 1000])
+def test_analysis_matches_csv_parse(source, cache_dir, chunksize):
+    cached = analyze.analyze_csv(source, chunksize, cache_dir=cache_dir)
+    assert cached == analyze.analyze_csv(source, chunksize)
+
+
+def test_bundled_csv_matches(tmp_path):
+    cached = analyze.analyze_csv(analyze.DEFAULT_CSV, 4000, cache_dir=tmp_path)
+    assert cached == analyze.analyze_csv(analyze.DEFAULT_CSV, 4000)
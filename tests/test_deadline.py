@@ -0,0 +1,73 @@
+# Unit tests for deadline.py
+import asyncio
+import time
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import deadline
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(deadline.DeadlineMiddleware)
+
+    @app.get("/remaining")
+    def remaining():
+        return {"remaining": deadline.remaining()}
+
+    @app.get("/remaining-async")
+    async def remaining_async():
+        # Tasks started for the request inherit its deadline
+        return {"remaining": await asyncio.create_task(asyncio.to_thread(deadline.remaining))}
+
+    return TestClient(app)
+
+
+# Test there is no deadline outside a request
+def test_no_deadline_by_default():
+    assert deadline.remaining() is None
+
+
+# Test a nested budget cannot extend the enclosing one
+def test_budget_nesting():
+    with deadline.budget(1):
+        with deadline.budget(60):
+            assert deadline.remaining() <= 1
+        with deadline.budget(0.5):
+            assert deadline.remaining() <= 0.5
+        assert 0.5 < deadline.remaining() <= 1
+    assert deadline.remaining() is None
+
+
+# Test remaining time never goes below zero
+def test_remaining_after_deadline():
+    with deadline.budget(0.001):
+        time.sleep(0.002)
+        assert deadline.remaining() == 0
+
+
+# Test each request gets REQUEST_DEADLINE, in sync handlers and tasks of async ones
+@patch("app.deadline.REQUEST_DEADLINE", 15)
+def test_middleware_sets_request_deadline():
+    client = make_client()
+
+    assert 14 < client.get("/remaining").json()["remaining"] <= 15
+    assert 14 < client.get("/remaining-async").json()["remaining"] <= 15
+
+
+# Test a caller can ask for a shorter deadline, but not a longer one
+@patch("app.deadline.REQUEST_DEADLINE", 15)
+def test_middleware_honours_timeout_header():
+    client = make_client()
+
+    assert client.get("/remaining", headers={"X-Request-Timeout": "2.5"}).json()["remaining"] <= 2.5
+    assert client.get("/remaining", headers={"X-Request-Timeout": "60"}).json()["remaining"] <= 15
+    assert client.get("/remaining", headers={"X-Request-Timeout": "soon"}).json()["remaining"] > 14
+
+
+# Test REQUEST_DEADLINE 0 leaves requests without a deadline
+@patch("app.deadline.REQUEST_DEADLINE", 0)
+def test_middleware_without_deadline():
+    assert make_client().get("/remaining").json()["remaining"] is None
@@ -0,0 +1,93 @@
+# Tests for genres.py against a real SQLite in-memory database
+from unittest.mock import patch
+from sqlalchemy import select, func
+from app.models import Movie, Genre, movie_genres
+from app import crud, genres, analytics
+
+USER = "alice"
+
+def movie_data(imdb_id, genre, rating="8.0"):
+    return {"imdbID": imdb_id, "Title": f"Movie {imdb_id}", "Year": "2020", "Genre": genre, "imdbRating": rating}
+
+def link_count(db):
+    return db.execute(select(func.count()).select_from(movie_genres)).scalar_one()
+
+
+def test_split_genres():
+    assert genres.split_genres("Action, Crime, Drama") == ["Action", "Crime", "Drama"]
+    assert genres.split_genres(" Drama ,, Drama,") == ["Drama"]
+    assert genres.split_genres("") == []
+    assert genres.split_genres(None) == []
+    assert genres.split_genres("N/A") == []
+
+def test_movie_without_genres_links_none(db):
+    crud.add_movie(db, USER, movie_data("tt1", "N/A"))
+    assert db.query(Genre).count() == 0
+    assert link_count(db) == 0
+
+# Test genres are created on dialects whose INSERT has no RETURNING
+def test_add_movie_links_genres_without_returning(db):
+    with patch.object(db.get_bind().dialect, "insert_returning", False):
+        crud.add_movie(db, USER, movie_data("tt1", "Action, Drama"))
+
+    assert sorted(name for (name,) in db.query(Genre.name)) == ["Action", "Drama"]
+    assert [m.imdb_id for m in crud.get_movie_watchlist(db, USER, genre="action")] == ["tt1"]
+
+def test_add_movie_links_genres(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Action, Crime, Drama"))
+    crud.add_movie(db, USER, movie_data("tt2", "Drama"))
+
+    assert sorted(name for (name,) in db.query(Genre.name)) == ["Action", "Crime", "Drama"]
+    assert link_count(db) == 4
+
+def test_bulk_add_links_genres(db):
+    crud.add_movies(db, USER, [movie_data("tt1", "Action, Drama"), movie_data("tt2", "Drama, Comedy")])
+    assert link_count(db) == 4
+
+def test_genres_are_linked_once_per_catalog_movie(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Action, Drama"))
+    crud.add_movie(db, "bob", movie_data("tt1", "Action, Drama"))
+    crud.delete_movie(db, USER, "tt1")
+    # The catalog movie (and its links) stay for other users
+    assert link_count(db) == 2
+    assert [m.imdb_id for m in crud.get_movie_watchlist(db, "bob", genre="drama")] == ["tt1"]
+    assert crud.get_movie_watchlist(db, USER, genre="drama") == []
+
+def test_filter_watchlist_by_genre(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Action, Crime"))
+    crud.add_movie(db, USER, movie_data("tt2", "Drama"))
+    crud.add_movie(db, USER, movie_data("tt3", "Crime, Drama"))
+    crud.update_watched_status(db, USER, "tt3", True)
+
+    assert [m.imdb_id for m in crud.get_movie_watchlist(db, USER, genre="crime")] == ["tt1"]
+    assert [m.imdb_id for m in crud.get_movies_by_watched_status(db, USER, True, genre="Crime")] == ["tt3"]
+    assert [m.imdb_id for m in crud.get_movies_page(db, USER, None, 10, genre="Drama")] == ["tt2"]
+    assert [m.imdb_id for m in crud.iter_movies(db, USER, None, genre="Action")] == ["tt1"]
+    assert crud.get_movie_watchlist(db, USER, genre="Western") == []
+
+def test_genre_stats(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Action, Crime", "7.0"))
+    crud.add_movie(db, USER, movie_data("tt2", "Drama", "N/A"))
+    crud.add_movie(db, USER, movie_data("tt3", "Crime, Drama", "8.333"))
+
+    assert analytics.compute_genre_stats(db, USER) == [
+        {"genre": "Crime", "movie_count": 2, "average_rating": 7.67},
+        {"genre": "Drama", "movie_count": 2, "average_rating": 8.33},
+        {"genre": "Action", "movie_count": 1, "average_rating": 7.0},
+    ]
+    assert analytics.compute_genre_stats(db, "bob") == []
+
+def test_backfill_links_existing_rows(db):
+    db.add_all([
+        Movie(imdb_id="tt1", title="A", year="2000", genre="Action, Drama"),
+        Movie(imdb_id="tt2", title="B", year="2000", genre=" , "),
+        Movie(imdb_id="tt3", title="C", year="2000", genre=None),
+        Movie(imdb_id="tt4", title="D", year="2000", genre="Drama"),
+    ])
+    db.commit()
+
+    assert genres.backfill(db, batch_size=1) == 2
+    assert link_count(db) == 3
+    # Running it again is a no-op
+    assert genres.backfill(db) == 0
+    assert link_count(db) == 3
@@ -0,0 +1,30 @@
+# Tests for http_cache.py
+from app import http_cache
+
+
+def test_etag_is_quoted_and_varies_by_version_resource_and_user():
+    tag = http_cache.etag(3, "movies", "alice")
+    assert tag.startswith('"movies-') and tag.endswith('-3"')
+    assert http_cache.etag(4, "movies", "alice") != tag
+    assert http_cache.etag(3, "analytics", "alice") != tag
+    assert http_cache.etag(3, "movies", "bob") != tag
+    # The user ID itself is not exposed
+    assert "alice" not in tag
+
+def test_matches():
+    tag = '"movies-3"'
+    assert http_cache.matches('"movies-3"', tag)
+    assert http_cache.matches('W/"movies-3"', tag)
+    assert http_cache.matches('"movies-2", "movies-3"', tag)
+    assert http_cache.matches("*", tag)
+    assert not http_cache.matches('"movies-2"', tag)
+    assert not http_cache.matches(None, tag)
+    assert not http_cache.matches("", tag)
+
+def test_not_modified_carries_validators():
+    response = http_cache.not_modified('"movies-3"')
+    assert response.status_code == 304
+    assert response.headers["ETag"] == '"movies-3"'
+    assert response.headers["Cache-Control"] == http_cache.CACHE_CONTROL
+    assert response.headers["Cache-Control"].startswith("private")
+    assert response.headers["Vary"] == "X-User-Id"
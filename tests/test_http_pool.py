@@ -0,0 +1,69 @@
+# Unit tests for http_pool.py
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.http_pool import ConnectionStats, build_session
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"Response": "True"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_snapshot_derives_reuse():
+    stats = ConnectionStats()
+    for _ in range(4):
+        stats.record_request()
+    stats.record_connection()
+
+    snapshot = stats.snapshot()
+    assert snapshot["connections_reused"] == 3
+    assert snapshot["reuse_ratio"] == 0.75
+
+def test_snapshot_empty():
+    assert ConnectionStats().snapshot()["reuse_ratio"] == 0.0
+
+def test_session_reuses_connections():
+    server = _serve()
+    stats = ConnectionStats()
+    session = build_session(stats, pool_connections=1, pool_maxsize=2)
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        for _ in range(5):
+            stats.record_request()
+            assert session.get(url, timeout=5).status_code == 200
+    finally:
+        session.close()
+        server.shutdown()
+
+    assert stats.snapshot()["connections_opened"] == 1
+    assert stats.snapshot()["connections_reused"] == 4
+
+def test_session_without_keepalive_opens_new_connections():
+    server = _serve()
+    stats = ConnectionStats()
+    session = build_session(stats, pool_connections=1, pool_maxsize=2, keepalive=False)
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        for _ in range(3):
+            session.get(url, timeout=5)
+    finally:
+        session.close()
+        server.shutdown()
+
+    assert stats.snapshot()["connections_opened"] == 3
@@ -1,11 +1,31 @@
 # Unit tests for main.py
+import json
+import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 from datetime import datetime
+from app import config, http_cache, omdb_guard
 from app.main import app
+from app.models import Movie
+from app.pagination import decode_cursor
 
 client = TestClient(app)
 
+def etag(version, resource="movies"):
+    return http_cache.etag(version, resource, config.DEFAULT_USER_ID)
+
+@pytest.fixture(autouse=True)
+def watchlist_version():
+    # The read endpoints look up the watchlist version for their ETag before anything else
+    with patch('app.main.crud.get_watchlist_version', return_value=7) as mock_version:
+        yield mock_version
+
+@pytest.fixture(autouse=True)
+def catalog():
+    # Nothing is in the shared catalog unless a test says so, so adds go to OMDb
+    with patch('app.main.crud.get_catalog_movies', return_value={}) as mock_catalog:
+        yield mock_catalog
+
 # Mock database dependency
 def mock_get_db():
     db = MagicMock()
@@ -14,9 +34,22 @@ def mock_get_db():
     finally:
         pass
 
+def make_mock_movie(imdb_id, title, watched=False):
+    mock_movie = MagicMock()
+    mock_movie.imdb_id = imdb_id
+    mock_movie.title = title
+    mock_movie.year = "2010"
+    mock_movie.genre = "Action, Sci-Fi"
+    mock_movie.rating = 8.8
+    mock_movie.plot = None
+    mock_movie.poster_url = None
+    mock_movie.watched = watched
+    mock_movie.date_added = datetime(2024, 1, 1)
+    return mock_movie
+
 
 class TestSearchMovies:
-    @patch('app.main.omdb_client.search_movies')
+    @patch('app.main.async_omdb_client.search_movies')
     def test_search_movies_success(self, mock_search):
         mock_search.return_value = [
             {"Title": "Inception", "Year": "2010", "imdbID": "tt1375666", "Type": "movie"}
@@ -29,7 +62,7 @@ class TestSearchMovies:
         assert response.json()[0]["Title"] == "Inception"
         mock_search.assert_called_once_with("Inception")
 
-    @patch('app.main.omdb_client.search_movies')
+    @patch('app.main.async_omdb_client.search_movies')
     def test_search_movies_empty_results(self, mock_search):
         mock_search.return_value = []
         
@@ -38,9 +71,28 @@ class TestSearchMovies:
         assert response.status_code == 200
         assert response.json() == []
 
+    @patch('app.main.async_omdb_client.search_movies')
+    def test_search_movies_upstream_error(self, mock_search):
+        mock_search.side_effect = Exception("Connection refused")
+
+        response = client.get("/api/v1/search/Inception")
+
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Movie search service unavailable"
+
+    @patch('app.main.async_omdb_client.search_movies')
+    def test_search_movies_refused_by_omdb_limits(self, mock_search):
+        mock_search.side_effect = omdb_guard.CircuitOpen("OMDb circuit is open", retry_after=12.3)
+
+        response = client.get("/api/v1/search/Inception")
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "13"
+        assert response.json() == {"detail": "Movie service unavailable", "reason": "circuit_open"}
+
 
 class TestFetchMovie:
-    @patch('app.main.omdb_client.fetch_movie_by_id')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
     def test_fetch_movie_success(self, mock_fetch):
         mock_fetch.return_value = {
             "Title": "Inception",
@@ -103,10 +155,71 @@ class TestGetWatchlist:
         assert response.json()[0]["watched"] is True
 
 
+    @patch('app.main.crud.get_movie_watchlist')
+    def test_get_watchlist_by_genre(self, mock_get_watchlist):
+        mock_get_watchlist.return_value = [make_mock_movie("tt1375666", "Inception")]
+
+        response = client.get("/api/v1/movies/?genre=Sci-Fi")
+
+        assert response.status_code == 200
+        assert mock_get_watchlist.call_args.kwargs["genre"] == "Sci-Fi"
+
+    @patch('app.main.crud.get_movies_page')
+    def test_get_watchlist_page_with_next_cursor(self, mock_get_page):
+        movies = []
+        for i in range(3):
+            movie = make_mock_movie(f"tt000000{i}", f"Movie {i}")
+            movie.movie_id = i + 1
+            movies.append(movie)
+        mock_get_page.return_value = movies
+
+        response = client.get("/api/v1/movies/?limit=2")
+
+        assert response.status_code == 200
+        assert [m["imdb_id"] for m in response.json()] == ["tt0000000", "tt0000001"]
+        # One extra row is fetched to detect the next page
+        assert mock_get_page.call_args.args[3] == 3
+        next_cursor = response.headers["X-Next-Cursor"]
+        assert decode_cursor(next_cursor) == (datetime(2024, 1, 1), 2)
+
+        client.get(f"/api/v1/movies/?limit=2&cursor={next_cursor}")
+        assert mock_get_page.call_args.args[4] == (datetime(2024, 1, 1), 2)
+
+    @patch('app.main.crud.get_movies_page')
+    def test_get_watchlist_last_page_has_no_cursor(self, mock_get_page):
+        mock_get_page.return_value = [make_mock_movie("tt0000001", "Movie 1")]
+
+        response = client.get("/api/v1/movies/?limit=2")
+
+        assert response.status_code == 200
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_get_watchlist_invalid_cursor(self):
+        response = client.get("/api/v1/movies/?cursor=garbage")
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+
+    def test_get_watchlist_limit_out_of_range(self):
+        assert client.get("/api/v1/movies/?limit=0").status_code == 422
+
+    @patch('app.main.crud.iter_movies')
+    def test_get_watchlist_stream(self, mock_iter):
+        mock_iter.return_value = iter([make_mock_movie("tt0000001", "Movie 1"), make_mock_movie("tt0000002", "Movie 2")])
+
+        response = client.get("/api/v1/movies/?stream=true&watched=true")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["imdb_id"] for line in lines] == ["tt0000001", "tt0000002"]
+        assert mock_iter.call_args.args[2] is True
+
+
 class TestAddMovieToWatchlist:
     @patch('app.main.get_db', mock_get_db)
     @patch('app.main.crud.add_movie')
-    @patch('app.main.omdb_client.fetch_movie_by_id')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
     def test_add_movie_success(self, mock_fetch, mock_add):
         mock_fetch.return_value = {
             "Title": "Inception",
@@ -136,7 +249,7 @@ class TestAddMovieToWatchlist:
         assert response.json()["title"] == "Inception"
 
     @patch('app.main.get_db', mock_get_db)
-    @patch('app.main.omdb_client.fetch_movie_by_id')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
     def test_add_movie_not_found_in_omdb(self, mock_fetch):
         mock_fetch.return_value = None
         
@@ -147,7 +260,7 @@ class TestAddMovieToWatchlist:
 
     @patch('app.main.get_db', mock_get_db)
     @patch('app.main.crud.add_movie')
-    @patch('app.main.omdb_client.fetch_movie_by_id')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
     def test_add_movie_already_exists(self, mock_fetch, mock_add):
         mock_fetch.return_value = {
             "Title": "Inception",
@@ -162,6 +275,71 @@ class TestAddMovieToWatchlist:
         assert response.json()["detail"] == "Movie is already in your watchlist"
 
 
+    @patch('app.main.get_db', mock_get_db)
+    @patch('app.main.crud.add_movie')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
+    def test_add_movie_quota_exhausted(self, mock_fetch, mock_add):
+        mock_fetch.side_effect = omdb_guard.QuotaExhausted("OMDb daily quota used up", retry_after=3600)
+
+        response = client.post("/api/v1/movies", json={"imdb_id": "tt1375666"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3600"
+        assert response.json()["reason"] == "quota_exhausted"
+        mock_add.assert_not_called()
+
+class TestAddMoviesBulk:
+    @patch('app.main.crud.add_movies')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
+    @patch('app.main.crud.get_existing_imdb_ids')
+    def test_bulk_add_reports_status_per_id(self, mock_existing, mock_fetch, mock_add_movies):
+        mock_existing.return_value = {"tt0000001"}
+
+        async def fetch(imdb_id):
+            if imdb_id == "tt0000003":
+                return None
+            if imdb_id == "tt0000004":
+                raise Exception("Timeout")
+            return {"imdbID": imdb_id, "Title": "Movie", "Year": "2020"}
+
+        mock_fetch.side_effect = fetch
+        created = MagicMock()
+        created.imdb_id = "tt0000002"
+        mock_add_movies.return_value = ([created], set())
+
+        response = client.post("/api/v1/movies/bulk", json={
+            "imdb_ids": ["tt0000001", "tt0000002", "tt0000003", "tt0000004", "tt0000002"]
+        })
+
+        assert response.status_code == 200
+        assert response.json()["results"] == [
+            {"imdb_id": "tt0000001", "status": "already_exists"},
+            {"imdb_id": "tt0000002", "status": "created"},
+            {"imdb_id": "tt0000003", "status": "not_found"},
+            {"imdb_id": "tt0000004", "status": "upstream_error"},
+        ]
+        # Existing IDs are never fetched, and everything new goes in one insert
+        assert sorted(call.args[0] for call in mock_fetch.call_args_list) == ["tt0000002", "tt0000003", "tt0000004"]
+        mock_add_movies.assert_called_once()
+        assert [data["imdbID"] for data in mock_add_movies.call_args.args[2]] == ["tt0000002"]
+
+    @patch('app.main.crud.add_movies')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
+    @patch('app.main.crud.get_existing_imdb_ids')
+    def test_bulk_add_concurrent_insert_reported_as_existing(self, mock_existing, mock_fetch, mock_add_movies):
+        mock_existing.return_value = set()
+        mock_fetch.return_value = {"imdbID": "tt0000001", "Title": "Movie", "Year": "2020"}
+        mock_add_movies.return_value = ([], {"tt0000001"})
+
+        response = client.post("/api/v1/movies/bulk", json={"imdb_ids": ["tt0000001"]})
+
+        assert response.json()["results"] == [{"imdb_id": "tt0000001", "status": "already_exists"}]
+
+    def test_bulk_add_requires_ids(self):
+        response = client.post("/api/v1/movies/bulk", json={"imdb_ids": []})
+        assert response.status_code == 422
+
+
 class TestUpdateMovieStatus:
     @patch('app.main.get_db', mock_get_db)
     @patch('app.main.crud.update_watched_status')
@@ -257,4 +435,185 @@ class TestGetAnalytics:
         
         assert response.status_code == 200
         assert response.json()["average_rating"] is None
-        assert response.json()["total_movies"] == 0
\ No newline at end of file
+        assert response.json()["total_movies"] == 0
+
+class TestGetStats:
+    @patch('app.main.omdb_client.connection_stats')
+    @patch('app.main.omdb_client.cache_stats')
+    def test_get_stats(self, mock_cache_stats, mock_connection_stats):
+        mock_cache_stats.return_value = {"hits": 3, "misses": 1}
+        mock_connection_stats.return_value = {"requests": 4, "connections_opened": 1}
+
+        response = client.get("/api/v1/stats")
+
+        assert response.status_code == 200
+        assert response.json()["omdb"]["cache"]["hits"] == 3
+        assert response.json()["omdb"]["http"]["connections_opened"] == 1
+        assert response.json()["omdb"]["refresh"]["running"] is False
+        assert response.json()["omdb"]["limits"]["circuit"]["state"] == "closed"
+        assert response.json()["omdb"]["latency"]["retries"] == 0
+
+
+class TestGetGenreAnalytics:
+    @patch('app.main.compute_genre_stats')
+    def test_get_genre_analytics(self, mock_genre_stats):
+        mock_genre_stats.return_value = [
+            {"genre": "Drama", "movie_count": 3, "average_rating": 7.9},
+            {"genre": "Action", "movie_count": 1, "average_rating": None}
+        ]
+
+        response = client.get("/api/v1/analytics/genres")
+
+        assert response.status_code == 200
+        assert response.json()[0] == {"genre": "Drama", "movie_count": 3, "average_rating": 7.9}
+        assert response.json()[1]["average_rating"] is None
+
+
+class TestSearchWatchlist:
+    @patch('app.main.crud.search_watchlist')
+    def test_search_watchlist(self, mock_search):
+        mock_search.return_value = [make_mock_movie("tt1375666", "Inception")]
+
+        response = client.get("/api/v1/watchlist/search?q=dream%20heist&limit=5")
+
+        assert response.status_code == 200
+        assert response.json()[0]["title"] == "Inception"
+        assert mock_search.call_args.args[1:] == ("default", "dream heist", 5)
+
+    def test_search_watchlist_requires_query(self):
+        response = client.get("/api/v1/watchlist/search")
+        assert response.status_code == 422
+
+
+class TestGetMetrics:
+    def test_get_metrics(self):
+        client.get("/api/v1/stats")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE http_request_duration_seconds histogram" in response.text
+        assert 'http_requests_total{method="GET",route="/api/v1/stats",status="200"}' in response.text
+
+
+class TestConditionalGet:
+    @patch('app.main.crud.get_movie_watchlist')
+    def test_watchlist_sends_validators(self, mock_watchlist):
+        mock_watchlist.return_value = []
+
+        response = client.get("/api/v1/movies/")
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == etag(7)
+        assert "max-age" in response.headers["Cache-Control"]
+
+    @patch('app.main.crud.get_movie_watchlist')
+    def test_watchlist_not_modified(self, mock_watchlist):
+        response = client.get("/api/v1/movies/", headers={"If-None-Match": etag(7)})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag(7)
+        mock_watchlist.assert_not_called()
+
+    @patch('app.main.crud.get_movie_watchlist')
+    def test_watchlist_stale_etag(self, mock_watchlist, watchlist_version):
+        mock_watchlist.return_value = []
+        watchlist_version.return_value = 8
+
+        response = client.get("/api/v1/movies/", headers={"If-None-Match": etag(7)})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == etag(8)
+
+    @patch('app.main.crud.get_movie_watchlist')
+    def test_watchlist_etag_is_per_user(self, mock_watchlist):
+        mock_watchlist.return_value = []
+        # Same version number, different user: the other user's tag must not match
+        response = client.get("/api/v1/movies/", headers={"If-None-Match": etag(7), "X-User-Id": "bob"})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == http_cache.etag(7, "movies", "bob")
+        assert response.headers["Cache-Control"].startswith("private")
+
+    @patch('app.main.crud.iter_movies')
+    def test_stream_sends_validators(self, mock_iter):
+        mock_iter.return_value = iter([])
+
+        response = client.get("/api/v1/movies/?stream=true")
+
+        assert response.headers["ETag"] == etag(7)
+        assert "Cache-Control" in response.headers
+
+    @patch('app.main.compute_movie_stats')
+    def test_analytics_not_modified(self, mock_stats):
+        response = client.get("/api/v1/analytics", headers={"If-None-Match": etag(7, "analytics")})
+
+        assert response.status_code == 304
+        mock_stats.assert_not_called()
+
+    @patch('app.main.compute_genre_stats')
+    def test_genre_analytics_not_modified(self, mock_genre_stats):
+        mock_genre_stats.return_value = []
+        etag = client.get("/api/v1/analytics/genres").headers["ETag"]
+
+        response = client.get("/api/v1/analytics/genres", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert mock_genre_stats.call_count == 1
+
+
+class TestUsers:
+    @patch('app.main.crud.get_movie_watchlist')
+    def test_requests_are_scoped_by_user_header(self, mock_get_watchlist, watchlist_version):
+        mock_get_watchlist.return_value = []
+
+        response = client.get("/api/v1/movies/", headers={"X-User-Id": "alice"})
+
+        assert response.status_code == 200
+        assert mock_get_watchlist.call_args.args[1] == "alice"
+        assert watchlist_version.call_args.args[1] == "alice"
+        # Shared caches must key the per-user responses by user
+        assert response.headers["Vary"] == "X-User-Id"
+
+    @patch('app.main.crud.get_movie_watchlist')
+    def test_default_user(self, mock_get_watchlist):
+        mock_get_watchlist.return_value = []
+        client.get("/api/v1/movies/")
+        assert mock_get_watchlist.call_args.args[1] == "default"
+
+    def test_empty_user_header_rejected(self):
+        assert client.get("/api/v1/movies/", headers={"X-User-Id": ""}).status_code == 422
+
+    @patch('app.main.crud.add_movie')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
+    def test_add_catalog_movie_skips_omdb(self, mock_fetch, mock_add, catalog):
+        movie = make_mock_movie("tt1375666", "Inception")
+        catalog.return_value = {"tt1375666": movie}
+        mock_add.return_value = ("created", movie)
+
+        response = client.post("/api/v1/movies", json={"imdb_id": "tt1375666"}, headers={"X-User-Id": "bob"})
+
+        assert response.status_code == 201
+        mock_fetch.assert_not_called()
+        assert mock_add.call_args.args[1:] == ("bob", movie)
+
+    @patch('app.main.crud.add_movies')
+    @patch('app.main.async_omdb_client.fetch_movie_by_id')
+    @patch('app.main.crud.get_existing_imdb_ids', return_value=set())
+    def test_bulk_add_fetches_only_movies_missing_from_catalog(self, mock_existing, mock_fetch, mock_add_movies, catalog):
+        movie = Movie(id=1, imdb_id="tt0000001", title="Shared", year="2020")
+        catalog.return_value = {"tt0000001": movie}
+
+        async def fetch(imdb_id):
+            return {"imdbID": imdb_id, "Title": "Movie", "Year": "2020"}
+
+        mock_fetch.side_effect = fetch
+        mock_add_movies.return_value = ([make_mock_movie("tt0000001", "Shared"), make_mock_movie("tt0000002", "Movie")], set())
+
+        response = client.post("/api/v1/movies/bulk", json={"imdb_ids": ["tt0000001", "tt0000002"]})
+
+        assert response.status_code == 200
+        assert [call.args[0] for call in mock_fetch.call_args_list] == ["tt0000002"]
+        assert mock_add_movies.call_args.args[2][0] is movie
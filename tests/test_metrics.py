@@ -0,0 +1,109 @@
+# Tests for metrics.py: exposition format, request middleware and DB/OMDb instrumentation
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from app import metrics, omdb_client
+
+
+def test_counter_render():
+    counter = metrics.Counter("things_total", "Things.", ("kind",))
+    counter.inc("a")
+    counter.inc("a")
+    counter.inc('quo"te')
+
+    assert counter.render() == [
+        "# HELP things_total Things.",
+        "# TYPE things_total counter",
+        'things_total{kind="a"} 2',
+        'things_total{kind="quo\\"te"} 1',
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/x")
+
+    lines = histogram.render()
+
+    assert 'latency_seconds_bucket{route="/x",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/x",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/x"} 3.65' in lines
+    assert 'latency_seconds_count{route="/x"} 4' in lines
+
+def test_gauge_inc_dec():
+    gauge = metrics.Gauge("in_flight", "In flight.")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.render()[-1] == "in_flight 1"
+
+
+@pytest.fixture
+def instrumented():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        return {"id": item_id}
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    return TestClient(app, raise_server_exceptions=False)
+
+def test_middleware_records_route_template_and_status(instrumented):
+    before = metrics.http_requests.value("GET", "/items/{item_id}", "200")
+
+    instrumented.get("/items/1")
+    instrumented.get("/items/2")
+    instrumented.get("/nowhere")
+    instrumented.get("/boom")
+
+    assert metrics.http_requests.value("GET", "/items/{item_id}", "200") == before + 2
+    assert metrics.http_requests.value("GET", "unmatched", "404") >= 1
+    assert metrics.http_requests.value("GET", "/boom", "500") >= 1
+    assert metrics.http_in_flight.value() == 0
+
+def test_middleware_counts_db_queries_per_request(instrumented):
+    count = metrics.db_queries.count("/items/{item_id}")
+    queries = metrics.db_queries.sum("/items/{item_id}")
+
+    instrumented.get("/items/1")
+
+    assert metrics.db_queries.count("/items/{item_id}") == count + 1
+    assert metrics.db_queries.sum("/items/{item_id}") == queries + 2
+    assert metrics.db_duration.count("/items/{item_id}") == count + 1
+
+def test_queries_outside_requests_are_not_counted():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert "query_start" not in conn.info
+
+@patch('app.omdb_client.requests.Session.get')
+def test_omdb_calls_recorded_by_outcome(mock_get):
+    ok = MagicMock(status_code=200)
+    ok.json.return_value = {"Title": "Inception", "imdbID": "tt1375666"}
+    ok.raise_for_status.return_value = None
+    mock_get.side_effect = [ok, requests.Timeout()]
+    ok_before = metrics.omdb_duration.count("detail", "ok")
+    timeout_before = metrics.omdb_duration.count("search", "timeout")
+
+    omdb_client.fetch_movie_by_id("tt1375666")
+    with pytest.raises(requests.Timeout):
+        omdb_client.search_movies("Inception")
+
+    assert metrics.omdb_duration.count("detail", "ok") == ok_before + 1
+    assert metrics.omdb_duration.count("search", "timeout") == timeout_before + 1
@@ -0,0 +1,260 @@
+# Tests for migrations.py against real SQLite databases, plus a query-plan check of the crud queries
+import random
+import re
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, insert, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from app import aggregates, analytics, crud, migrations, models
+from app.config import DEFAULT_USER_ID
+from app.models import Base
+
+# SQLite cannot reflect the lower(name) expression index; the other indexes are compared
+pytestmark = pytest.mark.filterwarnings("ignore:Skipped unsupported reflection")
+
+# The schema before genres, search, aggregates and multiple users existed
+LEGACY_SCHEMA = [
+    """
+    CREATE TABLE movies (
+        id INTEGER PRIMARY KEY,
+        imdb_id VARCHAR,
+        title VARCHAR,
+        year VARCHAR,
+        genre VARCHAR,
+        rating FLOAT,
+        plot VARCHAR,
+        poster_url VARCHAR,
+        watched BOOLEAN,
+        date_added DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX ix_movies_id ON movies (id)",
+    "CREATE UNIQUE INDEX ix_movies_imdb_id ON movies (imdb_id)",
+    "CREATE INDEX ix_movies_title ON movies (title)",
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'watchlist.db'}")
+    yield engine
+    engine.dispose()
+
+
+def indexes(engine):
+    inspector = inspect(engine)
+    return {
+        table: sorted((ix["name"], tuple(ix["column_names"])) for ix in inspector.get_indexes(table))
+        for table in Base.metadata.tables
+    }
+
+
+def test_fresh_database_matches_models(engine, tmp_path):
+    applied = migrations.upgrade(engine)
+
+    assert [m.version for m in applied] == [m.version for m in migrations.MIGRATIONS]
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    Base.metadata.create_all(reference)
+    assert indexes(engine) == indexes(reference)
+    reference.dispose()
+
+
+def test_upgrade_is_idempotent(engine):
+    migrations.upgrade(engine)
+
+    assert migrations.upgrade(engine) == []
+    assert migrations.pending(engine) == []
+
+
+def test_legacy_database_is_brought_forward(engine, tmp_path):
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(
+            "INSERT INTO movies (imdb_id, title, year, genre, rating, plot, watched) VALUES "
+            "('tt1', 'Inception', '2010', 'Action, Sci-Fi', 8.8, 'A thief steals secrets through dreams', 1), "
+            "('tt2', 'Heat', '1995', 'Crime, Drama', 8.3, 'A heist crew and a detective', 0)"
+        )
+
+    migrations.upgrade(engine)
+
+    db = sessionmaker(bind=engine)()
+    try:
+        assert {m.imdb_id: m.watched for m in crud.get_all_movies(db, DEFAULT_USER_ID)} == {"tt1": True, "tt2": False}
+        assert aggregates.verify_all(db) == {}
+        assert crud.get_total_movies(db, DEFAULT_USER_ID) == 2
+        assert [m.title for m in crud.search_watchlist(db, DEFAULT_USER_ID, "dreams", 10)] == ["Inception"]
+        assert [m.title for m in crud.get_movie_watchlist(db, DEFAULT_USER_ID, genre="drama")] == ["Heat"]
+    finally:
+        db.close()
+    # The old per-movie watched flag and date live on in watchlist_entries only
+    assert {"watched", "date_added"}.isdisjoint(column["name"] for column in inspect(engine).get_columns("movies"))
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    Base.metadata.create_all(reference)
+    assert indexes(engine) == indexes(reference)
+    reference.dispose()
+
+
+def test_workload_indexes_replace_the_old_list_index(engine):
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_watchlist_entries_user_watched_date_movie")
+        conn.exec_driver_sql(
+            "CREATE INDEX ix_watchlist_entries_user_watched_date ON watchlist_entries (user_id, watched, date_added)"
+        )
+        conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 5))
+
+    assert [m.name for m in migrations.upgrade(engine)] == ["workload_indexes"]
+    names = {ix["name"] for ix in inspect(engine).get_indexes("watchlist_entries")}
+    assert "ix_watchlist_entries_user_watched_date_movie" in names
+    assert "ix_watchlist_entries_user_watched_date" not in names
+
+
+def test_missing_date_added_is_backfilled(engine):
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        # An older database whose date_added column still allows NULL
+        conn.exec_driver_sql("DROP TABLE watchlist_entries")
+        conn.exec_driver_sql(
+            "CREATE TABLE watchlist_entries (user_id VARCHAR, movie_id INTEGER, watched BOOLEAN NOT NULL, "
+            "date_added DATETIME, PRIMARY KEY (user_id, movie_id))"
+        )
+        conn.exec_driver_sql("INSERT INTO watchlist_entries (user_id, movie_id, watched) VALUES ('alice', 1, 0)")
+        conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 8))
+
+    assert [m.name for m in migrations.upgrade(engine)] == ["watchlist_date_added_not_null"]
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM watchlist_entries WHERE date_added IS NULL").scalar() == 0
+
+
+def test_failed_migration_is_not_recorded(engine):
+    failing = migrations.Migration(99, "broken", MagicMock(side_effect=RuntimeError("boom")))
+    with patch("app.migrations.MIGRATIONS", migrations.MIGRATIONS + [failing]):
+        with pytest.raises(RuntimeError):
+            migrations.upgrade(engine)
+        assert [m.name for m in migrations.pending(engine)] == ["broken"]
+
+
+def test_postgres_indexes_are_built_concurrently():
+    conn = MagicMock()
+    conn.dialect = postgresql.dialect()
+    conn.execute.return_value.first.return_value = None
+    index = next(ix for ix in models.WatchlistEntry.__table__.indexes if ix.name == "ix_watchlist_entries_user_watched_date_movie")
+
+    migrations.create_index(conn, index)
+    migrations.drop_index(conn, "ix_old")
+
+    statements = [call.args[0] for call in conn.exec_driver_sql.call_args_list]
+    assert statements[0].startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_watchlist_entries_user_watched_date_movie")
+    assert statements[1] == "DROP INDEX CONCURRENTLY IF EXISTS ix_old"
+
+
+def test_invalid_postgres_index_is_rebuilt():
+    conn = MagicMock()
+    conn.dialect = postgresql.dialect()
+    conn.execute.return_value.first.return_value = (1,)
+    index = next(ix for ix in models.Genre.__table__.indexes if ix.name == "ix_genres_lower_name")
+
+    migrations.create_index(conn, index)
+
+    statements = [call.args[0] for call in conn.exec_driver_sql.call_args_list]
+    assert statements[0] == "DROP INDEX CONCURRENTLY IF EXISTS ix_genres_lower_name"
+    assert statements[1].startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_genres_lower_name")
+
+
+def test_main_status(engine, capsys):
+    with patch("app.database.engine", engine):
+        assert migrations.main(["status"]) == 1
+        assert migrations.main(["upgrade"]) == 0
+        assert migrations.main(["status"]) == 0
+    assert "5 workload_indexes: applied" in capsys.readouterr().out
+
+
+# Tables that grow with the catalog and with every user's watchlist
+LARGE_TABLES = {"movies", "watchlist_entries", "movie_genres"}
+USER = "u3"
+
+
+def seed(engine):
+    rng = random.Random(0)
+    db = sessionmaker(bind=engine)()
+    catalog = 20000
+    choices = ["Drama", "Action, Crime", "Comedy", "Horror, Drama", None]
+    crud.add_movies(db, "u0", [
+        {"imdbID": f"tt{n:07d}", "Title": f"Movie {n}", "Year": "2000", "Genre": rng.choice(choices),
+         "imdbRating": "7.1", "Plot": "plot words"}
+        for n in range(catalog)
+    ])
+    for user in range(1, 20):
+        db.execute(insert(models.WatchlistEntry), [
+            {"user_id": f"u{user}", "movie_id": movie_id, "watched": rng.random() < 0.5}
+            for movie_id in rng.sample(range(1, catalog + 1), 1000)
+        ])
+    db.commit()
+    aggregates.rebuild_all(db)
+    # Planner statistics, as a long-running database would have
+    db.execute(text("ANALYZE"))
+    db.commit()
+    return db
+
+
+def run_workload(db):
+    after = (datetime(2020, 1, 1), 5)
+    crud.get_movie_watchlist(db, USER)
+    crud.get_all_movies(db, USER)
+    crud.get_movies_by_watched_status(db, USER, True)
+    crud.get_movies_page(db, USER, None, 10)
+    crud.get_movies_page(db, USER, False, 10, after)
+    crud.get_movies_page(db, USER, None, 10, genre="drama")
+    crud.get_movie_rows(db, USER, None)
+    crud.get_movie_rows(db, USER, False, limit=10, after=after)
+    list(crud.iter_movies(db, USER, True, genre="Crime"))
+    crud.search_watchlist(db, USER, "plot", 5)
+    crud.get_existing_imdb_ids(db, USER, ["tt0000001", "tt0000002"])
+    crud.get_catalog_movies(db, ["tt0000001"])
+    crud.get_total_movies(db, USER)
+    crud.get_watched_movies_count(db, USER)
+    crud.get_watchlist_version(db, USER)
+    for backend in ("sql", "incremental"):
+        with patch("app.analytics.config.ANALYTICS_BACKEND", backend):
+            analytics.compute_movie_stats(db, USER)
+    analytics.compute_genre_stats(db, USER)
+    stale = crud.get_stale_movies(db, datetime(2100, 1, 1), 5)
+    crud.refresh_movies(db, {movie.id: {"imdbID": movie.imdb_id, "Title": movie.title, "Year": movie.year, "imdbRating": "8.0"}
+                             for movie in stale}, datetime(2100, 1, 1))
+    crud.add_movie(db, USER, crud.get_catalog_movie(db, "tt0000007"))
+    crud.update_watched_status(db, USER, "tt0000007", True)
+    crud.delete_movie(db, USER, "tt0000007")
+
+
+def test_crud_queries_never_scan_large_tables(engine):
+    migrations.upgrade(engine)
+    db = seed(engine)
+    statements = []
+
+    def record(conn, cursor, statement, params, context, executemany):
+        if not executemany and statement.lstrip().split()[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, params))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        run_workload(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        db.close()
+
+    assert statements
+    scans = []
+    with engine.connect() as conn:
+        for statement, params in statements:
+            for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params):
+                detail = row[3]
+                # A full pass over a big table, or an index SQLite had to build for lack of one
+                scan = re.match(r"SCAN (\w+)", detail)
+                if (scan and scan.group(1) in LARGE_TABLES) or "AUTOMATIC" in detail:
+                    scans.append(f"{detail}: {' '.join(statement.split())[:120]}")
+    assert scans == []
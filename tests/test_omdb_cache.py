@@ -0,0 +1,141 @@
+# Unit tests for omdb_cache.py
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+from app.omdb_cache import MemoryCache, DiskCache, OMDbCache, MISS, search_key, detail_key
+
+
+def test_keys_are_normalized():
+    assert search_key("  Inception ") == search_key("inception")
+    assert search_key("Inception", 2) != search_key("Inception", 1)
+    assert detail_key("TT1375666") == detail_key("tt1375666")
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    expires_at = time.time() + 60
+    cache.set("a", 1, expires_at)
+    cache.set("b", 2, expires_at)
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3, expires_at)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is MISS
+    assert cache.get("c") == 3
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache(max_entries=10)
+    cache.set("a", 1, time.time() - 1)
+    assert cache.get("a") is MISS
+    assert len(cache) == 0
+
+def test_memory_cache_stores_none_values():
+    cache = MemoryCache(max_entries=10)
+    cache.set("missing", None, time.time() + 60)
+    assert cache.get("missing") is None
+
+def test_disk_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCache(path, max_entries=10)
+    disk.set("detail:tt1", {"Title": "Inception"}, time.time() + 60)
+    disk.close()
+
+    reopened = DiskCache(path, max_entries=10)
+    value, _ = reopened.get("detail:tt1")
+    assert value == {"Title": "Inception"}
+
+def test_disk_cache_ignores_expired_rows(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    disk.set("detail:tt1", {"Title": "Inception"}, time.time() - 1)
+    value, _ = disk.get("detail:tt1")
+    assert value is MISS
+
+def test_disk_cache_prunes_to_max_entries(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.sqlite3"), max_entries=5)
+    for i in range(100):
+        disk.set(f"k{i}", i, time.time() + 60 + i)
+
+    count = disk._conn.execute("SELECT COUNT(*) FROM omdb_cache").fetchone()[0]
+    assert count == 5
+    # The entries that expire last are the ones kept
+    assert disk.get("k99")[0] == 99
+
+def test_disk_cache_file_is_created_lazily(tmp_path):
+    path = tmp_path / "cache" / "omdb_cache.sqlite3"
+    disk = DiskCache(str(path), max_entries=10)
+
+    assert not path.parent.exists()
+    disk.set("detail:tt1", {"Title": "Inception"}, time.time() + 60)
+    assert path.exists()
+
+def test_disk_cache_unwritable_path_is_a_miss(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    disk = DiskCache(str(blocker / "omdb_cache.sqlite3"), max_entries=10)
+
+    disk.set("detail:tt1", {"Title": "Inception"}, time.time() + 60)
+    assert disk.get("detail:tt1")[0] is MISS
+
+def test_two_tier_promotes_disk_hits_to_memory(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    disk.set("detail:tt1", {"Title": "Inception"}, time.time() + 60)
+    cache = OMDbCache(MemoryCache(max_entries=10), disk)
+
+    assert cache.get("detail:tt1") == {"Title": "Inception"}
+    assert cache.get("detail:tt1") == {"Title": "Inception"}
+
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["hits"] == 2
+
+def test_two_tier_counts_misses_and_sets():
+    cache = OMDbCache(MemoryCache(max_entries=10))
+    assert cache.get("search:inception:1") is MISS
+    cache.set("search:inception:1", [], ttl=60)
+    assert cache.get("search:inception:1") == []
+
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["sets"] == 1
+    assert stats["memory_hits"] == 1
+
+def test_two_tier_skips_non_positive_ttl():
+    cache = OMDbCache(MemoryCache(max_entries=10))
+    cache.set("search:inception:1", [], ttl=0)
+    assert cache.get("search:inception:1") is MISS
+
+def test_two_tier_respects_ttl():
+    cache = OMDbCache(MemoryCache(max_entries=10))
+    with patch("app.omdb_cache.time.time", return_value=1000.0):
+        cache.set("detail:tt1", {"Title": "Inception"}, ttl=60)
+    with patch("app.omdb_cache.time.time", return_value=1061.0):
+        assert cache.get("detail:tt1") is MISS
+
+def test_async_access_runs_disk_tier_off_the_event_loop(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    cache = OMDbCache(MemoryCache(max_entries=10), disk)
+    disk_threads = []
+    disk_get, disk_set = disk.get, disk.set
+
+    def record(fn):
+        def wrapper(*args):
+            disk_threads.append(threading.get_ident())
+            return fn(*args)
+        return wrapper
+
+    async def main():
+        await cache.set_async("detail:tt1", {"Title": "Inception"}, ttl=60)
+        cache.memory.clear()
+        from_disk = await cache.get_async("detail:tt1")
+        from_memory = await cache.get_async("detail:tt1")
+        return from_disk, from_memory
+
+    with patch.object(disk, "get", record(disk_get)), patch.object(disk, "set", record(disk_set)):
+        assert asyncio.run(main()) == ({"Title": "Inception"}, {"Title": "Inception"})
+
+    # One write and one read reached SQLite, neither on the loop's thread; the memory hit did not
+    assert len(disk_threads) == 2
+    assert threading.get_ident() not in disk_threads
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
@@ -1,6 +1,8 @@
+import time
 import pytest
 from unittest.mock import patch, Mock, ANY
-from app.omdb_client import search_movies, fetch_movie_by_id
+from app import deadline, omdb_guard, omdb_latency
+from app.omdb_client import search_movies, fetch_movie_by_id, cache_stats, connection_stats, open_session
 from requests.exceptions import HTTPError, Timeout
 
 MOCK_SEARCH_SUCCESS = {
@@ -13,7 +15,7 @@ MOCK_SEARCH_SUCCESS = {
 }
 
 # Test searching for movies by title
-@patch('app.omdb_client.requests.get')
+@patch('app.omdb_client.requests.Session.get')
 def test_search_movies_success_multiple_results(mock_get):
     mock_response = Mock()
     mock_response.status_code = 200
@@ -32,7 +34,7 @@ def test_search_movies_success_multiple_results(mock_get):
     }
     mock_get.assert_called_once_with(expected_url, params=expected_params, timeout=10)
 
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_search_movies_success_basic(mock_get):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -44,7 +46,7 @@ def test_search_movies_success_basic(mock_get):
     assert results[0]["Title"] == "Inception"
 
 # Test searching for movies by not status 200
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_search_movies_raises_http_error(mock_get):
     mock_response = Mock()
     mock_response.status_code = 500
@@ -56,7 +58,7 @@ def test_search_movies_raises_http_error(mock_get):
         search_movies(title_to_search)
 
 # Test searching for movies with no results
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_search_movies_no_results(mock_get):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {}
@@ -64,7 +66,7 @@ def test_search_movies_no_results(mock_get):
     assert results == []
 
 # Test searching for movies with empty title
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_search_movies_empty_title(mock_get):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {"Response": "False", "Error": "Incorrect IMDb ID."}
@@ -79,7 +81,7 @@ def test_search_movies_empty_title(mock_get):
     )
 
 # Test searching for movies with special characters
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_search_movies_special_characters(mock_get):
     expected_data = [{"Title": "A vs B: The Movie", "imdbID": "tt1000001"}]
     mock_get.return_value.status_code = 200
@@ -96,7 +98,7 @@ def test_search_movies_special_characters(mock_get):
     )
 
 # Verify that searching movies returns expected fields
-@patch('app.omdb_client.requests.get')
+@patch('app.omdb_client.requests.Session.get')
 def test_search_movies_returns_expected_fields(mock_get):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = MOCK_SEARCH_SUCCESS
@@ -111,7 +113,7 @@ def test_search_movies_returns_expected_fields(mock_get):
         assert "Year" in movie
         assert "Type" in movie
 
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_search_movies_timeout(mock_get):
     mock_get.side_effect = Timeout("Request timed out")
 
@@ -119,7 +121,7 @@ def test_search_movies_timeout(mock_get):
         search_movies("Inception")
 
 # Test fetching movie details by IMDb ID
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_fetch_movie_success(mock_get):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -129,7 +131,7 @@ def test_fetch_movie_success(mock_get):
     assert movie["Title"] == "Inception"
 
 # Test fetching movie details by not status 200
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_fetch_movie_raises_http_error_on_status(mock_get):
     """
     Tests that fetch_movie_by_id raises a requests.exceptions.HTTPError 
@@ -149,7 +151,7 @@ def test_fetch_movie_raises_http_error_on_status(mock_get):
     )
 
 # Test invalid IMDb ID returns None
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_fetch_movie_not_found(mock_get):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {"Response": "False", "Error": "Movie not found!"}
@@ -157,7 +159,7 @@ def test_fetch_movie_not_found(mock_get):
     assert movie is None
 
 # Verify that fetching movie details returns expected fields
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_fetch_movie_returns_expected_fields(mock_get):
     MOCK_MOVIE_DETAILS = {
         "Title": "Inception", "Year": "2010", "Rated": "PG-13", "Released": "16 Jul 2010",
@@ -176,7 +178,7 @@ def test_fetch_movie_returns_expected_fields(mock_get):
     assert movie["imdbID"] == "tt1375666"
 
 # Test fetching movie details with empty IMDb ID returns None
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_fetch_movie_empty_id(mock_get):
     MOCK_ERROR_RESPONSE = {"Response": "False", "Error": "Incorrect IMDb ID."}
     mock_get.return_value.status_code = 200
@@ -192,7 +194,7 @@ def test_fetch_movie_empty_id(mock_get):
     )
 
 # Test fetching movie details but imdbRating is "N/A"
-@patch("app.omdb_client.requests.get")
+@patch("app.omdb_client.requests.Session.get")
 def test_fetch_movie_rating_na(mock_get):
     MOCK_NA_RATING = {
         "Title": "Unrated Movie", "Year": "2025", 
@@ -204,4 +206,192 @@ def test_fetch_movie_rating_na(mock_get):
     movie = fetch_movie_by_id("tt2000000")
     
     assert movie["imdbRating"] == "N/A"
-    assert movie["Response"] == "True"
\ No newline at end of file
+    assert movie["Response"] == "True"
+# Test repeated searches are served from the cache
+@patch("app.omdb_client.requests.Session.get")
+def test_search_movies_uses_cache(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = MOCK_SEARCH_SUCCESS
+
+    first = search_movies("Inception")
+    second = search_movies("inception ")
+
+    assert first == second == MOCK_SEARCH_SUCCESS["Search"]
+    mock_get.assert_called_once()
+
+# Test repeated detail lookups are served from the cache
+@patch("app.omdb_client.requests.Session.get")
+def test_fetch_movie_uses_cache(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"Title": "Inception", "imdbID": "tt1375666", "Response": "True"}
+
+    fetch_movie_by_id("tt1375666")
+    movie = fetch_movie_by_id("tt1375666")
+
+    assert movie["Title"] == "Inception"
+    mock_get.assert_called_once()
+    assert cache_stats()["hits"] == 1
+
+# Test "Movie not found!" replies are cached as negative entries
+@patch("app.omdb_client.requests.Session.get")
+def test_fetch_movie_not_found_is_cached(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"Response": "False", "Error": "Movie not found!"}
+
+    assert fetch_movie_by_id("tt0000000") is None
+    assert fetch_movie_by_id("tt0000000") is None
+    mock_get.assert_called_once()
+
+# Test transient OMDb errors are not cached
+@patch("app.omdb_client.requests.Session.get")
+def test_fetch_movie_quota_error_not_cached(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"Response": "False", "Error": "Request limit reached!"}
+
+    fetch_movie_by_id("tt1375666")
+    fetch_movie_by_id("tt1375666")
+    assert mock_get.call_count == 2
+
+# Test failed requests are not cached
+@patch("app.omdb_client.requests.Session.get")
+def test_fetch_movie_error_not_cached(mock_get):
+    mock_get.side_effect = Timeout("Request timed out")
+
+    with pytest.raises(Timeout):
+        fetch_movie_by_id("tt1375666")
+    with pytest.raises(Timeout):
+        fetch_movie_by_id("tt1375666")
+    assert mock_get.call_count == 2
+
+# Test requests go through the shared pooled session
+@patch("app.omdb_client.requests.Session.get")
+def test_requests_use_shared_session(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = MOCK_SEARCH_SUCCESS
+    before = connection_stats()["requests"]
+
+    search_movies("Inception")
+    fetch_movie_by_id("tt1375666")
+
+    assert connection_stats()["requests"] == before + 2
+    assert open_session() is open_session()
+
+# Test concurrent searches with the same normalized title share one request
+@patch("app.omdb_client.requests.Session.get")
+def test_concurrent_searches_are_coalesced(mock_get):
+    import threading
+    import time
+    from app import omdb_client
+    release = threading.Event()
+
+    def slow_get(*args, **kwargs):
+        release.wait(5)
+        response = Mock(status_code=200)
+        response.json.return_value = MOCK_SEARCH_SUCCESS
+        return response
+
+    mock_get.side_effect = slow_get
+    before = omdb_client.coalescing_stats()["coalesced"]
+    results = []
+    threads = [threading.Thread(target=lambda t=t: results.append(search_movies(t)))
+               for t in ["Inception", "inception", " INCEPTION "]]
+    for t in threads:
+        t.start()
+    # Hold the upstream call until both followers have joined it
+    deadline = time.time() + 5
+    while omdb_client.coalescing_stats()["coalesced"] - before < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == [MOCK_SEARCH_SUCCESS["Search"]] * 3
+    mock_get.assert_called_once()
+    assert omdb_client.coalescing_stats()["coalesced"] - before == 2
+
+# Test a refused call never reaches OMDb
+@patch("app.omdb_client.requests.Session.get")
+def test_refused_call_is_not_sent(mock_get):
+    with patch.object(omdb_guard.quota, "limit", 1):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = MOCK_SEARCH_SUCCESS
+        search_movies("Inception")
+
+        with pytest.raises(omdb_guard.QuotaExhausted):
+            search_movies("Heat")
+
+    mock_get.assert_called_once()
+
+# Test timeouts count as failures toward opening the circuit
+@patch("app.omdb_client.requests.Session.get")
+def test_timeouts_open_the_circuit(mock_get):
+    mock_get.side_effect = Timeout("Request timed out")
+    for title in range(omdb_guard.breaker.failure_threshold):
+        with pytest.raises(Timeout):
+            search_movies(f"title {title}")
+
+    with pytest.raises(omdb_guard.CircuitOpen):
+        search_movies("Inception")
+    assert mock_get.call_count == omdb_guard.breaker.failure_threshold
+
+# Test a timed-out lookup is retried and the retry's answer is returned
+@patch("app.omdb_latency.OMDB_RETRIES", 2)
+@patch("app.omdb_latency.OMDB_RETRY_BASE_DELAY", 0)
+@patch("app.omdb_client.requests.Session.get")
+def test_timeout_is_retried(mock_get):
+    ok = Mock(status_code=200)
+    ok.json.return_value = MOCK_SEARCH_SUCCESS
+    mock_get.side_effect = [Timeout("Request timed out"), ok]
+
+    assert search_movies("Inception") == MOCK_SEARCH_SUCCESS["Search"]
+    assert mock_get.call_count == 2
+    assert omdb_latency.stats()["retries"] == 1
+
+# Test 5xx replies are retried until the retries run out, then reported
+@patch("app.omdb_latency.OMDB_RETRIES", 2)
+@patch("app.omdb_latency.OMDB_RETRY_BASE_DELAY", 0)
+@patch("app.omdb_client.requests.Session.get")
+def test_server_errors_are_retried_then_raised(mock_get):
+    mock_get.return_value.status_code = 503
+    mock_get.return_value.raise_for_status.side_effect = HTTPError("503 Server Error")
+
+    with pytest.raises(HTTPError):
+        fetch_movie_by_id("tt1375666")
+    assert mock_get.call_count == 3
+
+# Test client errors are not retried
+@patch("app.omdb_latency.OMDB_RETRIES", 2)
+@patch("app.omdb_client.requests.Session.get")
+def test_client_errors_are_not_retried(mock_get):
+    mock_get.return_value.status_code = 401
+    mock_get.return_value.json.return_value = {"Response": "False", "Error": "Invalid API key!"}
+    mock_get.return_value.raise_for_status.side_effect = HTTPError("401 Client Error")
+
+    with pytest.raises(HTTPError):
+        fetch_movie_by_id("tt1375666")
+    mock_get.assert_called_once()
+
+# Test the timeout follows measured latency and is cut to the request deadline
+@patch("app.omdb_client.requests.Session.get")
+def test_timeout_adapts_and_respects_deadline(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = MOCK_SEARCH_SUCCESS
+    for _ in range(100):
+        omdb_latency.tracker.record(0.5)
+
+    search_movies("Inception")
+    with deadline.budget(0.2):
+        search_movies("Heat")
+
+    first, second = (call.kwargs["timeout"] for call in mock_get.call_args_list)
+    assert first == pytest.approx(0.5 * omdb_latency.OMDB_TIMEOUT_MULTIPLIER)
+    assert second <= 0.2
+
+# Test nothing is sent once the request deadline has passed
+@patch("app.omdb_client.requests.Session.get")
+def test_no_call_after_deadline(mock_get):
+    with deadline.budget(0.001):
+        time.sleep(0.002)
+        with pytest.raises(Timeout):
+            search_movies("Inception")
+    mock_get.assert_not_called()
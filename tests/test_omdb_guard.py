@@ -0,0 +1,281 @@
+# Unit tests for omdb_guard.py, using fake clocks instead of sleeping
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app import metrics, omdb_guard
+from app.omdb_guard import CircuitBreaker, DailyQuota, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def response(status_code, body=None):
+    mock = MagicMock(status_code=status_code)
+    mock.json.return_value = body or {}
+    return mock
+
+
+# Test the bucket serves a burst, then queues callers behind each other, then refuses
+def test_token_bucket_burst_then_wait():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=2, clock=clock)
+
+    assert bucket.reserve(max_wait=0.5) == 0
+    assert bucket.reserve(max_wait=0.5) == 0
+    assert bucket.reserve(max_wait=0.5) == pytest.approx(0.1)
+    assert bucket.reserve(max_wait=0.5) == pytest.approx(0.2)
+    clock.now += 0.2
+    assert bucket.reserve(max_wait=0.05) is None
+    assert bucket.snapshot()["rejections"] == 1
+    assert bucket.reserve(max_wait=0.5) == pytest.approx(0.1)
+
+# Test tokens refill up to the burst size and no further
+def test_token_bucket_refills_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=3, clock=clock)
+    for _ in range(3):
+        bucket.reserve(max_wait=0)
+
+    clock.now += 60
+
+    assert [bucket.reserve(max_wait=0) for _ in range(4)] == [0, 0, 0, None]
+
+# Test a rate of 0 turns the limit off
+def test_token_bucket_disabled():
+    bucket = TokenBucket(rate=0, capacity=1)
+
+    assert all(bucket.reserve(max_wait=0) == 0 for _ in range(100))
+
+
+# Test the quota refuses calls past the limit and starts over the next UTC day
+def test_daily_quota_in_memory():
+    quota = DailyQuota(limit=2)
+    today = datetime(2024, 5, 1, 23, 59, tzinfo=timezone.utc)
+    tomorrow = datetime(2024, 5, 2, 0, 1, tzinfo=timezone.utc)
+
+    assert quota.consume(today) and quota.consume(today)
+    assert not quota.consume(today)
+    assert quota.used(today) == 2
+    assert quota.consume(tomorrow)
+    assert quota.snapshot()["rejections"] == 1
+
+# Test two processes sharing the quota file draw on one count, which survives a restart
+def test_daily_quota_shared_through_file(tmp_path):
+    path = str(tmp_path / "quota" / "omdb_quota.sqlite3")
+    first, second = DailyQuota(limit=3, path=path), DailyQuota(limit=3, path=path)
+
+    assert first.consume() and second.consume() and first.consume()
+    assert not second.consume()
+    assert DailyQuota(limit=3, path=path).remaining() == 0
+
+# Test the quota file is only created once the quota is used, not when the app is imported
+def test_daily_quota_file_is_created_lazily(tmp_path):
+    path = tmp_path / "quota" / "omdb_quota.sqlite3"
+    quota = DailyQuota(limit=3, path=str(path))
+
+    assert not path.parent.exists()
+    quota.consume()
+    assert path.exists()
+    assert DailyQuota(limit=3, path=str(path)).used() == 1
+
+# Test importing the app, with the default cache and quota paths, creates no files
+def test_importing_the_app_creates_no_files(tmp_path):
+    env = {name: value for name, value in os.environ.items() if name not in ("OMDB_CACHE_PATH", "OMDB_QUOTA_PATH")}
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["DB_CONNECTION_STRING"] = "sqlite://"
+
+    subprocess.run([sys.executable, "-W", "ignore", "-c", "import app.main"], cwd=tmp_path, env=env, check=True)
+
+    assert list(tmp_path.iterdir()) == []
+
+# Test OMDb's own "limit reached" reply uses the rest of the day's quota
+def test_daily_quota_exhaust(tmp_path):
+    quota = DailyQuota(limit=100, path=str(tmp_path / "omdb_quota.sqlite3"))
+    quota.consume()
+
+    quota.exhaust()
+
+    assert quota.remaining() == 0
+    assert not quota.consume()
+
+# Test an unusable quota file falls back to counting in memory
+def test_daily_quota_unwritable_path_counts_in_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+
+    quota = DailyQuota(limit=1, path=str(blocker / "omdb_quota.sqlite3"))
+
+    assert quota.consume()
+    assert not quota.consume()
+
+# Test a limit of 0 turns the quota off
+def test_daily_quota_disabled():
+    quota = DailyQuota(limit=0)
+
+    assert all(quota.consume() for _ in range(10))
+    assert quota.remaining() is None
+
+
+# Test the breaker opens after consecutive failures and fails fast until the timeout
+def test_circuit_breaker_opens_after_failures():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.allow()
+        breaker.record_failure()
+
+    with pytest.raises(omdb_guard.CircuitOpen) as excinfo:
+        breaker.allow()
+
+    assert excinfo.value.retry_after == pytest.approx(30)
+    assert breaker.snapshot()["state"] == "open"
+    assert breaker.snapshot()["times_opened"] == 1
+
+# Test a half-open breaker lets one trial call through and closes when it succeeds
+def test_circuit_breaker_half_open_trial_success():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+
+    assert breaker.snapshot()["state"] == "half_open"
+    breaker.allow()
+    with pytest.raises(omdb_guard.CircuitOpen):
+        breaker.allow()
+    breaker.record_success()
+
+    assert breaker.snapshot()["state"] == "closed"
+    breaker.allow()
+
+# Test a failed trial call reopens the breaker for another full timeout
+def test_circuit_breaker_half_open_trial_failure():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 31
+    breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.snapshot()["state"] == "open"
+    clock.now += 29
+    with pytest.raises(omdb_guard.CircuitOpen):
+        breaker.allow()
+
+# Test a trial call refused by a later limit gives its slot back
+def test_circuit_breaker_release():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.allow()
+
+    breaker.release()
+
+    breaker.allow()
+
+
+# Test admit refuses with the right reason and counts it in the metrics
+def test_admit_refusals_by_reason():
+    before = metrics.omdb_rejections.value("quota_exhausted")
+    with patch.object(omdb_guard, "quota", DailyQuota(limit=1)):
+        omdb_guard.admit()
+        with pytest.raises(omdb_guard.QuotaExhausted) as excinfo:
+            omdb_guard.admit()
+
+    assert excinfo.value.reason == "quota_exhausted"
+    assert 0 < excinfo.value.retry_after <= 86400
+    assert metrics.omdb_rejections.value("quota_exhausted") == before + 1
+
+# Test a call refused by the rate limit spends nothing from the daily quota
+def test_admit_rate_limited_before_quota():
+    with patch.object(omdb_guard, "bucket", TokenBucket(rate=1, capacity=1, clock=FakeClock())), \
+         patch.object(omdb_guard, "quota", DailyQuota(limit=10)) as quota, \
+         patch("app.omdb_guard.config.OMDB_RATE_MAX_WAIT", 0):
+        omdb_guard.admit()
+        with pytest.raises(omdb_guard.RateLimited):
+            omdb_guard.admit()
+
+        assert quota.used() == 1
+
+# Test an open circuit refuses calls before they take a token or quota
+def test_admit_circuit_open_first():
+    for _ in range(omdb_guard.breaker.failure_threshold):
+        omdb_guard.record_failure()
+
+    with pytest.raises(omdb_guard.CircuitOpen):
+        omdb_guard.admit()
+
+    assert omdb_guard.quota.used() == 0
+
+# Test responses feed the breaker and the quota
+def test_record_response():
+    for _ in range(omdb_guard.breaker.failure_threshold - 1):
+        omdb_guard.record_response(response(503))
+    omdb_guard.record_response(response(200))
+    omdb_guard.record_response(response(429))
+
+    assert omdb_guard.breaker.snapshot()["consecutive_failures"] == 1
+
+    omdb_guard.record_response(response(401, {"Response": "False", "Error": omdb_guard.QUOTA_ERROR}))
+
+    assert omdb_guard.quota.remaining() == 0
+    assert omdb_guard.breaker.snapshot()["state"] == "closed"
+
+# Test the stats cover the breaker, the rate limit and the quota
+def test_stats():
+    stats = omdb_guard.stats()
+
+    assert stats["circuit"]["state"] == "closed"
+    assert stats["rate_limit"]["rate"] == omdb_guard.bucket.rate
+    assert stats["quota"]["used"] == 0
+
+# Test the async admit keeps the quota's file I/O off the event loop
+def test_admit_async_does_not_block_the_loop():
+    ticks = []
+
+    def slow_consume(now=None):
+        time.sleep(0.2)
+        return True
+
+    async def ticker():
+        for _ in range(10):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(omdb_guard.admit_async(), ticker())
+
+    with patch.object(omdb_guard.quota, "consume", slow_consume):
+        asyncio.run(main())
+
+    assert len(ticks) == 10
+    assert ticks[-1] - ticks[0] < 0.2
+
+# Test the async admit refuses once the quota is used up
+def test_admit_async_quota_exhausted():
+    with patch.object(omdb_guard, "quota", DailyQuota(limit=1)):
+        asyncio.run(omdb_guard.admit_async())
+        with pytest.raises(omdb_guard.QuotaExhausted):
+            asyncio.run(omdb_guard.admit_async())
+
+# Test the async response hook exhausts the quota on OMDb's limit reply
+def test_record_response_async():
+    asyncio.run(omdb_guard.record_response_async(response(401, {"Response": "False", "Error": omdb_guard.QUOTA_ERROR})))
+
+    assert omdb_guard.quota.remaining() == 0
@@ -0,0 +1,167 @@
+# Unit tests for omdb_latency.py: quantiles, adaptive timeouts, backoff and the request deadline
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app import deadline, omdb_guard, omdb_latency
+from app.omdb_latency import LatencyTracker
+
+
+def fill(seconds, count=100):
+    for _ in range(count):
+        omdb_latency.tracker.record(seconds)
+
+
+# Test quantiles are only reported once enough attempts were measured
+def test_tracker_needs_min_samples():
+    tracker = LatencyTracker(window=100, min_samples=5)
+    for n in range(4):
+        tracker.record(n)
+
+    assert tracker.quantile(0.5) is None
+    tracker.record(4)
+    assert tracker.quantile(0.5) == 2
+    assert tracker.quantile(0.99) == 4
+
+# Test old attempts fall out of the window
+def test_tracker_window():
+    tracker = LatencyTracker(window=10, min_samples=1)
+    for _ in range(10):
+        tracker.record(5.0)
+    for _ in range(10):
+        tracker.record(0.1)
+
+    assert len(tracker) == 10
+    assert tracker.quantile(0.99) == 0.1
+
+
+# Test the timeout is the maximum until latency is known, then follows the p99
+def test_adaptive_timeout():
+    assert omdb_latency.adaptive_timeout() == omdb_latency.OMDB_TIMEOUT_MAX
+
+    fill(0.5)
+    assert omdb_latency.adaptive_timeout() == pytest.approx(0.5 * omdb_latency.OMDB_TIMEOUT_MULTIPLIER)
+
+# Test the adaptive timeout stays within its bounds
+def test_adaptive_timeout_is_clamped():
+    fill(0.001)
+    assert omdb_latency.adaptive_timeout() == omdb_latency.OMDB_TIMEOUT_MIN
+
+    omdb_latency.reset()
+    fill(60)
+    assert omdb_latency.adaptive_timeout() == omdb_latency.OMDB_TIMEOUT_MAX
+
+# Test an attempt never outlives the request deadline
+def test_attempt_timeout_capped_by_deadline():
+    with deadline.budget(2):
+        assert 1.9 < omdb_latency.attempt_timeout() <= 2
+    assert omdb_latency.attempt_timeout() == omdb_latency.OMDB_TIMEOUT_MAX
+
+# Test a passed deadline is reported and counted
+def test_deadline_passed():
+    with deadline.budget(0.001):
+        time.sleep(0.002)
+        assert omdb_latency.deadline_passed()
+    assert not omdb_latency.deadline_passed()
+    assert omdb_latency.stats()["deadline_exceeded"] == 1
+
+
+# Test backoff is jittered below an exponentially growing, capped ceiling
+@patch("app.omdb_latency.OMDB_RETRIES", 10)
+@patch("app.omdb_latency.OMDB_RETRY_BASE_DELAY", 0.1)
+@patch("app.omdb_latency.OMDB_RETRY_MAX_DELAY", 0.5)
+def test_retry_delay_full_jitter():
+    with patch("app.omdb_latency.random.uniform", side_effect=lambda low, high: high) as uniform:
+        assert [omdb_latency.retry_delay(n) for n in range(4)] == pytest.approx([0.1, 0.2, 0.4, 0.5])
+    assert all(call.args[0] == 0 for call in uniform.call_args_list)
+
+# Test retries stop once used up, or when the deadline leaves no time for another attempt
+@patch("app.omdb_latency.OMDB_RETRIES", 2)
+def test_retry_delay_limits():
+    assert omdb_latency.retry_delay(1) is not None
+    assert omdb_latency.retry_delay(2) is None
+    with deadline.budget(omdb_latency.OMDB_TIMEOUT_MIN / 2):
+        assert omdb_latency.retry_delay(0) is None
+
+# Test a retryable status is retried and counted, and the last response reported once retries run out
+@patch("app.omdb_latency.OMDB_RETRIES", 1)
+def test_retries_backoff():
+    retries = omdb_latency.Retries()
+    unavailable = MagicMock(status_code=503)
+
+    assert retries.backoff(response=unavailable) is not None
+    assert retries.backoff(response=unavailable) is None
+    assert retries.result() is unavailable
+    assert omdb_latency.call_stats.snapshot()["retries"] == 1
+
+# Test a final response ends the lookup without a retry
+def test_retries_final_response():
+    retries = omdb_latency.Retries()
+    found = MagicMock(status_code=200)
+
+    assert retries.backoff(response=found) is None
+    assert retries.result() is found
+    assert omdb_latency.call_stats.snapshot()["retries"] == 0
+
+# Test a refused first attempt is raised, a refused retry reports how OMDb failed before
+@patch("app.omdb_latency.OMDB_RETRIES", 2)
+def test_retries_refused():
+    refused = omdb_guard.OMDbUnavailable("circuit open", retry_after=1)
+    with pytest.raises(omdb_guard.OMDbUnavailable):
+        omdb_latency.Retries().refused(refused)
+
+    retries = omdb_latency.Retries()
+    assert retries.backoff(error=TimeoutError("slow")) is not None
+    retries.refused(refused)
+    with pytest.raises(TimeoutError):
+        retries.result()
+
+# Test a timed-out attempt counts as a failure and records its timeout as a latency sample
+def test_attempt_failed():
+    attempt = omdb_latency.Attempt()
+    timeout = attempt.start()
+    with patch.object(omdb_latency.tracker, "record") as record:
+        attempt.failed(timed_out=True)
+
+    record.assert_called_once_with(timeout)
+    assert omdb_guard.breaker.failures == 1
+
+# Test a cancelled attempt hands back its breaker slot, and is only measured once sent
+def test_attempt_cancelled():
+    with patch("app.omdb_latency.omdb_guard.release") as release:
+        omdb_latency.Attempt().cancelled()
+        attempt = omdb_latency.Attempt()
+        attempt.start()
+        attempt.cancelled()
+
+    assert release.call_count == 2
+    assert len(omdb_latency.tracker) == 1
+
+# Test hedging waits for the observed p95, and is off until enabled and latency is known
+def test_hedge_delay():
+    fill(0.2, count=95)
+    fill(3.0, count=5)
+
+    assert omdb_latency.hedge_delay() is None
+    with patch("app.omdb_latency.OMDB_HEDGE_ENABLED", True):
+        assert omdb_latency.hedge_delay() == 3.0
+        # No point hedging when the deadline ends before the hedge would be sent
+        with deadline.budget(1):
+            assert omdb_latency.hedge_delay() is None
+
+def test_hedge_delay_needs_samples():
+    with patch("app.omdb_latency.OMDB_HEDGE_ENABLED", True):
+        assert omdb_latency.hedge_delay() is None
+
+
+# Test the stats report the quantiles and the current timeout
+def test_stats():
+    fill(0.5)
+
+    stats = omdb_latency.stats()
+
+    assert stats["samples"] == 100
+    assert stats["p95"] == 0.5
+    assert stats["timeout"] == pytest.approx(0.5 * omdb_latency.OMDB_TIMEOUT_MULTIPLIER)
+    assert stats["retries"] == 0
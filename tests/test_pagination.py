@@ -0,0 +1,22 @@
+# Unit tests for pagination.py
+import pytest
+from datetime import datetime, timezone
+from app.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    date_added = datetime(2024, 1, 1, 12, 30, 5, 123456, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(date_added, 42)) == (date_added, 42)
+
+def test_cursor_round_trip_naive_datetime():
+    date_added = datetime(2024, 1, 1, 12, 30, 5)
+    assert decode_cursor(encode_cursor(date_added, 7)) == (date_added, 7)
+
+def test_cursor_is_url_safe():
+    token = encode_cursor(datetime(2024, 1, 1), 1)
+    assert "=" not in token and "+" not in token and "/" not in token
+
+@pytest.mark.parametrize("token", ["", "not-a-cursor", "W10", "WyJ4IiwxXQ"])
+def test_invalid_cursor_raises_value_error(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
@@ -0,0 +1,145 @@
+# Tests for ranking.py, checked against the sort-based pandas equivalents
+import numpy as np
+import pandas as pd
+import pytest
+from app import ranking
+
+TITLES = ["B", "A", "C", "A", "D", "B", "E", None]
+GENRES = ["x", "y", "x", "x", None, "y", "y", "x"]
+RATINGS = [7.0, 9.0, 8.0, 6.0, 9.5, 8.0, np.nan, 5.0]
+
+
+def random_frame(rows=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    ratings = rng.integers(10, 100, rows) / 10
+    ratings[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        "title": [f"t{n}" for n in rng.integers(0, rows // 3, rows)],
+        "genre": [f"g{n}" for n in rng.integers(0, 20, rows)],
+        "rating": ratings,
+    })
+
+
+def sorted_top(df, k):
+    return df.dropna(subset=["rating"]).sort_values(["rating", "title"], ascending=[False, True]).head(k)
+
+
+class TestTopK:
+    def test_best_first_with_ties_by_key(self):
+        positions = ranking.top_k(RATINGS, 4, ties=TITLES)
+        # 8.0 tie between C (2) and B (5): C sorts after B
+        assert positions.tolist() == [4, 1, 5, 2]
+
+    def test_ties_by_position_without_keys(self):
+        assert ranking.top_k([1.0, 2.0, 2.0, 2.0], 2).tolist() == [1, 2]
+
+    def test_fewer_values_than_k(self):
+        assert ranking.top_k([1.0, np.nan, 3.0], 10).tolist() == [2, 0]
+
+    def test_empty_and_zero(self):
+        assert ranking.top_k([], 3).tolist() == []
+        assert ranking.top_k([1.0], 0).tolist() == []
+
+    def test_matches_sort(self):
+        df = random_frame()
+        positions = ranking.top_k(df["rating"], 50, ties=df["title"])
+        expected = df.reset_index(drop=True).assign(pos=range(len(df)))
+        expected = expected.dropna(subset=["rating"]).sort_values(
+            ["rating", "title", "pos"], ascending=[False, True, True]
+        ).head(50)
+        assert positions.tolist() == expected["pos"].tolist()
+
+
+class TestTopKDistinct:
+    def test_one_row_per_key(self):
+        positions = ranking.top_k_distinct(RATINGS, TITLES, 3, ties=TITLES)
+        assert [TITLES[p] for p in positions] == ["D", "A", "B"]
+        # B at its best (8.0, row 5), not row 0
+        assert positions.tolist() == [4, 1, 5]
+
+    def test_matches_sort_and_drop_duplicates(self):
+        df = random_frame()
+        positions = ranking.top_k_distinct(df["rating"], df["title"], 25, ties=df["title"])
+        expected = sorted_top(df, len(df)).drop_duplicates("title").head(25)
+        assert df["title"].to_numpy()[positions].tolist() == expected["title"].tolist()
+        assert df["rating"].to_numpy()[positions].tolist() == expected["rating"].tolist()
+
+    def test_categorical_keys(self):
+        titles = pd.Categorical(TITLES)
+        assert ranking.top_k_distinct(RATINGS, titles, 3, ties=titles).tolist() == [4, 1, 5]
+
+
+class TestTopKByGroup:
+    def test_per_group(self):
+        result = ranking.top_k_by_group(RATINGS, GENRES, 2, ties=TITLES)
+        assert set(result) == {"x", "y"}
+        assert result["x"].tolist() == [2, 0]
+        assert result["y"].tolist() == [1, 5]
+
+    def test_distinct_per_group_matches_pandas(self):
+        df = random_frame()
+        result = ranking.top_k_by_group(df["rating"], df["genre"], 5, keys=df["title"], ties=df["title"])
+        # A title can make the list of every genre it appears in
+        best = sorted_top(df, len(df)).drop_duplicates(["genre", "title"])
+        assert sorted(result) == sorted(best["genre"].unique())
+        for genre, positions in result.items():
+            expected = best[best["genre"] == genre].head(5)
+            assert df["title"].to_numpy()[positions].tolist() == expected["title"].tolist()
+
+
+class TestFirstRows:
+    def test_first_occurrences(self):
+        assert ranking.first_rows(TITLES).tolist() == [True, True, True, False, True, False, True, False]
+
+    def test_matches_drop_duplicates(self):
+        df = random_frame()
+        mask = ranking.first_rows(df["title"])
+        assert df[mask].index.tolist() == df.drop_duplicates("title").index.tolist()
+
+    def test_empty(self):
+        assert ranking.first_rows(np.array([], dtype=object)).tolist() == []
+
+
+class TestGroupAggregate:
+    def test_totals(self):
+        stats = ranking.group_aggregate(GENRES, RATINGS)
+        assert stats.groups.tolist() == ["x", "y"]
+        assert stats.rows.tolist() == [4, 3]
+        assert stats.count.tolist() == [4, 2]
+        assert stats.sum.tolist() == [26.0, 17.0]
+        assert stats.mean.tolist() == [6.5, 8.5]
+
+    def test_shared_dedup_mask(self):
+        stats = ranking.group_aggregate(GENRES, RATINGS, mask=ranking.first_rows(TITLES))
+        # Rows 3 (A again) and 5 (B again) are dropped, as is the untitled row 7
+        assert stats.rows.tolist() == [2, 2]
+        assert stats.mean.tolist() == [7.5, 9.0]
+
+    def test_group_without_values(self):
+        stats = ranking.group_aggregate(["a", "b"], [np.nan, 1.0])
+        assert stats.count.tolist() == [0, 1]
+        assert np.isnan(stats.mean[0])
+
+    def test_matches_groupby(self):
+        df = random_frame()
+        unique = df.drop_duplicates("title")
+        frame = ranking.group_aggregate(df["genre"], df["rating"], mask=ranking.first_rows(df["title"])).to_frame()
+        expected = unique.groupby("genre")["rating"].agg(["size", "count", "sum", "mean"])
+        frame = frame.sort_index()
+        assert frame["rows"].tolist() == expected["size"].tolist()
+        assert frame["count"].tolist() == expected["count"].tolist()
+        assert frame["mean"].to_numpy() == pytest.approx(expected["mean"].to_numpy())
+
+
+class TestMostFrequent:
+    @pytest.mark.parametrize("values, expected", [
+        (["b", "a", "b", "a", None], "a"),
+        (["c", "b", "c"], "c"),
+        ([None, None], None),
+        ([], None),
+    ])
+    def test_like_mode(self, values, expected):
+        assert ranking.most_frequent(values) == expected
+        series = pd.Series(values, dtype=object)
+        mode = series.mode()
+        assert (mode[0] if len(mode) else None) == expected
@@ -0,0 +1,142 @@
+# Tests for refresher.py: OMDb is mocked, the catalog is a real SQLite in-memory database
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import update
+
+from app import aggregates, crud, omdb_guard, refresher
+from app.models import Movie
+
+
+USER = "alice"
+NOW = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def refresher_sessions(session_factory):
+    # The refresher opens its own sessions through app.database
+    refresher.stats.reset()
+    with patch("app.database.SessionLocal", session_factory):
+        yield
+
+
+
+
+def movie_data(imdb_id, rating="7.0", plot="Plot"):
+    return {"imdbID": imdb_id, "Title": f"Movie {imdb_id}", "Year": "2020", "Genre": "Drama", "imdbRating": rating, "Plot": plot}
+
+
+def save(db, *imdb_ids, refreshed_at=None):
+    for imdb_id in imdb_ids:
+        crud.add_movie(db, USER, movie_data(imdb_id))
+    db.execute(update(Movie).values(last_refreshed_at=refreshed_at))
+    db.commit()
+
+
+def omdb(payloads):
+    async def refetch(imdb_id):
+        payload = payloads[imdb_id]
+        if isinstance(payload, Exception):
+            raise payload
+        return payload
+    return patch("app.refresher.async_omdb_client.refetch_movie_by_id", AsyncMock(side_effect=refetch))
+
+
+def test_refresh_batch_writes_changes_back(db):
+    save(db, "tt1", "tt2")
+
+    with omdb({"tt1": movie_data("tt1", rating="9.0"), "tt2": movie_data("tt2")}):
+        result = asyncio.run(refresher.refresh_batch(NOW))
+
+    assert result == {"refreshed": 2, "changed": 1, "errors": 0}
+    db.expire_all()
+    assert crud.get_catalog_movie(db, "tt1").rating == 9.0
+    assert aggregates.verify(db, USER) == {}
+    assert refresher.refresh_stats()["changed"] == 1
+
+
+def test_failed_lookups_are_retried_once_their_claim_runs_out(db):
+    save(db, "tt1", "tt2")
+
+    with omdb({"tt1": RuntimeError("upstream down"), "tt2": None}) as refetch:
+        assert asyncio.run(refresher.refresh_batch(NOW)) == {"refreshed": 1, "changed": 0, "errors": 1}
+        # Still claimed by the first batch
+        assert asyncio.run(refresher.refresh_batch(NOW))["refreshed"] == 0
+        asyncio.run(refresher.refresh_batch(NOW + timedelta(seconds=refresher.REFRESH_INTERVAL + 1)))
+
+    # tt2 was not found and counts as refreshed; tt1 is tried again
+    assert [call.args[0] for call in refetch.call_args_list] == ["tt1", "tt2", "tt1"]
+    db.expire_all()
+    assert crud.get_catalog_movie(db, "tt2").last_refreshed_at is not None
+
+
+def test_overlapping_batches_split_the_due_movies(db):
+    save(db, "tt1", "tt2", "tt3", "tt4")
+    fetched, second = [], []
+
+    async def refetch(imdb_id):
+        fetched.append(imdb_id)
+        if imdb_id == "tt1":
+            # Another refresher runs its batch while this one waits on OMDb
+            second.append(await refresher.refresh_batch(NOW))
+        return None
+
+    with patch("app.refresher.REFRESH_BATCH_SIZE", 2), \
+            patch("app.refresher.async_omdb_client.refetch_movie_by_id", AsyncMock(side_effect=refetch)):
+        first = asyncio.run(refresher.refresh_batch(NOW))
+
+    assert first["refreshed"] == 2 and second[0]["refreshed"] == 2
+    assert sorted(fetched) == ["tt1", "tt2", "tt3", "tt4"]
+
+
+def test_only_movies_past_max_age_are_due(db):
+    save(db, "tt1", refreshed_at=NOW - timedelta(seconds=refresher.REFRESH_MAX_AGE - 60))
+
+    with omdb({}) as refetch:
+        assert asyncio.run(refresher.refresh_batch(NOW)) == {"refreshed": 0, "changed": 0, "errors": 0}
+    refetch.assert_not_called()
+
+
+def test_batches_are_capped(db):
+    save(db, "tt1", "tt2", "tt3")
+
+    with patch("app.refresher.REFRESH_BATCH_SIZE", 2), omdb({f"tt{n}": None for n in range(1, 4)}) as refetch:
+        asyncio.run(refresher.refresh_batch(NOW))
+    assert refetch.call_count == 2
+
+
+def test_quota_reserve_is_left_for_requests(db):
+    save(db, "tt1", "tt2", "tt3")
+    quota = omdb_guard.DailyQuota(limit=refresher.REFRESH_QUOTA_RESERVE + 1)
+
+    with patch.object(omdb_guard, "quota", quota), omdb({f"tt{n}": None for n in range(1, 4)}) as refetch:
+        asyncio.run(refresher.refresh_batch(NOW))
+        quota.consume()
+        assert asyncio.run(refresher.refresh_batch(NOW)) == {"refreshed": 0, "changed": 0, "errors": 0}
+    assert refetch.call_count == 1
+
+
+def test_loop_survives_failed_batches():
+    batches = AsyncMock(side_effect=[RuntimeError("db down"), {}, asyncio.CancelledError()])
+
+    with patch("app.refresher.refresh_batch", batches), patch("app.refresher.REFRESH_INTERVAL", 0):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(refresher.run_forever())
+    assert batches.call_count == 3
+
+
+def test_start_and_stop():
+    async def lifecycle():
+        with patch("app.refresher.refresh_batch", AsyncMock(return_value={})):
+            task = refresher.start()
+            assert refresher.start() is task
+            await asyncio.sleep(0)
+            assert refresher.refresh_stats()["running"] is True
+            await refresher.stop()
+            return task
+
+    task = asyncio.run(lifecycle())
+    assert task.cancelled()
+    assert refresher.refresh_stats()["running"] is False
@@ -0,0 +1,91 @@
+# Tests for search.py against a real SQLite in-memory database (FTS5)
+from unittest.mock import patch
+from datetime import datetime
+from sqlalchemy import text
+from app import crud, search
+
+USER = "alice"
+
+def movie_data(imdb_id, title, plot=None):
+    return {"imdbID": imdb_id, "Title": title, "Year": "2010", "Plot": plot}
+
+def titles(movies):
+    return [movie.title for movie in movies]
+
+
+def test_search_matches_title_and_plot(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Inception", "A thief steals secrets through dreams"))
+    crud.add_movie(db, USER, movie_data("tt2", "The Matrix", "A hacker learns the truth about reality"))
+
+    assert titles(search.search_movies(db, USER, "inception", 10)) == ["Inception"]
+    assert titles(search.search_movies(db, USER, "hacker reality", 10)) == ["The Matrix"]
+    assert search.search_movies(db, USER, "hacker dreams", 10) == []
+
+def test_search_stems_words(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Inception", "A thief steals secrets through dreams"))
+    assert titles(search.search_movies(db, USER, "dreaming steal", 10)) == ["Inception"]
+
+def test_search_ranks_title_matches_first(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Heat", "A dream crew of robbers"))
+    crud.add_movie(db, USER, movie_data("tt2", "Dream Scenario", "A professor appears in strangers' sleep"))
+
+    assert titles(search.search_movies(db, USER, "dream", 10)) == ["Dream Scenario", "Heat"]
+    assert titles(search.search_movies(db, USER, "dream", 1)) == ["Dream Scenario"]
+
+def test_search_ignores_query_syntax(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Inception"))
+    assert search.search_movies(db, USER, 'inception OR "', 10) == []
+    assert search.search_movies(db, USER, "   ", 10) == []
+
+def test_bulk_add_indexes_movies(db):
+    crud.add_movies(db, USER, [movie_data("tt1", "Inception"), movie_data("tt2", "Interstellar")])
+    assert titles(search.search_movies(db, USER, "interstellar", 10)) == ["Interstellar"]
+
+def test_deleted_movie_is_not_found(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Inception", "dreams"))
+    crud.delete_movie(db, USER, "tt1")
+
+    assert search.search_movies(db, USER, "inception", 10) == []
+    assert db.execute(text("INSERT INTO movies_fts (movies_fts) VALUES ('integrity-check')")) is not None
+
+def test_search_is_per_user(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Inception", "dreams"))
+    crud.add_movie(db, "bob", movie_data("tt1", "Inception", "dreams"))
+    crud.add_movie(db, "bob", movie_data("tt2", "Dream Scenario"))
+
+    assert [(m.user_id, m.imdb_id) for m in search.search_movies(db, USER, "dream", 10)] == [(USER, "tt1")]
+    assert sorted(m.imdb_id for m in search.search_movies(db, "bob", "dream", 10)) == ["tt1", "tt2"]
+    assert search.search_movies(db, "carol", "dream", 10) == []
+
+def test_rebuild_indexes_existing_rows(db):
+    db.execute(text("INSERT INTO movies (id, imdb_id, title) VALUES (1, 'tt1', 'Inception')"))
+    db.execute(text("INSERT INTO watchlist_entries (user_id, movie_id, watched) VALUES (:user, 1, 0)"), {"user": USER})
+    db.commit()
+    assert search.search_movies(db, USER, "inception", 10) == []
+
+    search.rebuild(db)
+
+    assert titles(search.search_movies(db, USER, "inception", 10)) == ["Inception"]
+
+def test_refreshed_plot_is_reindexed(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Inception", "A thief steals secrets"))
+    movie_id = crud.get_catalog_movie(db, "tt1").id
+
+    crud.refresh_movies(db, {movie_id: movie_data("tt1", "Inception", "A heist inside dreams")}, datetime(2030, 1, 1))
+
+    assert search.search_movies(db, USER, "thief", 10) == []
+    assert titles(search.search_movies(db, USER, "heist", 10)) == ["Inception"]
+    db.execute(text("INSERT INTO movies_fts (movies_fts) VALUES ('integrity-check')"))
+
+# Test other dialects fall back to a substring match of every word, title matches first
+def test_search_without_full_text_index(db):
+    crud.add_movie(db, USER, movie_data("tt1", "Heat", "A dream crew of robbers"))
+    crud.add_movie(db, USER, movie_data("tt2", "Dream Scenario", "A professor appears in strangers' sleep"))
+    crud.add_movie(db, USER, movie_data("tt3", "100% Wolf", "A dog walker"))
+
+    with patch.object(db.get_bind().dialect, "name", "mssql"):
+        assert titles(search.search_movies(db, USER, "DREAM", 10)) == ["Dream Scenario", "Heat"]
+        assert titles(search.search_movies(db, USER, "dream robbers", 10)) == ["Heat"]
+        assert titles(search.search_movies(db, USER, "100%", 10)) == ["100% Wolf"]
+        assert titles(search.search_movies(db, USER, "%", 10)) == ["100% Wolf"]
+        assert search.search_movies(db, USER, "g_w", 10) == []
@@ -0,0 +1,84 @@
+# Tests for serialization.py: the fast list encodings must match the response_model bytes
+from datetime import datetime, timezone, timedelta
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.database import get_db
+from app.main import app
+from app import crud, serialization, config
+
+@pytest.fixture
+def client(session_factory):
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_db)
+
+def seed(db, count=25):
+    user_id = config.DEFAULT_USER_ID
+    crud.add_movies(db, user_id, [{
+        "imdbID": f"tt{i:07d}",
+        "Title": f"Amélie \"{i}\" </script> ",
+        "Year": "2001",
+        "Genre": "Drama, Romance" if i % 2 else None,
+        "imdbRating": f"{i % 10}.{i % 7}" if i % 3 else "N/A",
+        "Plot": "line\nbreak" if i % 4 else None,
+        "Poster": "N/A",
+    } for i in range(count)])
+    for i in range(0, count, 5):
+        crud.update_watched_status(db, user_id, f"tt{i:07d}", True)
+    # Another user's entries for the same movies must not show up
+    crud.add_movies(db, "bob", [entry.movie for entry in crud.get_all_movies(db, user_id)[::3]])
+
+def fetch(client, mode, **params):
+    with patch("app.main.config.WATCHLIST_SERIALIZATION", mode):
+        return client.get("/api/v1/movies/", params=params)
+
+
+@pytest.mark.parametrize("mode", ["validated", "trusted"])
+@pytest.mark.parametrize("params", [{}, {"watched": "true"}, {"genre": "drama"}, {"limit": "7"}])
+def test_fast_path_bytes_match_response_model(client, db, mode, params):
+    seed(db)
+    expected = fetch(client, "off", **params)
+    actual = fetch(client, mode, **params)
+
+    assert actual.status_code == expected.status_code == 200
+    assert actual.content == expected.content
+    assert actual.headers["content-type"] == expected.headers["content-type"]
+    assert actual.headers.get("X-Next-Cursor") == expected.headers.get("X-Next-Cursor")
+    assert actual.headers["ETag"] == expected.headers["ETag"]
+
+@pytest.mark.parametrize("mode", ["validated", "trusted"])
+def test_fast_path_pages_through_with_cursor(client, db, mode):
+    seed(db)
+    cursor = fetch(client, "off", limit="10").headers["X-Next-Cursor"]
+    expected = fetch(client, "off", limit="10", cursor=cursor)
+    actual = fetch(client, mode, limit="10", cursor=cursor)
+    assert actual.content == expected.content
+
+def test_encodes_aware_datetimes_like_pydantic():
+    row = ("tt1", "T", "2001", None, 8.8, None, None, False)
+    for tz in (timezone.utc, timezone(timedelta(hours=5, minutes=30))):
+        rows = [row + (datetime(2024, 1, 2, 3, 4, 5, 678, tzinfo=tz),)]
+        assert serialization.encode_movie_rows(rows, "trusted") == serialization.encode_movie_rows(rows, "validated")
+
+def test_trusted_falls_back_without_orjson():
+    rows = [("tt1", "T", "2001", None, None, None, None, True, None, 1)]
+    with patch("app.serialization.orjson", None):
+        assert serialization.encode_movie_rows(rows, "trusted") == (
+            b'[{"imdb_id":"tt1","title":"T","year":"2001","genre":null,"rating":null,'
+            b'"plot":null,"poster_url":null,"watched":true,"date_added":null}]'
+        )
+
+# Test a row with NULL in a required field fails in trusted mode too, rather than being sent as null
+@pytest.mark.parametrize("mode", ["off", "validated", "trusted"])
+def test_invalid_rows_fail_in_every_mode(mode):
+    rows = [("tt1", None, "2001", None, None, None, None, True, None)]
+    with pytest.raises(ValueError):
+        serialization.encode_movie_rows(rows, mode)
@@ -0,0 +1,169 @@
+# Unit tests for singleflight.py
+import asyncio
+import threading
+import time
+import pytest
+from app import deadline
+from app.singleflight import SingleFlight, AsyncSingleFlight
+
+
+def test_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+    assert flight.stats() == {"calls": 2, "executions": 2, "coalesced": 0}
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+    release = threading.Event()
+
+    def slow():
+        executions.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    # Wait until every follower has joined the in-flight call
+    deadline = time.time() + 5
+    while flight.stats()["calls"] < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == ["result"] * 10
+    assert len(executions) == 1
+    assert flight.stats()["coalesced"] == 9
+
+def test_concurrent_callers_share_the_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while flight.stats()["calls"] < 5 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(errors) == 5
+    assert flight.stats()["executions"] == 1
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: "a") == "a"
+    assert flight.do("b", lambda: "b") == "b"
+    assert flight.stats()["executions"] == 2
+
+def test_async_concurrent_calls_share_one_execution():
+    flight = AsyncSingleFlight()
+    executions = []
+
+    async def slow():
+        executions.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", slow) for _ in range(10)))
+
+    assert asyncio.run(main()) == ["result"] * 10
+    assert len(executions) == 1
+    assert flight.stats() == {"calls": 10, "executions": 1, "coalesced": 9}
+
+def test_async_concurrent_callers_share_the_error():
+    flight = AsyncSingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats()["executions"] == 1
+
+def test_async_leader_cancellation_does_not_cancel_followers():
+    flight = AsyncSingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "result"
+
+def test_async_shared_call_runs_under_the_latest_deadline():
+    flight = AsyncSingleFlight()
+    seen = []
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        seen.append(deadline.remaining())
+        return "result"
+
+    async def call(seconds):
+        with deadline.budget(seconds):
+            return await flight.do("k", slow)
+
+    async def main():
+        short = asyncio.ensure_future(call(0.01))
+        await asyncio.sleep(0)
+        long = asyncio.ensure_future(call(5))
+        return await asyncio.gather(short, long, return_exceptions=True)
+
+    short, long = asyncio.run(main())
+    # The short caller gives up at its own deadline; the call itself is not cut short
+    assert isinstance(short, asyncio.TimeoutError)
+    assert long == "result"
+    assert seen[0] > 4
+
+def test_async_caller_without_deadline_lifts_it():
+    flight = AsyncSingleFlight()
+    seen = []
+
+    async def slow():
+        await asyncio.sleep(0.01)
+        seen.append(deadline.remaining())
+        return "result"
+
+    async def main():
+        async def with_deadline():
+            with deadline.budget(1):
+                return await flight.do("k", slow)
+        leader = asyncio.ensure_future(with_deadline())
+        await asyncio.sleep(0)
+        return await asyncio.gather(leader, flight.do("k", slow))
+
+    assert asyncio.run(main()) == ["result", "result"]
+    assert seen == [None]